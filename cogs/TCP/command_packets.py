@@ -0,0 +1,45 @@
+"""
+    Length prefixed frames for the commands the manager sends to game servers and the cow master.
+
+    The fixed commands (shutdown, wake, sleep) are framed once at import. Variable commands (chat messages, console commands, cow master forks)
+    are framed into a single bytes object, so each command is sent with one write instead of a write for the length and another for the body.
+    A frame can be sent to many connections at once with broadcast(), which encodes nothing per connection.
+"""
+import asyncio
+from cogs.handlers.events import GameServerCommands
+
+def frame(payload):
+    """ Prefix a packet payload with its 2 byte little endian length. """
+    return len(payload).to_bytes(2, byteorder='little') + payload
+
+SHUTDOWN_FRAME = frame(GameServerCommands.SHUTDOWN_BYTES.value)
+RESTART_FRAME = frame(GameServerCommands.RESTART_BYTES.value)
+SLEEP_FRAME = frame(GameServerCommands.SLEEP_BYTES.value)
+WAKE_FRAME = frame(GameServerCommands.WAKE_BYTES.value)
+
+def _string_frame(prefix, text):
+    if isinstance(text, list): text = (' ').join(text)
+    body = text.encode('ascii')
+    length = len(prefix) + len(body) + 1
+    return b''.join((length.to_bytes(2, byteorder='little'), prefix, body, b'\x00'))
+
+def message_frame(message):
+    """ A chat message shown to everyone on the server. message may be a string, or a list of words. """
+    return _string_frame(GameServerCommands.MESSAGE_BYTES.value, message)
+
+def console_command_frame(command):
+    """ A console command run by the server. command may be a string, or a list of words. """
+    return _string_frame(GameServerCommands.COMMAND_BYTES.value, command)
+
+def cowmaster_fork_frame(instance_number, port):
+    """ Asks the cow master to fork a game server with the given instance number and game port. """
+    return frame(b'\x28' + instance_number.to_bytes(1, "little") + port.to_bytes(2, "little") + b'\x00')
+
+async def broadcast(client_connections, command_frame):
+    """
+    Send the same frame to many connections concurrently.
+
+    Returns:
+        list: one bool per connection, whether the frame was written.
+    """
+    return await asyncio.gather(*[client_connection.send_frame(command_frame) for client_connection in client_connections])
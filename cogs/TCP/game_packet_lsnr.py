@@ -1,16 +1,193 @@
 import traceback
 import asyncio
 import inspect
+from collections import deque
 from cogs.TCP.packet_parser import GameManagerParser
+from cogs.TCP.command_packets import frame
 from cogs.handlers.events import stop_event
 from cogs.misc.logger import get_logger
 
 LOGGER = get_logger()
 
+# packets are prefixed with a 2 byte length, so a frame is at most 2 + 65535 bytes
+MAX_FRAME_SIZE = 2 + 0xFFFF
+RECEIVE_BUFFER_SIZE = 2 * MAX_FRAME_SIZE
+# stop reading from the socket while this many framed packets are waiting to be handled
+MAX_PENDING_PACKETS = 1000
+# packets handled by a connection before it yields to the others. Superseded status packets within a batch are skipped by the parser.
+MAX_BATCH_PACKETS = 64
+
+class GameServerProtocol(asyncio.BufferedProtocol):
+    """
+        Receives packets from one game server (or the cow master) connection.
+
+        The socket is read straight into one fixed receive buffer, and every complete packet in it is framed on each read, so a burst of
+        packets costs one wakeup instead of two readexactly() calls and two wait_for() timers per packet. Framed packets queue up until
+        the connection's read loop collects them with read_packets().
+
+        The connection times out after idle_timeout seconds without any data. This is one timer per connection, which only looks at when
+        data was last received and re-arms itself, rather than a timer per read.
+    """
+    def __init__(self, game_server_manager, idle_timeout=30):
+        self.game_server_manager = game_server_manager
+        self.idle_timeout = idle_timeout
+        self.transport = None
+        self.client_connection = None
+        self.task = None
+        self._loop = asyncio.get_running_loop()
+        self._buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._packets = deque()
+        self._waiter = None
+        self._exception = None
+        self._reading_paused = False
+        self._last_activity = 0
+        self._idle_timer = None
+        self._write_paused = False
+        self._drain_waiters = []
+        self._closed = self._loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._last_activity = self._loop.time()
+        self._idle_timer = self._loop.call_later(self.idle_timeout, self._check_idle)
+        self.client_connection = ClientConnection(self, transport.get_extra_info("peername"), self.game_server_manager)
+        self.task = asyncio.create_task(handle_clients(self.client_connection, self.game_server_manager))
+
+    def get_buffer(self, sizehint):
+        if len(self._buffer) - self._end < MAX_FRAME_SIZE:
+            # move the incomplete packet at the end of the buffer back to the start
+            pending = self._end - self._start
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        self._end += nbytes
+        self._last_activity = self._loop.time()
+
+        buffer = self._buffer
+        start, end = self._start, self._end
+        while end - start >= 2:
+            length = buffer[start] | buffer[start + 1] << 8
+            if end - start - 2 < length:
+                break
+            self._packets.append((length, bytes(buffer[start + 2:start + 2 + length])))
+            start += 2 + length
+        if start == end:
+            start = end = 0
+        self._start, self._end = start, end
+
+        if len(self._packets) >= MAX_PENDING_PACKETS and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+        self._wakeup()
+
+    def eof_received(self):
+        self._set_exception(asyncio.IncompleteReadError(bytes(self._buffer[self._start:self._end]), None))
+        return False    # close the transport
+
+    def connection_lost(self, exc):
+        if self._idle_timer:
+            self._idle_timer.cancel()
+        self._set_exception(exc if exc else asyncio.IncompleteReadError(bytes(self._buffer[self._start:self._end]), None))
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_exception(ConnectionResetError("Connection lost"))
+        self._drain_waiters.clear()
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    def pause_writing(self):
+        self._write_paused = True
+
+    def resume_writing(self):
+        self._write_paused = False
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._drain_waiters.clear()
+
+    def _check_idle(self):
+        remaining = self._last_activity + self.idle_timeout - self._loop.time()
+        if remaining > 0:
+            self._idle_timer = self._loop.call_later(remaining, self._check_idle)
+            return
+        self._idle_timer = None
+        self._set_exception(asyncio.TimeoutError())
+
+    def _set_exception(self, exc):
+        if self._exception is None:
+            self._exception = exc
+        self._wakeup()
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _wait_for_packets(self):
+        while not self._packets:
+            if self._exception is not None:
+                raise self._exception
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        if self._reading_paused:
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    async def read_packets(self, limit=None):
+        """ Wait for at least one packet, and return the packets received so far (up to limit) as a list of (length, data). """
+        await self._wait_for_packets()
+        if limit is None or len(self._packets) <= limit:
+            packets = list(self._packets)
+            self._packets.clear()
+        else:
+            packets = [self._packets.popleft() for _ in range(limit)]
+        return packets
+
+    async def read_packet(self):
+        """ Wait for and return the next packet as (length, data). """
+        await self._wait_for_packets()
+        return self._packets.popleft()
+
+    # StreamWriter compatible methods, so commands can be written to client_connection.writer
+
+    def write(self, data):
+        self.transport.write(data)
+
+    async def drain(self):
+        if self.transport.is_closing():
+            # let the event loop call connection_lost()
+            await asyncio.sleep(0)
+        if self._closed.done():
+            raise ConnectionResetError("Connection lost")
+        if not self._write_paused:
+            return
+        waiter = self._loop.create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    def is_closing(self):
+        return self.transport.is_closing()
+
+    def close(self):
+        self.transport.close()
+
+    async def wait_closed(self):
+        await self._closed
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
 class ClientConnection:
-    def __init__(self, reader, writer, addr, game_server_manager):
-        self.reader = reader
-        self.writer = writer
+    def __init__(self, protocol, addr, game_server_manager):
+        self.protocol = protocol
+        self.writer = protocol
         self.addr = addr
         self.game_server = None
         self.cowmaster = None
@@ -26,40 +203,21 @@ class ClientConnection:
         else:
             self.id = cowmaster.id
 
-    async def receive_packet(self, timeout=30):
-        try:
-            # Try to read up to 2 bytes for the length field
-            length_bytes = await asyncio.wait_for(self.reader.readexactly(2), timeout)
+    async def receive_packet(self):
+        """ Wait for the next packet, returned as (length, data). """
+        return await self.protocol.read_packet()
 
-            # If we didn't receive exactly 2 bytes, return None
-            if len(length_bytes) != 2:
-                LOGGER.warn(f"Client #{self.id} Incomplete packet length: {length_bytes} received.")
-                return None
-
-            # Otherwise, proceed to read the rest of the packet
-            length = int.from_bytes(length_bytes, byteorder='little')
-            # Wait for the next `length` bytes to get the packet data
-            data = await asyncio.wait_for(self.reader.readexactly(length), timeout)
-
-            packet = (length, data)
-            return packet
-
-        except ValueError as e:
-            LOGGER.error(f"Client #{self.id} An error occurred while handling the {inspect.currentframe().f_code.co_name} function: {traceback.format_exc()}")
-            return None
+    async def receive_packets(self, limit=MAX_BATCH_PACKETS):
+        """ Wait for the next packets, returning those that have been received (up to limit) as a list of (length, data). """
+        return await self.protocol.read_packets(limit)
 
     async def run(self, game_server=None, cowmaster=None, timeout=60):
         self.game_server = game_server
         self.cowmaster = cowmaster
+        self.protocol.idle_timeout = timeout
         while not stop_event.is_set():
             try:
-                packet = await self.receive_packet(timeout=timeout)
-
-                if packet is None:
-                    # Handle the case where the packet is incomplete
-                    LOGGER.warn(f"Client #{self.id} Incomplete packet: {packet}. Closing connection..")
-                    await self.close() # if packet is None (indicating an incomplete packet), log a warning, close the connection, and then return from the function
-                    return
+                packets = await self.receive_packets()
 
             except ConnectionResetError as e:
                 LOGGER.error(f"Client #{self.id} Connection reset. The GameServer has disconnected from the Manager.")
@@ -89,12 +247,12 @@ class ClientConnection:
                 break # exit the loop and continue to the post loop actions (clear game state, close connection, etc)
             
             if self.game_server:
-                await self.game_server.game_manager_parser.handle_packet(packet,game_server=self.game_server)
+                await self.game_server.game_manager_parser.handle_packets(packets,game_server=self.game_server)
             else:
-                await self.cowmaster.game_manager_parser.handle_packet(packet,cowmaster=self.cowmaster)
+                await self.cowmaster.game_manager_parser.handle_packets(packets,cowmaster=self.cowmaster)
 
-            # Add a small delay to allow other clients to send packets
-            await asyncio.sleep(0.001)
+            # let other connections run between batches, even if this server keeps sending
+            await asyncio.sleep(0)
         
         if self.game_server:
             self.game_server.reset_game_state() # clear the game server state object to indicate we've lost comms from this server.
@@ -104,17 +262,19 @@ class ClientConnection:
         await self.close()
 
     async def send_packet(self, packet, send_len=False):
+        data = bytes(packet)
+        return await self.send_frame(frame(data) if send_len else data)
+
+    async def send_frame(self, data):
+        """ Write an already framed packet (see cogs/TCP/command_packets.py) in a single write. Returns whether it was sent. """
         try:
             if not self.writer.is_closing():
-                data = bytes(packet)
-                if send_len:
-                    length = len(data)
-                    length_bytes = length.to_bytes(2, byteorder='little')
-                    self.writer.write(length_bytes)
                 self.writer.write(data)
                 await self.writer.drain()
+                return True
         except Exception as e:
             LOGGER.exception(f"Client #{self.id} An error occurred while sending a packet: {traceback.format_exc()}")
+        return False
 
     async def close(self):
         if not self.closed:
@@ -132,27 +292,23 @@ class ClientConnection:
         except Exception as e:
             LOGGER.exception(f"Client #{self.id} An error occurred while handling the {inspect.currentframe().f_code.co_name} function: {traceback.format_exc()}")
 
-async def handle_client_connection(client_reader, client_writer, game_server_manager):
+async def handle_client_connection(client_connection, game_server_manager):
     # Get the client address
-    client_addr = client_writer.get_extra_info("peername")
+    client_addr = client_connection.addr
 
     LOGGER.debug(f"Client connected from {client_addr[0]}:{client_addr[1]}")
 
-    # Create a new ClientConnection object to handle this client
-    client_connection = ClientConnection(client_reader, client_writer, client_addr, game_server_manager)
-
     try:
         # Wait for the server hello packet
-        packets = await client_connection.receive_packet()
+        try:
+            packets = await client_connection.receive_packet()
+        except (asyncio.TimeoutError, asyncio.exceptions.IncompleteReadError, ConnectionResetError):
+            LOGGER.warn(f"No server hello received from {client_addr[0]}:{client_addr[1]}")
+            return
 
         cowmaster = None
         game_server = None
 
-        if packets is None:
-            # Handle the case where the packet is incomplete
-            LOGGER.warn(f"Incomplete packet received from {client_addr[0]}:{client_addr[1]}")
-            return
-
         if packets[1][0] != 0x40:
             LOGGER.info(f"Waiting for server hello from {client_addr[0]}:{client_addr[1]}...")
             return
@@ -198,8 +354,8 @@ async def handle_client_connection(client_reader, client_writer, game_server_man
         await game_server_manager.remove_client_connection(client_connection)
         await client_connection.close()
 
-async def handle_clients(client_reader, client_writer, game_server_manager):
+async def handle_clients(client_connection, game_server_manager):
      try:
-         await handle_client_connection(client_reader, client_writer, game_server_manager)
+         await handle_client_connection(client_connection, game_server_manager)
      except Exception as e:
-         LOGGER.exception(f"An error occurred in the task for client {client_writer.get_extra_info('peername')}: {e}")
+         LOGGER.exception(f"An error occurred in the task for client {client_connection.addr}: {e}")
@@ -4,6 +4,78 @@ import re
 import asyncio
 import struct
 import datetime
+from collections import namedtuple
+
+# 0x42 server status packet layout. The first 54 bytes are fixed, the player section follows.
+STATUS_FIXED_LEN = 54
+STATUS_NUM_PLAYERS_OFFSET = 53
+STATUS_UPTIME = struct.Struct('<I')
+STATUS_UPTIME_OFFSET = 2
+STATUS_HEADER = struct.Struct('<BBIIBB')    # msg_type, status, uptime, server load, num_clients, match_started
+PLAYER_ACCOUNT_ID = struct.Struct('<I')
+PLAYER_PINGS = struct.Struct('<HHH')        # minping, avgping, maxping
+IP_PATTERN = re.compile(rb'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+
+PlayerStatus = namedtuple('PlayerStatus', ['account_id', 'name', 'location', 'ip', 'minping', 'avgping', 'maxping'])
+
+def decode_status_players(packet):
+    """
+    Decode the player section of a 0x42 server status packet.
+
+    Each player record is laid out as:
+        int 4   account_id
+        string  ip
+        string  name
+        string  location
+        int 2   minping
+        int 2   avgping
+        int 2   maxping
+
+    The section is walked once, using the num_players byte, with offsets into the original packet so no tail copies are made.
+    If the records don't line up with the expected layout, falls back to scanning for IP addresses.
+    """
+    num_players = packet[STATUS_NUM_PLAYERS_OFFSET]
+    cursor = STATUS_FIXED_LEN
+    players = []
+    try:
+        for _ in range(num_players):
+            account_id, = PLAYER_ACCOUNT_ID.unpack_from(packet, cursor)
+            cursor += 4
+            ip_end = packet.index(b'\x00', cursor)
+            ip = packet[cursor:ip_end].decode('utf-8')
+            if ip.count('.') != 3:
+                raise ValueError(f"Unexpected player ip field: {ip}")
+            name_end = packet.index(b'\x00', ip_end + 1)
+            name = packet[ip_end + 1:name_end].decode('utf-8')
+            location_end = packet.index(b'\x00', name_end + 1)
+            location = packet[name_end + 1:location_end].decode('utf-8')
+            minping, avgping, maxping = PLAYER_PINGS.unpack_from(packet, location_end + 1)
+            cursor = location_end + 1 + PLAYER_PINGS.size
+            players.append(PlayerStatus(account_id, name, location, ip, minping, avgping, maxping))
+    except (ValueError, struct.error, UnicodeDecodeError):
+        return decode_status_players_by_scan(packet)
+    return players
+
+def decode_status_players_by_scan(packet):
+    """
+    Decode the player section of a 0x42 server status packet by searching for IP addresses, and reading the fields around them.
+    Slower than decode_status_players, but tolerant of unexpected data between player records.
+    """
+    players = []
+    for ip_match in IP_PATTERN.finditer(packet, STATUS_FIXED_LEN):
+        cursor = ip_match.start()
+        account_id, = PLAYER_ACCOUNT_ID.unpack_from(packet, cursor - 4)
+
+        ip_end = packet.find(b'\x00', cursor)
+        ip = packet[cursor:ip_end].decode('utf-8')
+        name_end = packet.find(b'\x00', ip_end + 1)
+        name = packet[ip_end + 1:name_end].decode('utf-8')
+        location_end = packet.find(b'\x00', name_end + 1)
+        location = packet[name_end + 1:location_end].decode('utf-8')
+        minping, avgping, maxping = PLAYER_PINGS.unpack_from(packet, location_end + 1)
+
+        players.append(PlayerStatus(account_id, name, location, ip, minping, avgping, maxping))
+    return players
 
 def read_int(data, offset):
     val = int.from_bytes(data[offset:offset+4], byteorder='little')
@@ -36,6 +108,16 @@ class GameManagerParser:
             0x4A: self.replay_update
         }
         self.id = client_id
+        # last seen 0x42 payload sections, used to skip re-parsing status packets which haven't changed
+        self._last_status_header = None
+        self._last_status_players = None
+        self.status_packet_counters = {
+            'header_processed': 0,
+            'header_skipped': 0,
+            'players_processed': 0,
+            'players_skipped': 0,
+            'collapsed': 0
+        }
     
     def publish_event(self, topic, data):
         if self.mqtt:
@@ -50,6 +132,14 @@ class GameManagerParser:
     def update_client_id(self, new_id):
         self.id = new_id
 
+    def reset_status_cache(self):
+        """
+        Forget the last seen 0x42 payload, so the next status packet is parsed in full.
+        This must be called whenever the game state is cleared, otherwise an unchanged packet would leave the state empty.
+        """
+        self._last_status_header = None
+        self._last_status_players = None
+
     async def handle_packet(self, packet, game_server=None, cowmaster=None):
         packet_len, packet_data = packet
         packet_type = packet_data[0]
@@ -66,6 +156,21 @@ class GameManagerParser:
         except Exception as e:
             self.log("exception",f"GameServer #{self.id} - An error occurred while handling the {inspect.currentframe().f_code.co_name} function: {traceback.format_exc()} with this packet type: {hex(packet_type)}")
 
+    async def handle_packets(self, packets, game_server=None, cowmaster=None):
+        """
+        Handle a batch of packets received together, in the order they arrived.
+
+        Only the newest state in a status packet matters, so a 0x42 packet directly followed by another 0x42 packet is superseded and skipped.
+        Every other packet (server closed, long frame, lobby created / closed, replay updates, etc) is always handled, and a status packet
+        before one of them is never skipped, so the handlers see the same state they would have without batching.
+        """
+        last = len(packets) - 1
+        for i, packet in enumerate(packets):
+            if i < last and packet[1][:1] == b'\x42' and packets[i + 1][1][:1] == b'\x42':
+                self.status_packet_counters['collapsed'] += 1
+                continue
+            await self.handle_packet(packet, game_server=game_server, cowmaster=cowmaster)
+
     async def server_announce_preflight(packet):
         """ 0x40  Server announce
         int 0 - msg type
@@ -135,72 +240,50 @@ class GameManagerParser:
                 With Players, first 54 bytes remains as fixed values, so treat them first. Additional data is tacked on the end as the clients. See code below for parsing
         """
 
-        # Parse fixed-length fields
-        temp = ({
-            'status': packet[1],                                        # extract status field from packet
-            'uptime': int.from_bytes(packet[2:6], byteorder='little'),  # extract uptime field from packet
-            'cpu_core_util': int.from_bytes(packet[6:10], byteorder='little') / 100,   # extract the server load value
-            'num_clients': packet[10],                                  # extract number of clients field from packet
-            'match_started': packet[11],                                # extract match started field from packet
-            'game_phase': packet[40],                                   # extract game phase field from packet
-        })
-        if game_server:
-            game_server.game_state.update(temp)
-        if cowmaster:
-            cowmaster.game_state.update(temp)
+        game_state = game_server.game_state if game_server else cowmaster.game_state if cowmaster else None
+
+        # Everything in the fixed section except uptime. Uptime changes in every packet, so it is updated on its own.
+        header = packet[:STATUS_UPTIME_OFFSET] + packet[STATUS_UPTIME_OFFSET + STATUS_UPTIME.size:STATUS_FIXED_LEN]
+        players = packet[STATUS_FIXED_LEN:]
+
+        if header == self._last_status_header:
+            self.status_packet_counters['header_skipped'] += 1
+            if game_state:
+                game_state._state['uptime'], = STATUS_UPTIME.unpack_from(packet, STATUS_UPTIME_OFFSET)
+                game_state.touch()
+        else:
+            self.status_packet_counters['header_processed'] += 1
+            self._last_status_header = header
+
+            # Parse fixed-length fields
+            _, status, uptime, server_load, num_clients, match_started = STATUS_HEADER.unpack_from(packet)
+            temp = ({
+                'status': status,                                           # extract status field from packet
+                'uptime': uptime,                                           # extract uptime field from packet
+                'cpu_core_util': server_load / 100,                         # extract the server load value
+                'num_clients': num_clients,                                 # extract number of clients field from packet
+                'match_started': match_started,                             # extract match started field from packet
+                'game_phase': packet[40],                                   # extract game phase field from packet
+            })
+            if game_state:
+                game_state.update(temp)
+
+        if players == self._last_status_players:
+            self.status_packet_counters['players_skipped'] += 1
+            return
+        self.status_packet_counters['players_processed'] += 1
+        self._last_status_players = players
 
         # If the packet only contains fixed-length fields, print the game info and return
-        if len(packet) == 54:
+        if len(packet) == STATUS_FIXED_LEN:
             if game_server:
                 if game_server.game_state._state['num_clients'] == 0 and game_server.game_state._state['players'] != '':
                     game_server.game_state.update({'players':[]})
             return
 
-        # Otherwise, extract player data sections from the packet
-        data = packet[53:]                                              # slice the packet to get player data section
-        ip_pattern = re.compile(rb'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')    # define regex pattern for matching IP addresses
-
-        cursor = 1
-        num_players = data[0]
-
-        clients = []
-        for idx, ip_match in enumerate(ip_pattern.finditer(data)):
-            # Extract IP address, username, account ID, and location from the player data section
-            cursor, ip_end = ip_match.span()
+        # Otherwise, walk the player data section of the packet
+        clients = [player._asdict() for player in decode_status_players(packet)]
 
-            account_id = int.from_bytes(data[cursor-4:cursor], byteorder='little')
-            
-            # Extract IP address
-            ip_end = data[cursor:].find(b'\x00') + cursor
-            ip = data[cursor:ip_end].decode('utf-8')
-            cursor = ip_end + 1
-            
-            # Extract name
-            name_end = data[cursor:].find(b'\x00') + cursor
-            name = data[cursor:name_end].decode('utf-8')
-            cursor = name_end + 1
-            
-            # Extract possible location
-            location_end = data[cursor:].find(b'\x00') + cursor
-            location = data[cursor:location_end].decode('utf-8')
-            cursor = location_end + 1
-            
-            # Extract shorts for statistics
-            minping = int.from_bytes(data[cursor:cursor+2], byteorder='little')
-            avgping = int.from_bytes(data[cursor+2:cursor+4], byteorder='little')
-            maxping = int.from_bytes(data[cursor+4:cursor+6], byteorder='little')
-            cursor += 6  # Move cursor ahead by 6 bytes (3 shorts)
-
-            # Append extracted data to the clients list as a dictionary
-            clients.append({
-                'account_id': account_id,
-                'name': name,
-                'location': location,
-                'ip': ip,
-                'minping': minping,
-                'avgping': avgping,
-                'maxping': maxping
-            })
         # Update game dictionary with player information and print
         if game_server:
             game_server.game_state.update({'players':clients})
@@ -11,14 +11,21 @@ import math
 from fastapi import FastAPI, Request, Response, Body, HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 import httpx
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from typing import Any, Dict
 import uvicorn
 import asyncio
-from cogs.misc.logger import get_logger, get_misc, get_home, get_setup, get_filebeat_auth_url
+from cogs.misc.logger import get_logger, get_misc, get_home, get_setup, get_filebeat_auth_url, get_mqtt
 from cogs.handlers.events import stop_event
+from cogs.handlers.scheduler import scheduler
+from cogs.game.patch_orchestrator import patch_progress
+from cogs.connectors.masterserver_connector import master_server_stats
 from cogs.db.roles_db_connector import RolesDatabase
+from cogs.db.match_db_connector import match_database
 from cogs.game.match_parser import MatchParser
+from cogs.misc.log_reader import LogFileReader, LogLineFilter
+from cogs.handlers.log_stream import log_broadcaster
+from cogs.handlers.status_feed import instance_status_feed
 from typing import Any, Dict, List, Tuple
 import logging
 from os.path import exists
@@ -27,7 +34,6 @@ from pydantic import BaseModel
 from datetime import datetime, timedelta
 import traceback
 from utilities.filebeat import filebeat_status
-import aiofiles
 import aiohttp
 import ssl
 
@@ -38,6 +44,7 @@ MISC = get_misc()
 SETUP = get_setup()
 
 roles_database = RolesDatabase()
+server_log_reader = LogFileReader(HOME_PATH / "logs" / "server.log")
 
 CACHE_EXPIRY = timedelta(minutes=20)  # Change to desired cache expiry time
 user_info_cache = {}
@@ -150,9 +157,8 @@ async def ping():
 @app.get("/api/public/get_server_info", description="Returns basic server information.")
 async def public_serverinfo():
     response = {}
-    for game_server in game_servers.values():
-        full_info = game_server.get_pretty_status_for_webui()
-        response[game_server.config.get_local_by_key('svr_name')] = {
+    for name, full_info in instance_status_feed.snapshot().items():
+        response[name] = {
             "id" : full_info.get("ID"),
             "status" : full_info.get("Status"),
             "region" : full_info.get("Region"),
@@ -179,10 +185,10 @@ def get_skipped_frame_data(port: str):
     if port != "all":
         game_server = game_servers.get(int(port),None)
         if game_server is None: return
-        temp = game_server.get_dict_value("skipped_frames_detailed")
+        temp = game_server.skipped_frames.to_dict()
     else:
         for game_server in game_servers.values():
-            temp[game_server.config.get_local_by_key('svr_name')] = game_server.get_dict_value("skipped_frames_detailed")
+            temp[game_server.config.get_local_by_key('svr_name')] = game_server.skipped_frames.to_dict()
     json_content = json.dumps(temp, indent=2)
     return Response(content=json_content, media_type="application/json")
 
@@ -321,6 +327,36 @@ def get_tasks_status(token_and_user_info: dict = Depends(check_permission_factor
 
     return {"tasks_status": temp}
 
+@app.get("/api/get_scheduled_jobs", summary="Get the status of periodic jobs")
+def get_scheduled_jobs(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    """
+    Get the periodic jobs run by the scheduler (heartbeats, health checks, task cleanup).
+
+    Returns:
+        A JSON response keyed by job name, with the interval, next run time, run / failure counts, and the duration of the last and longest runs.
+    """
+    return scheduler.get_jobs_status()
+
+@app.get("/api/get_patch_status", summary="Get the progress of HoN server patching")
+def get_patch_status(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    """
+    Get the phase of the current, or last, patch (shutting_down, waiting_for_servers, checking_version, downloading, extracting, patching, verifying, complete or failed).
+
+    Returns:
+        A JSON response with the phase, what triggered the patch, launcher download progress, and the time each phase was entered.
+    """
+    return patch_progress.to_dict()
+
+@app.get("/api/get_master_server_stats", summary="Get latency histograms of requests to the master server")
+def get_master_server_stats(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    """
+    Get request statistics for each master server endpoint (replay_auth, sm_upload_request, replay_upload, get_spectator_header, resubmit_stats, compare_upstream_patch).
+
+    Returns:
+        A JSON response keyed by endpoint, with request, retry and error counts, response status counts, mean and max latency, and a latency histogram in milliseconds.
+    """
+    return master_server_stats.to_dict()
+
 class CurrentGithubBranch(BaseModel):
     branch: str
 @app.get("/api/get_current_github_branch", response_model=CurrentGithubBranch)
@@ -430,15 +466,15 @@ def get_num_matches_ingame(token_and_user_info: dict = Depends(check_permission_
     return {"num_matches_ingame": num}
 
 @app.get("/api/get_skipped_frame_data/{port}")
-def get_skipped_frame_data(port: str, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+def get_skipped_frame_data(port: str, per_minute: bool = False, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
     temp = {}
     if port != "all":
         game_server = game_servers.get(int(port),None)
         if game_server is None: return
-        temp = game_server.get_dict_value("skipped_frames_detailed")
+        temp = game_server.skipped_frames.per_minute() if per_minute else game_server.skipped_frames.to_dict()
     else:
         for game_server in game_servers.values():
-            temp[game_server.config.get_local_by_key('svr_name')] = game_server.get_dict_value("skipped_frames_detailed")
+            temp[game_server.config.get_local_by_key('svr_name')] = game_server.skipped_frames.per_minute() if per_minute else game_server.skipped_frames.to_dict()
     json_content = json.dumps(temp, indent=2)
     return Response(content=json_content, media_type="application/json")
 
@@ -474,14 +510,15 @@ class SkippedFramesResponse(BaseModel):
     server_data: Dict[str, Any]
 
 @app.get("/api/get_skipped_frame_data", response_model=SkippedFramesResponse, summary="Get skipped frame data")
-def get_skipped_frame_data(port: str, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+def get_skipped_frame_data(port: str, per_minute: bool = False, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
     """
     Get skipped frame data.
 
-    This endpoint returns detailed information about skipped frames for each game server.
+    This endpoint returns the skipped frame history of the last day for each game server.
 
     Args:
         port (str): The port number of the game server to get skipped frame data for, or "all" to get skipped frame data for all game servers.
+        per_minute (bool): Return per minute aggregates rather than every raw skipped frame event. Much smaller for a lagging server.
 
     Returns:
         A JSON response with the following schema:
@@ -490,27 +527,86 @@ def get_skipped_frame_data(port: str, token_and_user_info: dict = Depends(check_
         {
             "server_data": {
                 "<server_name>": {
-                    "<player_id>": {
-                        "skipped_frames": list[int],
-                        "time_skipped": float
-                    }
+                    "<timestamp>": int
                 }
             }
         }
         ```
 
-        The "server_data" field is a dictionary with keys representing the names of game servers, and values representing dictionaries containing information about each player who skipped frames on that server. Each player dictionary contains a "skipped_frames" field with a list of skipped frame numbers and a "time_skipped" field with the total amount of time the player skipped frames for in seconds.
+        The "server_data" field is a dictionary with keys representing the names of game servers, and values mapping the unix timestamp of each skipped frame event to the msec skipped.
+        With per_minute, the values are instead keyed by the unix timestamp of the start of each minute, and contain {"count": int, "skipped_frames": int, "max_skipped_frames": int},
+        the number of skipped frame events in that minute, the total msec skipped, and the longest skip.
     """
     temp = {}
     if port != "all":
         game_server = game_servers.get(int(port),None)
         if game_server is None: return
-        temp = game_server.get_dict_value("skipped_frames_detailed")
+        temp = game_server.skipped_frames.per_minute() if per_minute else game_server.skipped_frames.to_dict()
     else:
         for game_server in game_servers.values():
-            temp[game_server.config.get_local_by_key('svr_name')] = game_server.get_dict_value("skipped_frames_detailed")
+            temp[game_server.config.get_local_by_key('svr_name')] = game_server.skipped_frames.per_minute() if per_minute else game_server.skipped_frames.to_dict()
     return {"server_data": temp}
 
+@app.get("/api/get_status_packet_stats", summary="Get status packet processing counters")
+def get_status_packet_stats(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    """
+    Get counters of 0x42 status packets which were parsed, versus skipped because they were unchanged from the previous packet.
+
+    The fixed header (excluding uptime) and the player section are compared separately, so each has its own counters.
+    'collapsed' counts status packets which were never parsed, because a newer status packet arrived in the same batch.
+
+    Returns:
+        A JSON response with the fleet totals, and the counters for each game server.
+    """
+    totals = {}
+    temp = {}
+    for game_server in game_servers.values():
+        counters = game_server.game_manager_parser.status_packet_counters
+        temp[game_server.config.get_local_by_key('svr_name')] = counters
+        for key, value in counters.items():
+            totals[key] = totals.get(key, 0) + value
+    return {"totals": totals, "game_servers": temp}
+
+@app.get("/api/get_mqtt_publish_stats", summary="Get MQTT publish queue counters")
+def get_mqtt_publish_stats(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    """
+    Get counters for the MQTT publish queue: messages queued, published, failed, and dropped because the queue was full.
+
+    Returns:
+        A JSON response with the counters, the current and max queue depth and the drop policy. Empty if MQTT is not enabled.
+    """
+    if not get_mqtt():
+        return {}
+    return get_mqtt().get_publish_stats()
+
+@app.get("/api/get_state_dispatch_stats", summary="Get game state change dispatch metrics")
+def get_state_dispatch_stats(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    """
+    Get metrics for the dispatch of game state change sets to their listeners.
+
+    Changes are queued per game server and dispatched once per event loop tick, so the queue depth and the time spent waiting
+    for dispatch show how busy the event loop is.
+
+    Returns:
+        A JSON response with the fleet totals, and the metrics for each game server.
+    """
+    totals = {'change_sets_dispatched': 0, 'changes_dispatched': 0, 'queue_depth': 0, 'max_queue_depth': 0, 'max_dispatch_latency_ms': 0}
+    total_latency = 0
+    temp = {}
+    for game_server in game_servers.values():
+        stats = dict(game_server.game_state.dispatch_stats)
+        stats['avg_dispatch_latency_ms'] = stats['total_dispatch_latency_ms'] / stats['change_sets_dispatched'] if stats['change_sets_dispatched'] else 0
+        temp[game_server.config.get_local_by_key('svr_name')] = stats
+
+        totals['change_sets_dispatched'] += stats['change_sets_dispatched']
+        totals['changes_dispatched'] += stats['changes_dispatched']
+        totals['queue_depth'] += stats['queue_depth']
+        totals['max_queue_depth'] = max(totals['max_queue_depth'], stats['max_queue_depth'])
+        totals['max_dispatch_latency_ms'] = max(totals['max_dispatch_latency_ms'], stats['max_dispatch_latency_ms'])
+        total_latency += stats['total_dispatch_latency_ms']
+    totals['avg_dispatch_latency_ms'] = total_latency / totals['change_sets_dispatched'] if totals['change_sets_dispatched'] else 0
+    return {"totals": totals, "game_servers": temp}
+
 # Define the /api/get_server_config_item endpoint with OpenAPI documentation
 @app.get("/api/get_server_config_item/{key}", summary="Get server config item")
 def get_server_config_item(key: str, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
@@ -547,15 +643,30 @@ def get_server_config(token_and_user_info: dict = Depends(check_permission_facto
 def get_num_reserved_cpus(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
     return MISC.get_num_reserved_cpus()
 
-@app.get("/api/get_honfigurator_log_entries/{num}", description="Returns the specified number of log entries from the honfigurator log file.")
-async def get_honfigurator_log(num: int, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
-    # return the contents of the current log file
-    async with aiofiles.open(HOME_PATH / "logs" / "server.log", 'r') as f:
-        file_content = await f.readlines()
-    
-    # Remove the newlines from each string in the list
-    file_content = [line.strip() for line in file_content]
-    return file_content[-num:][::-1]
+def get_log_line_filter(level, contains):
+    # level may be several, e.g. "WARNING,ERROR"
+    return LogLineFilter(level.split(',') if level else None, contains)
+
+@app.get("/api/get_honfigurator_log_entries/{num}", description="Returns the specified number of log entries from the honfigurator log file, newest first. Optionally only those of the given levels (e.g. WARNING,ERROR) and/or containing some text.")
+def get_honfigurator_log(num: int, level: str = None, contains: str = None, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    if not exists(server_log_reader.path):
+        return JSONResponse(status_code=404, content="Log file not found.")
+    if num <= 0:
+        return []
+    # only the end of the log is read, a block at a time
+    return server_log_reader.tail(num, get_log_line_filter(level, contains))
+
+@app.get("/api/get_honfigurator_log_page", description="Pages through the honfigurator log file using byte offsets as cursors. Without 'after', returns up to 'limit' lines before the 'before' offset (or the end of the log), newest first, with the 'before' cursor of the next older page (null at the start of the log). With 'after', returns the lines from that offset on, oldest first, with the 'after' cursor to poll for newer lines. Optionally filtered by level and text.")
+def get_honfigurator_log_page(before: int = None, after: int = None, limit: int = 100, level: str = None, contains: str = None, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    if not exists(server_log_reader.path):
+        return JSONResponse(status_code=404, content="Log file not found.")
+    limit = max(1, min(limit, 5000))
+    line_filter = get_log_line_filter(level, contains)
+    if after is not None:
+        lines, next_after, size, rotated = server_log_reader.lines_after(max(0, after), limit, line_filter)
+        return {"lines": [{"offset": offset, "line": line} for offset, line in lines], "after": next_after, "size": size, "rotated": rotated}
+    lines, next_before, next_after, size = server_log_reader.lines_before(before, limit, line_filter)
+    return {"lines": [{"offset": offset, "line": line} for offset, line in lines], "before": next_before, "after": next_after, "size": size}
 
 @app.get("/api/get_chat_logs/{match_id}", description="Retrieve a list of chat entries from a given match id")
 def get_chat_logs(match_id: str, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
@@ -563,32 +674,96 @@ def get_chat_logs(match_id: str, token_and_user_info: dict = Depends(check_permi
         match_id = f'M{match_id}'
     log_path = global_config['hon_data']['hon_logs_directory'] / f"{match_id}.log"
 
+    # finished matches are answered from the match database, which keeps them after their logs are cleaned up
+    active_match_ids = {str(game_server.game_state['current_match_id']) for game_server in game_servers.values()}
+    if match_database.index_if_finished(match_id, log_path, active_match_ids):
+        return match_database.get_chat(match_id)
+
     if not exists(log_path):
         return JSONResponse(status_code=404, content="Log file not found.")
     
     match_parser = MatchParser(match_id, log_path)
     return match_parser.parse_chat()
 
-@app.get("/api/get_honfigurator_log_file", description="Returns the HoNfigurator log file completely, for download.")
-async def get_honfigurator_log_file(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
-    async with aiofiles.open(HOME_PATH / "logs" / "server.log", "r") as file:
-        log_file_content = await file.readlines()
-    return log_file_content
+@app.get("/api/search_match_players", description="Find the finished matches a player connected to, by the start of their name or by account id. Newest matches first.")
+def search_match_players(name: str = None, account_id: str = None, limit: int = 100, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    if not name and not account_id:
+        return JSONResponse(status_code=400, content="Provide a player name or account id.")
+    return match_database.find_player_matches(name=name, account_id=account_id, limit=max(1, min(limit, 1000)))
+
+@app.get("/api/stream_honfigurator_log", description="Streams the honfigurator log records as they're logged, as server-sent events. Each event's data is a JSON object with the record's id, time, level and line. Optionally only records of the given levels (e.g. WARNING,ERROR) and/or containing some text.")
+async def stream_honfigurator_log(request: Request, level: str = None, contains: str = None, buffer: int = 1000, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    subscriber = log_broadcaster.subscribe(get_log_line_filter(level, contains), max(1, buffer))
+    if subscriber is None:
+        return JSONResponse(status_code=503, content="Too many log stream clients, try again later.")
+
+    async def events():
+        try:
+            while not stop_event.is_set():
+                try:
+                    entry, dropped = await asyncio.wait_for(subscriber.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # a comment line, so proxies don't close an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                if dropped:
+                    # this client fell behind, and the oldest records in its buffer were dropped
+                    yield f"event: dropped\ndata: {json.dumps({'dropped': dropped})}\n\n"
+                yield f"id: {entry['id']}\ndata: {json.dumps(entry)}\n\n"
+        finally:
+            log_broadcaster.unsubscribe(subscriber)
+
+    LOGGER.debug(f"API Request from: {request.client.host} - Streaming the log, {len(log_broadcaster.subscribers)} clients.")
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/get_honfigurator_log_file", description="Returns the HoNfigurator log file completely, for download. Given a level (e.g. WARNING,ERROR) and/or some text, only the matching lines are streamed.")
+def get_honfigurator_log_file(level: str = None, contains: str = None, token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    if not exists(server_log_reader.path):
+        return JSONResponse(status_code=404, content="Log file not found.")
+    line_filter = get_log_line_filter(level, contains)
+    if line_filter:
+        return StreamingResponse(server_log_reader.stream(line_filter), media_type="text/plain", headers={"Content-Disposition": 'attachment; filename="server.log"'})
+    return FileResponse(server_log_reader.path, media_type="text/plain", filename="server.log")
 
 # Define the /api/get_instances_status endpoint with OpenAPI documentation
 @app.get("/api/get_instances_status", summary="Get instances status")
 #def get_instances(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
-def get_instances(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+async def get_instances(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
     """
     Get the status of all game server instances.
 
     Returns:
         A JSON response with the status of all game server instances.
     """
-    temp = {}
-    for game_server in game_servers.values():
-        temp[game_server.config.get_local_by_key('svr_name')] = game_server.get_pretty_status_for_webui()
-    return temp
+    # statuses are only rendered again when a server's state has changed
+    return instance_status_feed.snapshot()
+
+@app.get("/api/stream_instances_status", summary="Stream instances status")
+async def stream_instances_status(token_and_user_info: dict = Depends(check_permission_factory(required_permission="monitor"))):
+    """
+    Stream the status of all game server instances as server-sent events, instead of polling /api/get_instances_status.
+
+    Returns:
+        A 'snapshot' event with the status of every instance, as /api/get_instances_status returns it, followed by 'diff' events
+        with only the fields of each instance which changed, the whole status of a new instance, or null for a removed one.
+        A client which falls behind is sent a new 'snapshot'.
+    """
+    subscriber = instance_status_feed.subscribe()
+    if subscriber is None:
+        return JSONResponse(status_code=503, content="Too many status stream clients, try again later.")
+
+    async def events():
+        try:
+            yield instance_status_feed.snapshot_message()
+            while not stop_event.is_set():
+                try:
+                    yield await asyncio.wait_for(instance_status_feed.next_message(subscriber), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            instance_status_feed.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 """
 Roles & Perms
@@ -973,6 +1148,8 @@ async def start_api_server(config, game_servers_dict, game_manager_tasks, health
     uvicorn_logger.handlers = LOGGER.handlers.copy()
     uvicorn_logger.setLevel(logging.WARNING)
     uvicorn_logger.propagate = LOGGER.propagate
+    # push the manager's log records to API clients streaming the log
+    log_broadcaster.attach(LOGGER)
 
     LOGGER.highlight(f"[*] HoNfigurator API - Listening on {host}:{port} (PUBLIC)")
 
@@ -1,7 +1,10 @@
 import traceback
+import asyncio
+import random
+import time
 import aiohttp
 from cogs.misc.logger import get_logger, get_misc
-from cogs.misc.exceptions import HoNCompatibilityError
+from cogs.misc.exceptions import HoNCompatibilityError, HoNAuthenticationError, HoNServerConnectionError, HoNStatsRejectedError
 from cogs.handlers.events import stop_event
 import phpserialize
 import aiofiles
@@ -9,9 +12,75 @@ import aiofiles
 LOGGER = get_logger()
 MISC = get_misc()
 
+# timeout (seconds for the whole request), retries after the first attempt, the base delay between retries, doubled for each retry,
+# and whether the request is safe to send twice.
+# Idempotent requests are retried if they time out, fail to connect, lose the connection, or get a status in RETRY_STATUSES.
+# Other requests (uploads and submissions) may already have been acted on in all of those cases except a failure to connect, so that's the only one they are retried for.
+ENDPOINT_POLICIES = {
+    'replay_auth':              {'timeout': 10,  'retries': 2, 'backoff': 1, 'idempotent': True},
+    'sm_upload_request':        {'timeout': 15,  'retries': 2, 'backoff': 1, 'idempotent': False},
+    'replay_upload':            {'timeout': 600, 'retries': 1, 'backoff': 5, 'idempotent': False},
+    'get_spectator_header':     {'timeout': 10,  'retries': 2, 'backoff': 1, 'idempotent': True},
+    'resubmit_stats':           {'timeout': 30,  'retries': 1, 'backoff': 2, 'idempotent': False},
+    'compare_upstream_patch':   {'timeout': 10,  'retries': 1, 'backoff': 2, 'idempotent': True}
+}
+RETRY_STATUSES = (502, 503, 504)
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+class EndpointStats:
+    """ Request latency histogram and outcome counts for one master server endpoint. """
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.statuses = {}
+        self.total_ms = 0
+        self.max_ms = 0
+        self.last_request = None
+
+    def record(self, elapsed_ms, status=None):
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.last_request = time.time()
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), len(LATENCY_BUCKETS_MS))
+        self.buckets[index] += 1
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "mean_ms": round(self.total_ms / self.requests, 1) if self.requests else None,
+            "max_ms": round(self.max_ms, 1),
+            "last_request": self.last_request,
+            "histogram_ms": {f"<={bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)} | {f">{LATENCY_BUCKETS_MS[-1]}": self.buckets[-1]}
+        }
+
+class MasterServerStats:
+    """ Latency histograms for master server requests, for the API. Each attempt of a retried request is recorded separately. """
+    def __init__(self):
+        self.endpoints = {}
+
+    def get(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointStats()
+        return self.endpoints[endpoint]
+
+    def to_dict(self):
+        return {endpoint: stats.to_dict() for endpoint, stats in self.endpoints.items()}
+
+master_server_stats = MasterServerStats()
+
 class MasterServerHandler:
 
-    def __init__(self, master_server="api.kongor.online", patch_server = "api.kongor.online", version="4.10.6.0", architecture="", event_bus=None):
+    def __init__(self, master_server="api.kongor.online", patch_server = "api.kongor.online", version="4.10.6.0", architecture="", event_bus=None, stats=master_server_stats):
         self.manager_event_bus = event_bus
         self.manager_event_bus.subscribe('replay_upload_request', self.get_replay_upload_info)
         self.manager_event_bus.subscribe('replay_upload_start', self.upload_replay_file)
@@ -35,7 +104,9 @@ class MasterServerHandler:
             "Content-Type": "application/x-www-form-urlencoded",
             "Server-Launcher": "HoNfigurator"
         }
-        self.session = aiohttp.ClientSession()
+        # one pooled session for every request, created on first use, so connections to the master server are kept alive and reused
+        self.session = None
+        self.stats = stats
         self.server_id = None
         self.cookie = None
         LOGGER.debug(f"Master server URL: {self.base_url}")
@@ -47,16 +118,54 @@ class MasterServerHandler:
     def set_cookie(self, cookie):
         self.cookie = cookie
 
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=20, keepalive_timeout=60, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def request(self, endpoint, url, data=None, headers=None, method="POST"):
+        """
+        Send a request with the shared session, using the timeout and retry policy of the endpoint, and record its latency.
+
+        Args:
+            endpoint (str): key of ENDPOINT_POLICIES
+            data: request body, or a function returning it, for bodies that can only be sent once (such as an open file).
+
+        Returns:
+            tuple: (response text, status code). If the last attempt raised, the exception is raised.
+        """
+        policy = ENDPOINT_POLICIES[endpoint]
+        stats = self.stats.get(endpoint)
+        timeout = aiohttp.ClientTimeout(total=policy['timeout'])
+        for attempt in range(policy['retries'] + 1):
+            if attempt:
+                stats.retries += 1
+                await asyncio.sleep(policy['backoff'] * 2 ** (attempt - 1) * random.uniform(0.8, 1.2))
+            start = time.perf_counter()
+            try:
+                async with self.get_session().request(method, url, data=data() if callable(data) else data, headers=headers or self.headers, timeout=timeout) as response:
+                    text = await response.text()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                stats.record((time.perf_counter() - start) * 1000)
+                if attempt == policy['retries'] or not (policy['idempotent'] or isinstance(e, aiohttp.ClientConnectorError)):
+                    raise
+                LOGGER.warn(f"Master server request {endpoint} failed ({e.__class__.__name__}: {e}). Retrying ({attempt + 1}/{policy['retries']}).")
+                continue
+            stats.record((time.perf_counter() - start) * 1000, status)
+            if status in RETRY_STATUSES and attempt < policy['retries'] and policy['idempotent']:
+                LOGGER.warn(f"Master server request {endpoint} returned {status}. Retrying ({attempt + 1}/{policy['retries']}).")
+                continue
+            return text, status
+
     async def send_replay_auth(self, login, password):
         url = f"{self.base_url}/server_requester.php?f=replay_auth"
         data = {
             "login": login,
             "pass": password
         }
-        timeout = aiohttp.ClientTimeout(total=10)  # 10 seconds timeout for the entire operation
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, data=data, headers=self.headers) as response:
-                return await response.text(), response.status
+        return await self.request('replay_auth', url, data=data)
 
     async def get_replay_upload_info(self, match_id, extension, username, file_size):
         url = f"{self.base_url}/server_requester.php?f=sm_upload_request"
@@ -70,45 +179,65 @@ class MasterServerHandler:
             # "hash_key": '588da37c6689075914fdaea4a9b93b1d919e93b0'
         }
         LOGGER.debug(f"Request data: {data}")
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=data, headers=self.headers) as response:
-                if response.status == 200:
-                    try:
-                        response_text = await response.text()
-                        return phpserialize.loads(response_text.encode('utf-8')), response.status
-                    except Exception:
-                        LOGGER.exception(f"Error parsing PHP serialized response: {traceback.format_exc()}")
-                        return {"error": "Error parsing PHP serialized response", "exception": str(traceback.format_exc())}, response.status
-                else:
-                    LOGGER.error(f"Error fetching upload information: {response.status}")
-                    return {"error": "Error fetching upload information", "status": response.status}, response.status
+        response_text, status = await self.request('sm_upload_request', url, data=data)
+        if status == 200:
+            try:
+                return phpserialize.loads(response_text.encode('utf-8')), status
+            except Exception:
+                LOGGER.exception(f"Error parsing PHP serialized response: {traceback.format_exc()}")
+                return {"error": "Error parsing PHP serialized response", "exception": str(traceback.format_exc())}, status
+        else:
+            LOGGER.error(f"Error fetching upload information: {status}")
+            return {"error": "Error fetching upload information", "status": status}, status
                 
     async def upload_replay_file(self, file_path, file_name, url):
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with aiofiles.open(file_path, 'rb') as replay_file:
-                    file_data = await replay_file.read()
-
-                data = aiohttp.FormData(quote_fields=False)
-                headers = {'User-Agent': self.user_agent}
-                data.add_field('file', file_data, filename=file_name, content_type='application/octet-stream')
-
-                async with session.post(f"http://{url}", data=data, headers=headers) as response:
-                    LOGGER.debug(f"Code: {response.status}, Text: response.text()")
-                    return await response.text(), response.status
-            except IOError:
-                LOGGER.exception(f"Error opening the file: {file_path}")
-                return {"error": "Error opening the file", "exception": str(traceback.format_exc())}, -1
+        """
+        Upload a replay as a multipart form. The file is streamed from disk in 64 KiB chunks (read in a worker thread by aiohttp),
+        rather than read into memory first, so memory use doesn't grow with the size of the replay.
+        """
+        opened_files = []
+        def form_data():
+            # opened again for each attempt, as aiohttp closes the file once it has been sent
+            replay_file = open(file_path, 'rb')
+            opened_files.append(replay_file)
+            data = aiohttp.FormData(quote_fields=False)
+            data.add_field('file', replay_file, filename=file_name, content_type='application/octet-stream')
+            return data
+
+        try:
+            response_text, status = await self.request('replay_upload', f"http://{url}", data=form_data, headers={'User-Agent': self.user_agent})
+            LOGGER.debug(f"Code: {status}, Text: {response_text}")
+            return response_text, status
+        except aiohttp.ClientError:
+            # connection errors are OSErrors too, but aren't a problem with the file
+            raise
+        except IOError:
+            LOGGER.exception(f"Error opening the file: {file_path}")
+            return {"error": "Error opening the file", "exception": str(traceback.format_exc())}, -1
+        finally:
+            # an attempt which failed before sending the file leaves it open
+            for replay_file in opened_files:
+                replay_file.close()
+
     async def get_spectator_header(self):
         url = f"{self.base_url}/server_requester.php"
         data = {
             "f": "get_spectator_header"
         }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=data, headers=self.headers) as response:
-                return await response.text(), response.status
+        return await self.request('get_spectator_header', url, data=data)
     
     async def send_stats_file(self, username, password, match_id, file_path):
+        """
+        Resubmit a match stats file.
+
+        Returns:
+            tuple: (response text, status code)
+
+        Raises:
+            HoNServerConnectionError: If the request got no response from the master server.
+            HoNAuthenticationError: If the server isn't authenticated with the master server yet.
+            HoNStatsRejectedError: If the stats file can't be decoded, so can never be submitted.
+        """
         def generate_resubmission_key(match_id, session_cookie):
             # sha1 = hashlib.sha1()
             # sha1.update(f"{match_id}{session_cookie}".encode('utf-8'))
@@ -117,11 +246,9 @@ class MasterServerHandler:
             return resubmission_key
 
         if not self.cookie:
-            LOGGER.error("Unable to resubmit stats, as there is no stored session cookie. Indicating the server is not authenticated with the master server.")
-            return
+            raise HoNAuthenticationError("Unable to resubmit stats, as there is no stored session cookie. Indicating the server is not authenticated with the master server.")
         elif not self.server_id:
-            LOGGER.error("Unable to resubmit stats, as there is no stored server id. The particular time this error occured, indicates there may have been an issue assigning the server id.")
-            return
+            raise HoNAuthenticationError("Unable to resubmit stats, as there is no stored server id. The particular time this error occured, indicates there may have been an issue assigning the server id.")
 
         url = f"{self.base_url}/stats_requester.php"
 
@@ -135,45 +262,43 @@ class MasterServerHandler:
             'server_id': self.server_id
         }
 
+        # Read the file content as a string with specified encoding
+        if MISC.get_os_platform() == "win32":
+            encoding = 'utf-16-le'
+        elif MISC.get_os_platform() == "linux":
+            encoding = 'ascii'
+        else:
+            raise HoNCompatibilityError(f"OS is reported as {MISC.get_os_platform()} however only 'win32' or 'linux' are supported.")
         try:
-            # Read the file content as a string with specified encoding
-            if MISC.get_os_platform() == "win32":
-                async with aiofiles.open(file_path, 'r', encoding='utf-16-le') as f:
-                    file_content = (await f.read()).lstrip('\ufeff')
-            elif MISC.get_os_platform() == "linux":
-                async with aiofiles.open(file_path, 'r', encoding='ascii') as f:
-                    file_content = (await f.read()).lstrip('\ufeff')
-            else:
-                raise HoNCompatibilityError(f"OS is reported as {MISC.get_os_platform()} however only 'win32' or 'linux' are supported.")
+            async with aiofiles.open(file_path, 'r', encoding=encoding) as f:
+                file_content = (await f.read()).lstrip('\ufeff')
+        except UnicodeError as e:
+            raise HoNStatsRejectedError(f"{file_path} is not valid {encoding}: {e}") from e
 
-            # Manually construct the request payload
-            payload = "f=resubmit_stats"
-            for key, value in params.items():
-                payload += f"&{key}={value}"
-            payload += f"&{file_content}"
+        # The stats file is already form encoded, so it's appended to the parameters as it is
+        payload = '&'.join(["f=resubmit_stats", *(f"{key}={value}" for key, value in params.items()), file_content]).encode('utf-8')
 
-            headers["Content-Length"] = str(len(payload))
+        headers["Content-Length"] = str(len(payload))
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, data=payload) as response:
-                    LOGGER.debug(f"[{response.status}] {match_id} stats resubmission")
-                    return await response.text(), response.status
-        except Exception:
-            print(traceback.format_exc())
+        try:
+            response_text, status = await self.request('resubmit_stats', url, data=payload, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise HoNServerConnectionError(f"No response from the master server to the stats resubmission of {match_id} ({e.__class__.__name__}: {e})") from e
+        LOGGER.debug(f"[{status}] {match_id} stats resubmission")
+        return response_text, status
 
     async def compare_upstream_patch(self):
         url = f"{self.patch_url}/patcher/patcher.php"
         data = {"latest": "", "os": f"{self.architecture}", "arch": self.arch_platform}
-        timeout = aiohttp.ClientTimeout(total=10)  # 10 seconds timeout for the entire operation
         try:
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(url, headers=self.headers, data=data) as response:
-                    if response.status == 200:
-                        return await response.text(), response.status
-                    else:
-                        return None
+            response_text, status = await self.request('compare_upstream_patch', url, data=data)
+            if status == 200:
+                return response_text, status
+            else:
+                return None
         except aiohttp.ClientError:
             LOGGER.exception(f"An error occurred while handling the compare_upstream_patch function: {traceback.format_exc()}")
 
     async def close_session(self):
-        await self.session.close()
+        if self.session:
+            await self.session.close()
@@ -0,0 +1,256 @@
+import sqlite3
+import asyncio
+import time
+import re
+import os
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Optional
+from contextlib import contextmanager
+from cogs.misc.logger import get_home, get_logger
+from cogs.game.match_parser import match_log_followers
+from cogs.handlers.log_index import log_index
+
+HOME_PATH = get_home()
+LOGGER = get_logger()
+DATABASE_PATH = HOME_PATH / "cogs" / "db" / "matches.db"
+
+MATCH_LOG_PATTERN = re.compile(r'^M(\d+)\.log$')
+# a match log untouched for this many seconds, which isn't a game server's current match, is finished
+FINISHED_LOG_AGE = 120
+
+
+def normalise_match_id(match_id) -> str:
+    """ Match ids are stored as digits, whether given as 12345, '12345' or 'M12345'. """
+    return str(match_id).strip().upper().lstrip('M')
+
+
+class MatchDatabase:
+    """
+        On disk index of parsed match logs: the lobby info, the players who connected (name, account id, PSR) and the chat of each match.
+
+        A match is parsed once, when it ends or when its finished log is first seen, instead of every time its chat is asked for.
+        The log's size is stored with it, so a log which grew after it was indexed is parsed again. Matches stay in the index after
+        their logs are cleaned up.
+    """
+    def __init__(self, database_path: str = str(DATABASE_PATH)):
+        self.database_path = database_path
+        self.create_tables()
+
+    @contextmanager
+    def get_conn(self):
+        conn = sqlite3.connect(self.database_path, check_same_thread=False, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def create_tables(self):
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            # readers (the API) aren't blocked while a match is written
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS matches (
+                match_id TEXT PRIMARY KEY,
+                name TEXT,
+                map TEXT,
+                mode TEXT,
+                match_date TEXT,
+                log_size INTEGER NOT NULL,
+                log_modified REAL NOT NULL,
+                indexed_at REAL NOT NULL
+            )
+            """)
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS players (
+                match_id TEXT NOT NULL,
+                player INTEGER NOT NULL,
+                name TEXT NOT NULL COLLATE NOCASE,
+                account_id TEXT,
+                psr REAL,
+                FOREIGN KEY (match_id) REFERENCES matches (match_id),
+                PRIMARY KEY (match_id, player)
+            )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS players_name ON players (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS players_account_id ON players (account_id)")
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat (
+                match_id TEXT NOT NULL,
+                player INTEGER NOT NULL,
+                line INTEGER NOT NULL,
+                target TEXT,
+                message TEXT,
+                FOREIGN KEY (match_id) REFERENCES matches (match_id),
+                PRIMARY KEY (match_id, player, line)
+            )
+            """)
+            conn.commit()
+
+    def index_match(self, match_id, log_path) -> bool:
+        """
+        Parse a match log and store it, replacing anything stored for the match before. Blocking, run it in a worker thread.
+
+        Returns:
+            bool: False if the log doesn't exist.
+        """
+        match_id = normalise_match_id(match_id)
+        # a follower may have read most of the log already, while the match was played
+        follower = match_log_followers.get(log_path)
+        if not follower.update():
+            match_log_followers.release(log_path)
+            return False
+        stat = os.stat(log_path)
+        lobby_info = follower.get_lobby_info()
+        chat_messages, player_details = follower.get_chat()
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM chat WHERE match_id = ?", (match_id,))
+            cursor.execute("DELETE FROM players WHERE match_id = ?", (match_id,))
+            cursor.execute(
+                "INSERT OR REPLACE INTO matches (match_id, name, map, mode, match_date, log_size, log_modified, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (match_id, lobby_info['name'], lobby_info['map'], lobby_info['mode'], follower.match_date, follower.offset, stat.st_mtime, time.time()))
+            cursor.executemany(
+                "INSERT INTO players (match_id, player, name, account_id, psr) VALUES (?, ?, ?, ?, ?)",
+                [(match_id, int(player), details['name'], details['id'], details['psr']) for player, details in player_details.items()])
+            cursor.executemany(
+                "INSERT INTO chat (match_id, player, line, target, message) VALUES (?, ?, ?, ?, ?)",
+                [(match_id, int(player), line, target, message) for player, messages in chat_messages.items() for line, (target, message) in enumerate(messages)])
+            conn.commit()
+
+        # the match is over, so the index answers for it from now on
+        match_log_followers.release(log_path)
+        LOGGER.debug(f"Indexed match {match_id}: {len(player_details)} players, {sum(len(messages) for messages in chat_messages.values())} chat messages.")
+        return True
+
+    def get_indexed_size(self, match_id) -> Optional[int]:
+        """ The size of the log when the match was indexed, or None if it isn't. """
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT log_size FROM matches WHERE match_id = ?", (normalise_match_id(match_id),))
+            row = cursor.fetchone()
+        return row['log_size'] if row else None
+
+    def get_indexed_sizes(self) -> Dict[str, int]:
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT match_id, log_size FROM matches")
+            return {row['match_id']: row['log_size'] for row in cursor.fetchall()}
+
+    def is_finished(self, match_id, log_modified, active_match_ids=()) -> bool:
+        return normalise_match_id(match_id) not in active_match_ids and time.time() - log_modified >= FINISHED_LOG_AGE
+
+    def index_if_finished(self, match_id, log_path, active_match_ids=()) -> bool:
+        """
+        Make sure a finished match is indexed and up to date with its log. Blocking, run it in a worker thread.
+
+        Args:
+            active_match_ids (set): normalised ids of the matches game servers are playing, whose logs are still being written.
+
+        Returns:
+            bool: whether the index holds the whole match. False for a match still being played, or one which was never indexed and has no log.
+        """
+        match_id = normalise_match_id(match_id)
+        indexed_size = self.get_indexed_size(match_id)
+        try:
+            stat = os.stat(log_path)
+        except FileNotFoundError:
+            return indexed_size is not None
+        if indexed_size == stat.st_size:
+            return True
+        if not self.is_finished(match_id, stat.st_mtime, active_match_ids):
+            return False
+        return self.index_match(match_id, log_path)
+
+    def backfill_logs(self, log_paths, active_match_ids=(), limit=200) -> int:
+        """ Index up to limit finished match logs which aren't indexed, or have grown since. Blocking, run it in a worker thread. """
+        indexed_sizes = self.get_indexed_sizes()
+        indexed = 0
+        for log_path in log_paths:
+            if indexed >= limit:
+                break
+            match = MATCH_LOG_PATTERN.match(log_path.name)
+            if not match:
+                continue
+            try:
+                stat = os.stat(log_path)
+            except FileNotFoundError:
+                continue
+            match_id = match.group(1)
+            if indexed_sizes.get(match_id) == stat.st_size or not self.is_finished(match_id, stat.st_mtime, active_match_ids):
+                continue
+            if self.index_match(match_id, log_path):
+                indexed += 1
+        return indexed
+
+    async def backfill(self, logs_directory, get_active_match_ids, limit=200):
+        """ Index match logs finished while the manager wasn't running, or written before the index existed. A scheduled job. """
+        logs_directory = Path(logs_directory)
+        if log_index.covers(logs_directory):
+            log_paths = [entry.path for entry in log_index.find(suffix='.log')]
+        else:
+            log_paths = await asyncio.to_thread(lambda: list(logs_directory.glob("M*.log")))
+        active_match_ids = {normalise_match_id(match_id) for match_id in get_active_match_ids() if match_id}
+        indexed = await asyncio.to_thread(self.backfill_logs, log_paths, active_match_ids, limit)
+        if indexed:
+            LOGGER.info(f"Indexed {indexed} finished match logs.")
+        return indexed
+
+    def get_match(self, match_id) -> Dict[str, Any]:
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM matches WHERE match_id = ?", (normalise_match_id(match_id),))
+            row = cursor.fetchone()
+
+        if row:
+            return dict(row)
+        else:
+            return {}
+
+    def get_chat(self, match_id) -> Tuple[Dict[str, List[Tuple[str, str]]], Dict[str, Dict[str, Any]]]:
+        """ The chat messages and player details of an indexed match, in the same form as MatchParser.parse_chat(). """
+        match_id = normalise_match_id(match_id)
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT player, target, message FROM chat WHERE match_id = ? ORDER BY player, line", (match_id,))
+            chat_messages = {}
+            for row in cursor.fetchall():
+                chat_messages.setdefault(str(row['player']), []).append((row['target'], row['message']))
+            cursor.execute("SELECT player, name, account_id, psr FROM players WHERE match_id = ? ORDER BY player", (match_id,))
+            player_details = {str(row['player']): {'name': row['name'], 'id': row['account_id'], 'psr': row['psr']} for row in cursor.fetchall()}
+        return chat_messages, player_details
+
+    def find_player_matches(self, name=None, account_id=None, limit=100) -> List[Dict[str, Any]]:
+        """
+        The indexed matches a player connected to, newest first. name matches case insensitively, as a prefix of the player's name.
+        """
+        conditions, parameters = [], []
+        if name:
+            # LIKE is case insensitive, so a prefix can be looked up using the NOCASE index on the names
+            escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("players.name LIKE ? ESCAPE '\\'")
+            parameters.append(f"{escaped}%")
+        if account_id:
+            conditions.append("players.account_id = ?")
+            parameters.append(str(account_id))
+        if not conditions:
+            return []
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT players.match_id, players.player, players.name, players.account_id, players.psr,
+                       matches.name AS match_name, matches.map, matches.mode, matches.match_date, matches.log_modified
+                FROM players JOIN matches ON matches.match_id = players.match_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY matches.log_modified DESC
+                LIMIT ?
+            """, (*parameters, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+match_database = MatchDatabase()
@@ -11,14 +11,20 @@ import os
 from datetime import datetime, timedelta
 from os.path import exists
 from cogs.misc.logger import get_logger, get_home, get_misc, get_mqtt
-from cogs.handlers.events import stop_event, GameStatus, GameServerCommands, GamePhase
+from cogs.handlers.events import stop_event, GameStatus, GamePhase
+from cogs.handlers.scheduler import scheduler
+from cogs.handlers.process_supervisor import process_supervisor
+from cogs.handlers.log_index import log_index
+from cogs.db.match_db_connector import match_database
 from cogs.misc.exceptions import HoNCompatibilityError, HoNInvalidServerBinaries, HoNServerError
 from cogs.misc.logparser import find_game_info_post_launch, find_match_id_post_launch
+from cogs.handlers.mqtt_delta import StatusDeltaEncoder
 from cogs.TCP.packet_parser import GameManagerParser
+from cogs.TCP import command_packets
+from cogs.game.game_state import GameState, PlayerRoster, SkippedFrameHistory
 import aiofiles
 import glob
 import re
-import random
 
 LOGGER = get_logger()
 HOME_PATH = get_home()
@@ -27,7 +33,6 @@ MISC = get_misc()
 class GameServer:
     def __init__(self, id, port, global_config, remove_self_callback, manager_event_bus):
         self.tasks = {
-            'process_monitor': None,
             'match_monitor': None,
             'botmatch_shutdown': None,
             'proxy_task': None,
@@ -58,6 +63,9 @@ class GameServer:
         """
         self.status_received = asyncio.Event()
         self.server_closed = asyncio.Event()
+        self.player_roster = PlayerRoster()
+        self.skipped_frames = SkippedFrameHistory(self.id)
+        self.status_encoders = {}
         self.game_state = GameState(self.id, self.config.local)
         self.reset_game_state()
         self.game_state.add_listener(self.on_game_state_change)
@@ -65,12 +73,8 @@ class GameServer:
         self.game_state._state.update({'instance_name': self.id})
         self.data_file = os.path.join(f"{HOME_PATH}", "game_states", f"GameServer-{self.id}_state_data.json")
         asyncio.create_task(self.load_gamestate_from_file(match_only=False))
-        # Start the monitor_process method as a background task
-        coro = self.monitor_process
-        self.schedule_task(coro,'process_monitor', coro_bracket=True)
-        # Start the heartbeat task. This sends a status update to MQTT
-        coro = self.heartbeat
-        self.schedule_task(coro, 'heartbeat', coro_bracket=True)
+        # Schedule the heartbeat. This sends a status update to MQTT
+        scheduler.add_job(self.heartbeat_job_name, self.heartbeat, interval=self.get_heartbeat_interval, jitter=10)
 
     def schedule_task(self, coro, name, coro_bracket = False):
         existing_task = self.tasks.get(name)  # Get existing task if any
@@ -118,6 +122,9 @@ class GameServer:
     def cancel_tasks(self):
         for task in self.tasks.values():
             self.stop_task(task)
+        scheduler.remove_job(self.heartbeat_job_name)
+        if self._pid:
+            process_supervisor.unwatch(self._pid, self.on_process_exit)
     
     def get_public_game_port(self):
         if self.config.local['params']['man_enableProxy']:
@@ -135,6 +142,9 @@ class GameServer:
         LOGGER.debug(f"GameServer #{self.id} - Reset state")
         self.status_received.clear()
         self.game_state.clear()
+        self.game_manager_parser.reset_status_cache()
+        for status_encoder in self.status_encoders.values():
+            status_encoder.reset()
 
     def params_are_different(self):
         if not self._proc_hook: return
@@ -144,6 +154,7 @@ class GameServer:
         except psutil.NoSuchProcess:
             return False
         self.set_configuration()
+        self.game_state.touch()
         if self.global_config['hon_data'].get('man_use_cowmaster'):
             new_params = MISC.build_commandline_args(data_handler.get_cowmaster_configuration(self.global_config['hon_data']), self.global_config, cowmaster=True)
         else:
@@ -159,6 +170,7 @@ class GameServer:
         while True:
             elapsed_time = time.time() - self.game_state['match_info']['start_time']
             self.game_state['match_info']['duration'] = elapsed_time
+            self.game_state.touch()
             await asyncio.sleep(1)
 
     async def start_match_timer(self):
@@ -193,24 +205,44 @@ class GameServer:
                     LOGGER.info(f"GameServer #{self.id} - Waited 1 minute. Players still connected. Resetting server.")
                     await self.manager_event_bus.emit('cmd_custom_command', self, "serverreset", delay=5)
                     if get_mqtt():
-                        get_mqtt().publish_json("game_server/match",{"event_type":"server_reset", "reason": "players still connected after 60 seconds when game is ended.", **self.game_state._state})
+                        self.publish_state("game_server/match", {"event_type":"server_reset", "reason": "players still connected after 60 seconds when game is ended."})
 
                 break
             await asyncio.sleep(1)
 
+    async def warn_botmatch_disallowed(self, delay):
+        msg_count = 0
+        while self.game_state['status'] != GameStatus.READY.value:
+            await self.manager_event_bus.emit('cmd_message_server', self, f"Bot matches are disallowed on {self.global_config['hon_data']['svr_name']}. Server closing in {delay - (msg_count*5)} seconds.")
+            msg_count +=1
+            if msg_count > 10:
+                break
+            await asyncio.sleep(5)
+
     async def stop_disconnect_timer(self):
         self.stop_task(self.tasks['idle_disconnect_timer'])
         self.idle_disconnect_timer = 0
 
+    async def index_match_log(self, match_id):
+        """ Store the ended match's lobby info, players and chat in the match database, so its log isn't parsed again. """
+        log_path = self.global_config['hon_data']['hon_logs_directory'] / f"M{match_id}.log"
+        try:
+            if not await asyncio.to_thread(match_database.index_match, match_id, log_path):
+                LOGGER.warn(f"GameServer #{self.id} - Match log not found, unable to index match {match_id}: {log_path}")
+        except Exception:
+            LOGGER.error(f"GameServer #{self.id} - Unable to index match {match_id}. {traceback.format_exc()}")
+
     async def on_game_state_change(self, key, value, old_value):
         if key == "match_started":
             if value == 0:
                 LOGGER.debug(f"GameServer #{self.id} - Game Ended: {self.game_state['current_match_id']}")
                 if get_mqtt():
-                    get_mqtt().publish_json("game_server/match", {"event_type":"match_ended", **self.game_state._state})
+                    self.publish_state("game_server/match", {"event_type":"match_ended"})
                 await self.set_server_priority_reduce()
                 await self.stop_match_timer()
                 await self.stop_disconnect_timer()
+                if self.game_state['current_match_id']:
+                    self.schedule_task(self.index_match_log(self.game_state['current_match_id']), 'index_match_log')
                 if self.global_config['hon_data']['svr_restart_between_games'] and self.game_in_progress:
                     LOGGER.info(f"GameServer #{self.id} - Restart game server between games as 'svr_restart_between_games' is enabled.")
                     coro = self.schedule_shutdown_server(disable=False)
@@ -219,7 +251,7 @@ class GameServer:
             elif value == 1:
                 LOGGER.info(f"GameServer #{self.id} -  Game Started: {self.game_state._state['current_match_id']}")
                 if get_mqtt():
-                    get_mqtt().publish_json("game_server/match", {"event_type":"match_started", **self.game_state._state})
+                    self.publish_state("game_server/match", {"event_type":"match_started"})
                 self.game_in_progress = True
                 await self.set_server_priority_increase()
                 await self.start_match_timer()
@@ -227,12 +259,12 @@ class GameServer:
         elif key == "game_phase":
             LOGGER.debug(f"GameServer #{self.id} - Game phase {value}")
             if get_mqtt():
-                get_mqtt().publish_json("game_server/match", {"event_type":"phase_change", **self.game_state._state})
+                self.publish_state("game_server/match", {"event_type":"phase_change"})
             if value == GamePhase.IDLE.value and self.scheduled_shutdown:
                 await self.stop_server_network()
             elif value in [GamePhase.GAME_ENDING.value,GamePhase.GAME_ENDED.value]:
                 LOGGER.debug(f"GameServer #{self.id} - Game in final stages, game ending.")
-                await self.schedule_task(self.start_disconnect_timer,'idle_disconnect_timer', coro_bracket=True)
+                self.schedule_task(self.start_disconnect_timer,'idle_disconnect_timer', coro_bracket=True)
             # add more phases as needed
 
         elif key == "status":
@@ -252,41 +284,39 @@ class GameServer:
                 delay = 30
                 coro = self.manager_event_bus.emit('cmd_custom_command', self, "serverreset", delay=delay)
                 self.schedule_task(coro,'botmatch_shutdown')
-
-                msg_count = 0
-                while self.game_state['status'] != GameStatus.READY.value:
-                    await self.manager_event_bus.emit('cmd_message_server', self, f"Bot matches are disallowed on {self.global_config['hon_data']['svr_name']}. Server closing in {delay - (msg_count*5)} seconds.")
-                    msg_count +=1
-                    if msg_count > 10:
-                        break
-                    await asyncio.sleep(5)
+                # the warnings run for up to a minute, so they run on their own rather than holding up the remaining state changes
+                self.schedule_task(self.warn_botmatch_disallowed(delay),'botmatch_warning')
 
         elif key == "players":
-            stable_keys = ['name', 'ip', 'location', 'account_id']
-
-            # Extract the relevant keys and values from the player dictionaries
-            old_players = [{k: player[k] for k in stable_keys} for player in old_value]
-            new_players = [{k: player[k] for k in stable_keys} for player in value]
-
-            # Convert the dictionaries to JSON strings and create sets
-            old_value_set = set(json.dumps(player) for player in old_players)
-            value_set = set(json.dumps(player) for player in new_players)
-
-            # Find players who left
-            left_players = old_value_set - value_set
-            # Find players who joined
-            joined_players = value_set - old_value_set
-
-            # Convert the JSON strings back to dictionaries for easy reading
-            left_players = [json.loads(player) for player in left_players]
-            joined_players = [json.loads(player) for player in joined_players]
-
-            if len(joined_players) > 0:
-                if get_mqtt():
-                    get_mqtt().publish_json("game_server/match", {"event_type":"player_connection", "player_name":joined_players[0]['name'], "player_ip":joined_players[0]['ip'], **self.game_state._state})
-            elif len(left_players) >0:
-                if get_mqtt():
-                    get_mqtt().publish_json("game_server/match", {"event_type":"player_disconnection", "player_name":left_players[0]['name'], "player_ip":left_players[0]['ip'], **self.game_state._state})
+            changes = self.player_roster.diff(value)
+            if get_mqtt():
+                for player in changes.joined:
+                    self.publish_state("game_server/match", {"event_type":"player_connection", "player_name":player.name, "player_ip":player.ip, "account_id":player.account_id})
+                for player in changes.left:
+                    self.publish_state("game_server/match", {"event_type":"player_disconnection", "player_name":player.name, "player_ip":player.ip, "account_id":player.account_id})
+                for old, new in changes.updated:
+                    # ping changes are in almost every packet, so only publish changes to the player's identity
+                    if (old.name, old.ip, old.location) != (new.name, new.ip, new.location):
+                        self.publish_state("game_server/match", {"event_type":"player_update", "player_name":new.name, "player_ip":new.ip, "account_id":new.account_id})
+
+    def publish_state(self, topic, data):
+        """
+        Publish an event to MQTT along with the game state.
+        The state is included in full, or delta encoded if application_data.mqtt.delta_status is enabled (see cogs/handlers/mqtt_delta.py).
+        """
+        mqtt = get_mqtt()
+        if not mqtt:
+            return
+        mqtt_config = self.global_config['application_data'].get('mqtt', {})
+        if not mqtt_config.get('delta_status'):
+            mqtt.publish_json(topic, {**data, **self.game_state._state})
+            return
+        # one encoder per topic, so a subscriber to any one topic sees an unbroken sequence
+        status_encoder = self.status_encoders.get(topic)
+        if status_encoder is None:
+            status_encoder = self.status_encoders[topic] = StatusDeltaEncoder(snapshot_interval=mqtt_config.get('snapshot_interval', 300))
+        encoded = status_encoder.encode(self.game_state._state, generation=mqtt.connection_generation)
+        mqtt.publish_json(topic, {**data, "instance_id": self.id, "instance_name": self.game_state._state.get('instance_name'), **encoded})
 
     def unlink_client_connection(self):
         del self.client_connection
@@ -311,12 +341,12 @@ class GameServer:
         await self.get_running_server()
 
         # when servers connect they may be in a "Sleeping" state. Wake them up
-        await self.client_connection.send_packet(GameServerCommands.WAKE_BYTES.value, send_len=True)
+        await self.client_connection.send_frame(command_packets.WAKE_FRAME)
 
     def unset_client_connection(self):
         self.client_connection = None
         if get_mqtt():
-            get_mqtt().publish_json("game_server/status",{"event_type":"server_disconnected", **self.game_state._state})
+            self.publish_state("game_server/status", {"event_type":"server_disconnected"})
 
     def set_configuration(self):
         self.config = data_handler.ConfigManagement(self.id,self.global_config)
@@ -331,6 +361,7 @@ class GameServer:
                 self.game_state._performance['total_ingame_skipped_frames'] = performance_data['total_ingame_skipped_frames']
             if self.game_state._state['current_match_id'] in performance_data:
                 self.game_state._performance.update({'now_ingame_skipped_frames':self.game_state._performance['total_ingame_skipped_frames'] + performance_data[self.game_state._state['current_match_id']]['now_ingame_skipped_frames']})
+            self.game_state.touch()
     
     async def save_gamestate_to_file(self):
         # TODO: this function needs re-writing if we choose to continue to use it. It isn't used at the moment
@@ -367,18 +398,16 @@ class GameServer:
 
     def reset_skipped_frames(self):
         self.game_state._performance['now_ingame_skipped_frames'] = 0
+        self.game_state.touch()
 
     def increment_skipped_frames(self, frames, time):
         # if self.get_dict_value('game_phase') == 6:  # Only log skipped frames when we're actually in a match.
             self.game_state._performance['total_ingame_skipped_frames'] += frames
             self.game_state._performance['now_ingame_skipped_frames'] += frames
-            self.game_state._performance['skipped_frames_detailed'][time] = frames
-
-            # Remove entries older than one day
-            one_day_ago = time - timedelta(days=1).total_seconds()
-            self.game_state._performance['skipped_frames_detailed'] = {key: value for key, value in self.game_state._performance['skipped_frames_detailed'].items() if key >= one_day_ago}
+            self.game_state.touch()
+            self.skipped_frames.add(time, frames)
             if get_mqtt():
-                get_mqtt().publish_json("game_server/lag",{"event_type": "skipped_frame", "skipped_frames": frames, **self.game_state._state})
+                self.publish_state("game_server/lag", {"event_type": "skipped_frame", "skipped_frames": frames})
 
 
     def get_pretty_status(self):
@@ -598,11 +627,13 @@ class GameServer:
             self._proc = exe
             self._proc_hook = psutil.Process(pid=exe.pid)
             self._proc_owner =self._proc_hook.username()
+            self.watch_process(popen=exe)
 
             if MISC.get_os_platform() == "win32":
                 self.set_server_affinity()
 
         self.scheduled_shutdown = False
+        self.game_state.touch()
         self.game_state.update({'status':GameStatus.STARTING.value})
 
         self.unschedule_shutdown()
@@ -628,7 +659,7 @@ class GameServer:
                 elapsed_time = time.perf_counter() - start_time
                 LOGGER.interest(f"GameServer #{self.id} with public ports {self.get_public_game_port()}/{self.get_public_voice_port()} started successfully in {elapsed_time:.2f} seconds.")
                 if get_mqtt():
-                    get_mqtt().publish_json("game_server/status", {"event_type":"server_started", **self.game_state._state})
+                    self.publish_state("game_server/status", {"event_type":"server_started"})
                 return True
             elif self.server_closed.is_set():
                 LOGGER.warn(f"GameServer #{self.id} closed prematurely. Stopped waiting for it.")
@@ -639,16 +670,19 @@ class GameServer:
 
     def mark_for_deletion(self):
         self.delete_me = True
+        self.game_state.touch()
 
 
     async def schedule_shutdown_server(self, delete=False, disable=True):
         self.schedule_shutdown()
         self.delete_me = delete
+        self.game_state.touch()
         if disable:
             self.disable_server()
         if self.game_state['game_phase'] == GamePhase.IDLE.value:
             await self.stop_server_network()
             self.delete_me = False
+            self.game_state.touch()
 
     async def stop_server_network(self, nice=True):
         if nice:
@@ -658,9 +692,7 @@ class GameServer:
         self.status_received.clear()
         self.stop_proxy()
         LOGGER.info(f"GameServer #{self.id} - Stopping")
-        self.client_connection.writer.write(GameServerCommands.COMMAND_LEN_BYTES.value)
-        self.client_connection.writer.write(GameServerCommands.SHUTDOWN_BYTES.value)
-        await self.client_connection.writer.drain()
+        await self.client_connection.send_frame(command_packets.SHUTDOWN_FRAME)
         self.started = False
         self.unschedule_shutdown()
         self.server_closed.set()
@@ -671,48 +703,26 @@ class GameServer:
     async def tail_game_log_then_close(self, wait=60):
         end_time = time.time() + wait
         old_size = 0
+        logs_directory = self.global_config['hon_data']['hon_logs_directory']
         while time.time() < end_time:
-            # Find all files matching pattern
-            files = glob.glob(os.path.join(self.global_config['hon_data']['hon_logs_directory'], f"Slave{self.id}_*.clog"))
-            if not files:
-                break
-
-            # If files are found, sort them by modification time, and get the size of the most recent one
-            if files:
-                latest_file = max(files, key=os.path.getmtime)
-                size = os.path.getsize(latest_file)
-                if not old_size:
-                    old_size = size
-                else:
-                    if size != old_size:
-                        LOGGER.info("match in progress")
-                        return
-
-            # Sleep for a while before checking again
-            await asyncio.sleep(1)
-
-        # Close the tailing
-        await self.stop_server_exe(disable=False)
-
-    async def tail_game_log_then_close(self, wait=60):
-        end_time = time.time() + wait
-        old_size = 0
-        while time.time() < end_time:
-            # Find all files matching pattern
-            files = glob.glob(os.path.join(self.global_config['hon_data']['hon_logs_directory'], f"Slave{self.id}_*.clog"))
-            if not files:
+            # Find the most recently modified log of this server, from the log index if it's ready
+            if log_index.covers(logs_directory):
+                latest_file = log_index.latest(slave_id=self.id, suffix='.clog')
+                latest_file = latest_file.path if latest_file else None
+            else:
+                files = glob.glob(os.path.join(logs_directory, f"Slave{self.id}_*.clog"))
+                latest_file = max(files, key=os.path.getmtime) if files else None
+            if not latest_file:
                 break
 
-            # If files are found, sort them by modification time, and get the size of the most recent one
-            if files:
-                latest_file = max(files, key=os.path.getmtime)
-                size = os.path.getsize(latest_file)
-                if not old_size:
-                    old_size = size
-                else:
-                    if size != old_size:
-                        LOGGER.info("match in progress")
-                        return
+            # get the size of the most recent one
+            size = os.path.getsize(latest_file)
+            if not old_size:
+                old_size = size
+            else:
+                if size != old_size:
+                    LOGGER.info("match in progress")
+                    return
 
             # Sleep for a while before checking again
             await asyncio.sleep(1)
@@ -724,6 +734,7 @@ class GameServer:
         if disable:
             self.disable_server()
         self.delete_me = delete
+        self.game_state.touch()
         if self._proc:
             if disable:
                 self.disable_server()
@@ -743,12 +754,16 @@ class GameServer:
             self.cancel_tasks()
             await self.manager_event_bus.emit('remove_game_server',self)
 
-    async def get_running_server(self,timeout=15):
+    async def get_running_server(self,timeout=15,resolved_ports=None):
         """
             Check if existing hon server is running.
+            resolved_ports is the {port: process} result of a MISC.resolve_ports() just taken for many servers, so this server's port isn't scanned for again.
         """
         #running_procs = MISC.get_proc(self.config.local['config']['file_name'], slave_id = self.id)
-        running_procs = [MISC.get_process_by_port(self.port)]
+        if resolved_ports is not None and self.port in resolved_ports:
+            running_procs = [resolved_ports[self.port]]
+        else:
+            running_procs = [MISC.get_process_by_port(self.port, fresh=True)]
         if running_procs[0] == None:
             running_procs = []
         last_good_proc = None
@@ -761,7 +776,7 @@ class GameServer:
                 if status:
                     last_good_proc = proc
                 else:
-                    if not MISC.check_port(self.config.get_local_configuration()['params']['svr_proxyLocalVoicePort']) and not self.global_config['hon_data'].get('man_use_cowmaster'):
+                    if not MISC.check_port(self.config.get_local_configuration()['params']['svr_proxyLocalVoicePort'], fresh=True) and not self.global_config['hon_data'].get('man_use_cowmaster'):
                         proc.terminate()
                         LOGGER.debug(f"Terminated GameServer #{self.id} as it has not started up correctly.")
                         running_procs.remove(proc)
@@ -777,6 +792,7 @@ class GameServer:
             self._proc = proc
             self._proc_hook = psutil.Process(pid=proc.pid)
             self._proc_owner = proc.username()
+            self.watch_process()
             LOGGER.debug(f"Found process ({self._pid}) for GameServer #{self.id}.")
             try:
                 coro = self.start_proxy
@@ -937,179 +953,57 @@ region=naeu
             except psutil.NoSuchProcess: # it doesn't exist, that's fine
                 pass
 
-    async def monitor_process(self):
-        LOGGER.debug(f"GameServer #{self.id} Process monitor started")
-        try:
-            while not stop_event.is_set():
-                if self._proc is not None and self._proc_hook is not None:
-                    try:
-                        status = self._proc_hook.status()  # Get the status of the process
-                    except psutil.NoSuchProcess:
-                        status = 'stopped'
-                    if status in ['zombie', 'stopped'] and self.enabled:  # If the process is defunct or stopped. a "suspended" process will also show as stopped on windows.
-                        LOGGER.warn(f"GameServer #{self.id} stopped unexpectedly. (Process ID: {self._proc_hook.pid})")
-                        self._proc = None  # Reset the process reference
-                        self._proc_hook = None  # Reset the process hook reference
-                        self._pid = None
-                        self._proc_owner = None
-                        self.started = False
-                        self.server_closed.set()  # Set the server_closed event
-                        if get_mqtt():
-                            get_mqtt().publish_json("game_server/status",{"event_type":"server_crashed", **self.game_state._state})
-                        self.reset_game_state()
-                        # the below intentionally does not use self.schedule_task. The manager ends up creating the task.
-                        asyncio.create_task(self.manager_event_bus.emit('start_game_servers', [self], service_recovery=False))  # restart the server
-                    elif status != 'zombie' and not self.enabled and not self.scheduled_shutdown:
-                        #   Schedule a shutdown, otherwise if shutdown is already scheduled, skip over
-                        self.schedule_shutdown()
-
-                for _ in range(5):  # Monitor process every 5 seconds
-                    if stop_event.is_set():
-                        break
-                    await asyncio.sleep(1)
-
-        except asyncio.CancelledError:
-            LOGGER.debug(f"GameServer #{self.id} Process monitor cancelled")
-            # Propagate the cancellation
-            raise
-        except Exception as e:
-            LOGGER.error(f"GameServer #{self.id} Unexpected error in monitor_process: {e}")
+    def watch_process(self, popen=None):
+        """
+            Register the current game server process with the process supervisor, so on_process_exit is called as soon as it exits.
+        """
+        if self._pid is None or process_supervisor.is_watched(self._pid):
+            return
+        process_supervisor.watch(self._pid, self.on_process_exit, popen=popen)
+
+    def on_process_exit(self, pid, returncode):
+        if pid != self._pid:
+            return  # an old process, the server has been restarted since
+        if not self.enabled or stop_event.is_set():
+            return  # expected, the server is being shut down
+        LOGGER.warn(f"GameServer #{self.id} stopped unexpectedly. (Process ID: {pid}{f', exit code: {returncode}' if returncode is not None else ''})")
+        self._proc = None  # Reset the process reference
+        self._proc_hook = None  # Reset the process hook reference
+        self._pid = None
+        self._proc_owner = None
+        self.started = False
+        self.server_closed.set()  # Set the server_closed event
+        if get_mqtt():
+            self.publish_state("game_server/status", {"event_type":"server_crashed"})
+        self.reset_game_state()
+        # the below intentionally does not use self.schedule_task. The manager ends up creating the task.
+        asyncio.create_task(self.manager_event_bus.emit('start_game_servers', [self], service_recovery=True))  # restart the server
 
-    async def heartbeat(self):
-        while not stop_event.is_set():
-            if self.game_state._state['match_started'] == 0:
-                sleep = 60
-            else:
-                sleep = 20
-
-            # Introduce jitter: sleep for a random duration between 0 to 10 seconds
-            jitter = random.uniform(0, 10)
-            await asyncio.sleep(jitter)
-            
-            for _ in range(sleep):
-                if stop_event.is_set():
-                    return
-                await asyncio.sleep(1)
-            if get_mqtt():
-                get_mqtt().publish_json("game_server/status", {"event_type":"heartbeat", **self.game_state._state})
+    @property
+    def heartbeat_job_name(self):
+        return f"game_server_{self.id}_heartbeat"
+
+    def get_heartbeat_interval(self):
+        return 60 if self.game_state._state['match_started'] == 0 else 20
+
+    def heartbeat(self):
+        self.publish_state("game_server/status", {"event_type":"heartbeat"})
 
     def enable_server(self):
         self.enabled = True
 
     def disable_server(self):
         self.enabled = False
+        if self._proc_hook and not self.scheduled_shutdown:
+            #   Schedule a shutdown, otherwise if shutdown is already scheduled, skip over
+            self.schedule_shutdown()
 
     def schedule_shutdown(self, delete=False):
         self.scheduled_shutdown = True
+        self.game_state.touch()
         # self.delete_me = delete
 
     def unschedule_shutdown(self):
         self.scheduled_shutdown = False
+        self.game_state.touch()
         # self.delete_me = False
-import asyncio
-
-class GameState:
-    def __init__(self, id, local_config):
-        self._state = {}
-        self._performance = {}
-        self._listeners = []
-        self.id = id
-        self.local_config = local_config
-
-    def __getitem__(self, key, dict_to_check="state"):
-        target_dict = self._state if dict_to_check == "state" else self._performance
-        return target_dict[key]
-
-    def __setitem__(self, key, value, dict_to_check="state"):
-        old_value = None
-        try:
-            old_value = self._state[key]
-        except KeyError: # most likely, the game state is just being initialised, so there is no old value
-            pass
-        if dict_to_check == "state":
-            self._state[key] = value
-        else:
-            self._performance[key] = value
-        self._emit_event(key, value, old_value)
-
-    def get_full_key(self, key, current_level, level=None, path=None, dict_to_check="state"):
-        if level is None:
-            level = self._state if dict_to_check == "state" else self._performance
-
-        if path is None:
-            path = []
-
-        if level is current_level:
-            path.append(key)
-            return ".".join(path)
-
-        for k, v in level.items():
-            if isinstance(v, dict):
-                new_path = path.copy()
-                new_path.append(k)
-                result = self.get_full_key(key, current_level, v, new_path, dict_to_check)
-                if result:
-                    return result
-
-        return None
-
-    def update(self, data, current_level=None, dict_to_check="state"):
-        monitored_keys = ["match_started", "match_info.mode", "game_phase", "players", "status"]
-
-        if current_level is None:
-            current_level = self._state if dict_to_check == "state" else self._performance
-
-        target_dict = self._state if dict_to_check == "state" else self._performance
-
-        for key, value in data.items():
-            if isinstance(value, dict):
-                if key not in current_level:
-                    current_level[key] = {}
-                self.update(value, current_level[key], dict_to_check)
-            else:
-                full_key = self.get_full_key(key, current_level, dict_to_check=dict_to_check)
-                if full_key in monitored_keys and (full_key not in target_dict or self.__getitem__(full_key, dict_to_check) != value):
-                    self.__setitem__(full_key, value, dict_to_check)
-                else:
-                    current_level[key] = value
-
-    def add_listener(self, callback):
-        self._listeners.append(callback)
-
-    def _emit_event(self, key, value, old_value):
-        for listener in self._listeners:
-            asyncio.create_task(listener(key, value, old_value))
-
-    def clear(self, dict_to_check=None):
-        if dict_to_check is None or dict_to_check == "state":
-            self.update({
-                'instance_id':self.id,
-                'instance_name': self.local_config['name'],
-                'local_game_port': self.local_config['params']['svr_port'],
-                'remote_game_port': self.local_config['params']['svr_proxyPort'],
-                'local_voice_port': self.local_config['params']['svr_proxyLocalVoicePort'],
-                'remote_voice_port': self.local_config['params']['svr_proxyRemoteVoicePort'],
-                'proxy_enabled': self.local_config['params']['man_enableProxy'],
-                'svr_affinity': self.local_config['params']['host_affinity'],
-                'status': -1,
-                'uptime': 0,
-                'num_clients': 0,
-                'match_started': 0,
-                'game_phase': 0,
-                'current_match_id': 0,
-                'players': [],
-                'match_info':{
-                    'map':None,
-                    'mode':None,
-                    'name':None,
-                    'match_id':None,
-                    'start_time': 0,
-                    'duration':0
-                }
-            }, dict_to_check="state")
-        if dict_to_check is None or dict_to_check == "performance":
-            self.update({
-                "now_ingame_skipped_frames": 0,
-                "total_ingame_skipped_frames": 0,
-                'skipped_frames_detailed': {}
-            }, dict_to_check="performance")
\ No newline at end of file
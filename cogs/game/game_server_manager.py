@@ -4,37 +4,36 @@ import traceback
 import asyncio
 import hashlib
 import os.path
-import subprocess
-import urllib
 from datetime import datetime, timedelta
 import inspect
-import tempfile
-import shutil
-from cogs.misc.exceptions import HoNAuthenticationError, HoNServerError
+from cogs.misc.exceptions import HoNAuthenticationError, HoNServerError, HoNStatsRejectedError
 from cogs.connectors.masterserver_connector import MasterServerHandler
 from cogs.connectors.chatserver_connector import ChatServerHandler
-from cogs.TCP.game_packet_lsnr import handle_clients
+from cogs.TCP.game_packet_lsnr import GameServerProtocol
+from cogs.TCP import command_packets
 from cogs.TCP.auto_ping_lsnr import AutoPingListener
 from cogs.connectors.api_server import start_api_server
 from cogs.game.game_server import GameServer
 from cogs.game.cow_master import CowMaster
 from cogs.handlers.commands import Commands
-from cogs.handlers.events import stop_event, ReplayStatus, GameStatus, GamePhase, GameServerCommands, EventBus as ManagerEventBus
+from cogs.handlers.events import stop_event, GameStatus, GamePhase, EventBus as ManagerEventBus
+from cogs.handlers.scheduler import scheduler
+from cogs.handlers.replay_uploader import ReplayUploader
+from cogs.handlers.stats_resubmitter import StatsResubmitter
+from cogs.handlers.log_index import log_index
+from cogs.handlers.status_feed import instance_status_feed
+from cogs.db.match_db_connector import match_database
 from cogs.misc.logger import get_logger, get_misc, get_home, get_mqtt, get_filebeat_status, get_filebeat_auth_url
 from pathlib import Path
 from cogs.game.healthcheck_manager import HealthCheckManager
+from cogs.game.patch_orchestrator import PatchOrchestrator
 from enum import Enum
 from os.path import exists
 from utilities.filebeat import main as filebeat, filebeat_status, get_filebeat_auth_url
-import random
 
 LOGGER = get_logger()
 MISC = get_misc()
 HOME_PATH = get_home()
-HON_WAS_VERSION_URL = "http://gitea.kongor.online/administrator/KONGOR/raw/branch/main/patch/was-crIac6LASwoafrl8FrOa/x86_64/version.cfg"
-HON_WAS_LAUNCHER_DOWNLOAD_URL = "http://gitea.kongor.online/administrator/KONGOR/raw/branch/main/patch/was-crIac6LASwoafrl8FrOa/x86_64/hon_update_x64.zip"
-HON_LAS_VERSION_URL = "http://gitea.kongor.online/administrator/KONGOR/raw/branch/main/patch/las-crIac6LASwoafrl8FrOa/x86-biarch/version.cfg"
-HON_LAS_LAUNCHER_DOWNLOAD_URL = "http://gitea.kongor.online/administrator/KONGOR/raw/branch/main/patch/las-crIac6LASwoafrl8FrOa/x86-biarch/launcher.zip"
 
 class GameServerManager:
     def __init__(self, global_config, setup):
@@ -60,6 +59,7 @@ class GameServerManager:
         self.event_bus.subscribe('enable_game_server', self.enable_game_server)
         self.event_bus.subscribe('disable_game_server', self.disable_game_server)
         self.event_bus.subscribe('cmd_message_server', self.cmd_message_server)
+        self.event_bus.subscribe('cmd_message_servers', self.cmd_message_servers)
         self.event_bus.subscribe('cmd_shutdown_server', self.cmd_shutdown_server)
         self.event_bus.subscribe('cmd_wake_server', self.cmd_wake_server)
         self.event_bus.subscribe('cmd_sleep_server', self.cmd_sleep_server)
@@ -74,20 +74,22 @@ class GameServerManager:
         self.event_bus.subscribe('update_server_start_semaphore', self.update_server_start_semaphore)
         self.tasks = {
             'cli_handler':None,
-            'health_checks':None,
             'autoping_listener':None,
             'gameserver_listener':None,
             'authentication_handler':None,
             'gameserver_startup':None,
-            'task_cleanup': None
+            'scheduler': None
         }
-        self.schedule_task(self.cleanup_tasks_every_30_minutes(), 'task_cleanup')
-        self.schedule_task(self.heartbeat(), 'heartbeat')
+        # the scheduler runs every periodic job: heartbeats, health checks and task cleanup
+        self.schedule_task(scheduler.run(), 'scheduler')
+        scheduler.add_job('task_cleanup', self.cleanup_all_tasks, interval=30 * 60, initial_delay=0)
+        scheduler.add_job('manager_heartbeat', self.heartbeat, interval=60, jitter=10)
         # initialise the config validator in case we need it
         self.setup = setup
 
         # set the current state of patching
         self.patching = False
+        self.patch_orchestrator = PatchOrchestrator(self)
 
         # preserve the current system path. We need it for a silly fix.
         self.preserved_path = os.environ["PATH"]
@@ -117,10 +119,17 @@ class GameServerManager:
         self.chat_server_connected = None
         self.master_server_connected = None
         self.master_server_handler = MasterServerHandler(master_server=self.global_config['hon_data']['svr_masterServer'], patch_server=self.global_config['hon_data']['svr_patchServer'], version=self.global_config['hon_data']['svr_version'], architecture=f'{self.global_config["hon_data"]["architecture"]}', event_bus=self.event_bus)
-        self.health_check_manager = HealthCheckManager(self.game_servers, self.event_bus, self.check_upstream_patch, self.resubmit_match_stats_to_masterserver, self.global_config)
-
-        coro = self.health_check_manager.run_health_checks()
-        self.schedule_task(coro, 'health_checks')
+        self.replay_uploader = ReplayUploader(self.global_config, self.master_server_handler, self.find_replay_file, lambda *args: self.chat_server_handler.create_replay_status_update_packet(*args))
+        self.health_check_manager = HealthCheckManager(self.game_servers, self.event_bus, self.check_upstream_patch, self.global_config)
+
+        self.health_check_manager.schedule_health_checks()
+        # index the logs directory, so finding logs doesn't list it
+        log_index.start(self.global_config['hon_data']['hon_logs_directory'])
+        # resubmit match stats which game servers couldn't submit themselves
+        self.stats_resubmitter = StatsResubmitter(self.global_config['hon_data']['hon_logs_directory'], self.resubmit_match_stats_to_masterserver, HOME_PATH / "cogs" / "db" / "stats_resubmission.json")
+        self.schedule_task(self.stats_resubmitter.run(), 'stats_resubmitter')
+        # index match logs which finished without being indexed, e.g. while the manager wasn't running
+        scheduler.add_job('match_index_backfill', lambda: match_database.backfill(self.global_config['hon_data']['hon_logs_directory'], self.get_active_match_ids), interval=30 * 60, initial_delay=60)
 
         MISC.save_last_working_branch()
 
@@ -136,17 +145,12 @@ class GameServerManager:
             if task.done() and task.exception() is None and task.end_time + timedelta(minutes=30) < current_time:
                 del tasks_dict[task_name]
 
-    async def cleanup_tasks_every_30_minutes(self):
-        while True:
-            current_time = datetime.now()
-            # Iterate over all game servers and the manager
-            for game_server in self.game_servers.values():
-                self.cleanup_tasks(game_server.tasks, current_time)
-            self.cleanup_tasks(self.tasks, current_time)
-            for _ in range(30 * 60):
-                if stop_event.is_set():
-                    break
-                await asyncio.sleep(1)
+    def cleanup_all_tasks(self):
+        current_time = datetime.now()
+        # Iterate over all game servers and the manager
+        for game_server in self.game_servers.values():
+            self.cleanup_tasks(game_server.tasks, current_time)
+        self.cleanup_tasks(self.tasks, current_time)
 
     def schedule_task(self, coro, name, override = False):
         existing_task = self.tasks.get(name)  # Get existing task if any
@@ -186,9 +190,7 @@ class GameServerManager:
             await asyncio.sleep(delay)
             if client_connection:
                 if force:
-                    client_connection.writer.write(GameServerCommands.COMMAND_LEN_BYTES.value)
-                    client_connection.writer.write(GameServerCommands.SHUTDOWN_BYTES.value)
-                    await client_connection.writer.drain()
+                    await client_connection.send_frame(command_packets.SHUTDOWN_FRAME)
                     LOGGER.info(f"Command - Shutdown packet sent to GameServer #{game_server.id}. FORCED.")
                     if get_mqtt():
                         get_mqtt().publish_json("manager/command", {"event_type":"server_shutdown_force"})
@@ -213,10 +215,7 @@ class GameServerManager:
             client_connection = self.client_connections.get(game_server.port, None)
             if not client_connection: return
 
-            # TODO: use client_connection.send_packet() ??
-            client_connection.writer.write(GameServerCommands.COMMAND_LEN_BYTES.value)
-            client_connection.writer.write(GameServerCommands.WAKE_BYTES.value)
-            await client_connection.writer.drain()
+            await client_connection.send_frame(command_packets.WAKE_FRAME)
 
             LOGGER.info(f"Command - Wake command sent to GameServer #{game_server.id}.")
         except Exception as e:
@@ -227,10 +226,7 @@ class GameServerManager:
             client_connection = self.client_connections.get(game_server.port, None)
             if not client_connection: return
 
-            # TODO: use client_connection.send_packet() ??
-            client_connection.writer.write(GameServerCommands.COMMAND_LEN_BYTES.value)
-            client_connection.writer.write(GameServerCommands.SLEEP_BYTES.value)
-            await client_connection.writer.drain()
+            await client_connection.send_frame(command_packets.SLEEP_FRAME)
 
             LOGGER.info(f"Command - Sleep command sent to GameServer #{game_server.id}.")
         except Exception as e:
@@ -242,19 +238,25 @@ class GameServerManager:
             if client_connection is None:
                 return
 
-            if isinstance(message, list): message = (' ').join(message)
-            message_bytes = GameServerCommands.MESSAGE_BYTES.value + message.encode('ascii') + b'\x00'
-            length = len(message_bytes)
-            length_bytes = length.to_bytes(2, byteorder='little')
-
-            # TODO: use client_connection.send_packet() ??
-            client_connection.writer.write(length_bytes)
-            client_connection.writer.write(message_bytes)
-            await client_connection.writer.drain()
+            await client_connection.send_frame(command_packets.message_frame(message))
             LOGGER.info(f"Command - Message command sent to GameServer #{game_server.id}.")
         except Exception:
             LOGGER.exception(f"An error occurred while handling the {inspect.currentframe().f_code.co_name} function: {traceback.format_exc()}")
 
+    async def cmd_message_servers(self, game_servers, message):
+        """
+        Send the same message to many game servers at once. The message is encoded once and written to every connection concurrently.
+        Game servers which aren't connected to the manager are skipped.
+        """
+        try:
+            game_servers = [game_server for game_server in game_servers if game_server.port in self.client_connections]
+            if not game_servers:
+                return
+            results = await command_packets.broadcast([self.client_connections[game_server.port] for game_server in game_servers], command_packets.message_frame(message))
+            LOGGER.info(f"Command - Message command sent to {sum(results)}/{len(game_servers)} GameServers.")
+        except Exception:
+            LOGGER.exception(f"An error occurred while handling the {inspect.currentframe().f_code.co_name} function: {traceback.format_exc()}")
+
     async def cmd_custom_command(self, game_server, command, delay = 0):
         try:
             client_connection = self.client_connections.get(game_server.port, None)
@@ -263,14 +265,7 @@ class GameServerManager:
             await asyncio.sleep(delay)
 
             if isinstance(command, list): command = (' ').join(command)
-            command_bytes = GameServerCommands.COMMAND_BYTES.value + command.encode('ascii') + b'\x00'
-            length = len(command_bytes)
-            length_bytes = length.to_bytes(2, byteorder='little')
-
-            # TODO: use client_connection.send_packet() ??
-            client_connection.writer.write(length_bytes)
-            client_connection.writer.write(command_bytes)
-            await client_connection.writer.drain()
+            await client_connection.send_frame(command_packets.console_command_frame(command))
             if get_mqtt():
                 get_mqtt().publish_json("manager/command", {"event_type":"custom_command","command":command})
             LOGGER.info(f"Command - command sent to GameServer #{game_server.id}.")
@@ -284,15 +279,7 @@ class GameServerManager:
             if client_connection is None:
                 return
 
-            command_bytes = b'\x28' + instance_number.to_bytes(1, "little") + port.to_bytes(2, "little") + b'\x00'
-
-            #command_bytes = b'\x28\x01\x11\x27\x00'
-            length = len(command_bytes)
-            length_bytes = length.to_bytes(2, byteorder='little')
-
-            client_connection.writer.write(length_bytes)
-            client_connection.writer.write(command_bytes)
-            await client_connection.writer.drain()
+            await client_connection.send_frame(command_packets.cowmaster_fork_frame(instance_number, port))
 
             LOGGER.info(f"Command - command sent to CowMaster.")
         except Exception:
@@ -319,18 +306,9 @@ class GameServerManager:
         except Exception as e:
             LOGGER.exception(e)
     
-    async def heartbeat(self):
-        while not stop_event.is_set():
-            # Introduce jitter: sleep for a random duration between 0 to 10 seconds
-            jitter = random.uniform(0, 10)
-            await asyncio.sleep(jitter)
-            
-            for _ in range(60):
-                if stop_event.is_set():
-                    return
-                await asyncio.sleep(1)
-            if get_mqtt():
-                get_mqtt().publish_json("manager/status", {"event_type":"heartbeat", **self.manager_status()})
+    def heartbeat(self):
+        if get_mqtt():
+            get_mqtt().publish_json("manager/status", {"event_type":"heartbeat", **self.manager_status()})
     
     def manager_status(self):
         total_free_servers = len([game_server for game_server in self.game_servers.values() if game_server.game_state._state['game_phase'] == GamePhase.IDLE.value])
@@ -411,8 +389,8 @@ class GameServerManager:
         """
 
         # Start the listener for incoming client connections
-        self.game_server_lsnr = await asyncio.start_server(
-            lambda *args, **kwargs: handle_clients(*args, **kwargs, game_server_manager=self),
+        self.game_server_lsnr = await asyncio.get_running_loop().create_server(
+            lambda: GameServerProtocol(game_server_manager=self),
             host, game_server_to_mgr_port
         )
         LOGGER.highlight(f"[*] HoNfigurator Manager - Listening on {host}:{game_server_to_mgr_port} (LOCAL)")
@@ -431,6 +409,7 @@ class GameServerManager:
         await self.game_server_lsnr.wait_closed()
 
         await self.master_server_handler.close_session()
+        log_index.stop()
 
         LOGGER.info("Stopping HoNfigurator manager listener.")
 
@@ -541,15 +520,22 @@ class GameServerManager:
         await self.chat_server_handler.handle_packets()
 
     async def resubmit_match_stats_to_masterserver(self, match_id, file_path):
+        """
+        Resubmit a match stats file to the master server.
+
+        Returns:
+            bool: True if the stats were accepted, False if they should be retried later.
+
+        Raises:
+            HoNServerConnectionError: If there was no response from the master server.
+            HoNStatsRejectedError: If the master server rejected the stats as invalid, or the file can't be decoded.
+            Any other exception is a local error (reading the file, not authenticated yet), and counts as a failed attempt.
+        """
         mserver_stats_response = await self.master_server_handler.send_stats_file(f"{self.global_config['hon_data']['svr_login']}:", hashlib.md5(self.global_config['hon_data']['svr_password'].encode()).hexdigest(), match_id, file_path)
-        if not mserver_stats_response or mserver_stats_response[1] != 200 or mserver_stats_response[0] == '':
-            LOGGER.error(f"[{mserver_stats_response[1] if mserver_stats_response else 'unknown'}] Stats resubmission failed - {file_path}. Response: {mserver_stats_response[0] if mserver_stats_response else 'unknown'}")
-            if mserver_stats_response and mserver_stats_response[1] == 400 and 'title' in mserver_stats_response[0]:
-                if mserver_stats_response[0] == "One or more validation errors occurred.":
-                    try:
-                        shutil.move(file_path, f"{file_path}.failed")
-                    except Exception:
-                        LOGGER.error(traceback.format_exc())
+        if mserver_stats_response[1] != 200 or mserver_stats_response[0] == '':
+            LOGGER.error(f"[{mserver_stats_response[1]}] Stats resubmission failed - {file_path}. Response: {mserver_stats_response[0]}")
+            if mserver_stats_response[1] == 400 and "One or more validation errors occurred." in mserver_stats_response[0]:
+                raise HoNStatsRejectedError(f"[400] {mserver_stats_response[0]}")
             return False
         LOGGER.info(f"{match_id} Stats resubmission successful")
         parsed_mserver_stats_response = phpserialize.loads(mserver_stats_response[0].encode('utf-8'))
@@ -603,6 +589,7 @@ class GameServerManager:
         id = game_server_port - self.global_config['hon_data']['svr_starting_gamePort'] + 1
         game_server = GameServer(id, game_server_port, self.global_config, self.remove_game_server, self.event_bus)
         self.game_servers[game_server_port] = game_server
+        instance_status_feed.add_server(game_server)
         return game_server
 
     def find_next_available_ports(self):
@@ -723,6 +710,8 @@ class GameServerManager:
         self.schedule_task(coro, 'gameserver_startup', override = True)
 
     async def check_for_restart_required(self, game_server='all'):
+        if get_mqtt():
+            get_mqtt().invalidate_metadata()    # config values in the MQTT metadata may have changed
         if game_server == 'all':
             for game_server in self.game_servers.values():
                 if game_server.params_are_different():
@@ -740,6 +729,8 @@ class GameServerManager:
                 game_server.enable_server()
     
     async def config_change_hook_actions(self):
+        # the statuses show configured values, such as the region and ports
+        instance_status_feed.invalidate()
         if not self.global_config['hon_data'].get('man_use_cowmaster') and self.cowmaster.client_connection:
             self.cowmaster.stop_cow_master()
         elif self.global_config['hon_data'].get('man_use_cowmaster') and not self.cowmaster.client_connection:
@@ -756,6 +747,7 @@ class GameServerManager:
         for game_server in running_servers:
             if await self.cmd_shutdown_server(game_server):
                 del self.game_servers[game_server.port]
+                instance_status_feed.remove_server(game_server)
                 servers_removed += 1
                 if servers_removed >= num_servers_to_remove:
                     break
@@ -791,6 +783,7 @@ class GameServerManager:
             if value == game_server and not game_server.started:
                 game_server.cancel_tasks()
                 del self.game_servers[key]
+                instance_status_feed.remove_server(game_server)
                 return True
         return False
 
@@ -806,6 +799,12 @@ class GameServerManager:
         """
         return self.game_servers.get(id)
 
+    def get_active_match_ids(self):
+        """
+        Returns the match IDs the game servers are currently playing, whose match logs are still being written
+        """
+        return [game_server.game_state['current_match_id'] for game_server in self.game_servers.values() if game_server.game_state['current_match_id']]
+
     def get_game_server_by_port(self, game_server_port):
         """
         Returns the game server instance with the specified port
@@ -855,7 +854,7 @@ class GameServerManager:
             #TODO: raise error or happy with logger?
             if port == self.cowmaster.get_port():
                 LOGGER.debug(f"Attempting to locate duplicate CowMaster server. Looking for TCP source port ({client_connection.addr[1]}) and TCP dest port ({self.global_config['hon_data']['svr_managerPort']})")
-                cowmaster_proc = MISC.get_client_pid_by_tcp_source_port(self.global_config['hon_data']['svr_managerPort'], client_connection.addr[1])
+                cowmaster_proc = MISC.get_client_pid_by_tcp_source_port(self.global_config['hon_data']['svr_managerPort'], client_connection.addr[1], fresh=True)
                 if cowmaster_proc:
                     LOGGER.info(f"Found duplicate CowMaster server. Killing process {cowmaster_proc.pid}")
                     cowmaster_proc.terminate()
@@ -876,66 +875,10 @@ class GameServerManager:
             if file_exists:
                 replay_file_path = replay_path
                 return True,replay_file_path
+        return False,None
 
     async def handle_replay_request(self, match_id, extension, account_id):
-        replay_file_name = f"M{match_id}.{extension}"
-        LOGGER.debug(f"Received replay upload request.\n\tFile Name: {replay_file_name}\n\tAccount ID (requestor): {account_id}")
-
-        replay_file_paths = [Path(self.global_config['hon_data']['hon_replays_directory']) / replay_file_name]
-        if self.global_config['application_data']['longterm_storage']['active']:
-            replay_file_paths.append(Path(self.global_config['application_data']['longterm_storage']['location']) / replay_file_name)
-        file_exists,replay_file_path = await self.find_replay_file(replay_file_name)
-
-        if not file_exists:
-            # Send the "does not exist" packet
-            # await self.event_bus.emit('replay_status_update', match_id, account_id, ReplayStatus.DOES_NOT_EXIST)
-            res = await self.chat_server_handler.create_replay_status_update_packet(match_id, account_id, ReplayStatus.DOES_NOT_EXIST)
-            non_existing_paths = [str(path) for path in replay_file_paths]
-            LOGGER.warn(f"Replay file {replay_file_name} does not exist. Checked: {non_existing_paths}")
-            return
-
-        # Send the "exists" packet
-        # await self.event_bus.emit('replay_status_update', match_id, account_id, ReplayStatus.QUEUED)
-        res = await self.chat_server_handler.create_replay_status_update_packet(match_id, account_id, ReplayStatus.QUEUED)
-        LOGGER.debug(f"Replay file exists ({replay_file_name}). Obtaining upload location information.")
-
-        # Upload the file and send status updates as required
-        file_size = os.path.getsize(replay_file_path)
-
-        upload_details = await self.master_server_handler.get_replay_upload_info(match_id, extension, self.global_config['hon_data']['svr_login'], file_size)
-
-        if upload_details is None or upload_details[1] != 200:
-            # await self.event_bus.emit('replay_status_update', match_id, account_id, ReplayStatus.GENERAL_FAILURE)
-            res = await self.chat_server_handler.create_replay_status_update_packet(match_id, account_id, ReplayStatus.GENERAL_FAILURE)
-            LOGGER.error(f"{replay_file_name} - Failed to obtain upload location information. HTTP Response ({upload_details[1]}):\n\t{upload_details[0]}")
-            return
-
-        upload_details_parsed = {key.decode(): (value.decode() if isinstance(value, bytes) else value) for key, value in upload_details[0].items()}
-        LOGGER.debug(f"Uploading {replay_file_name} to {upload_details_parsed['TargetURL']}")
-
-        # await self.event_bus.emit('replay_status_update', match_id, account_id, ReplayStatus.UPLOADING)
-        res = await self.chat_server_handler.create_replay_status_update_packet(match_id, account_id, ReplayStatus.UPLOADING)
-        try:
-            upload_result = await self.master_server_handler.upload_replay_file(replay_file_path, replay_file_name, upload_details_parsed['TargetURL'])
-        except Exception:
-            LOGGER.error(f"Error uploading replay file {replay_file_path}")
-            LOGGER.error(f"Undefined Exception: {traceback.format_exc()}")
-            if get_mqtt():
-                get_mqtt().publish_json("manager/admin", {"event_type":"replay_upload_failure","message":f"failed. Premature failure."})
-
-        if upload_result[1] not in [204,200]:
-            # await self.event_bus.emit('replay_status_update', match_id, account_id, ReplayStatus.GENERAL_FAILURE)
-            res = await self.chat_server_handler.create_replay_status_update_packet(match_id, account_id, ReplayStatus.GENERAL_FAILURE)
-            LOGGER.error(f"Replay upload failed! HTTP Upload Response ({upload_result[1]})\n\t{upload_result[0]}")
-            if get_mqtt():
-                get_mqtt().publish_json("manager/admin", {"event_type":"replay_upload_failure","message":f"failed. HTTP response code: {upload_result[1]}"})
-            return
-        # await self.event_bus.emit('replay_status_update', match_id, account_id, ReplayStatus.UPLOAD_COMPLETE)
-        res = await self.chat_server_handler.create_replay_status_update_packet(match_id, account_id, ReplayStatus.UPLOAD_COMPLETE)
-        LOGGER.debug("Replay upload completed successfully.")
-        if get_mqtt():
-            get_mqtt().publish_json("manager/admin", {"event_type":"replay_upload_success","message":"successful"})
-
+        await self.replay_uploader.handle_replay_request(match_id, extension, account_id)
 
     async def remove_client_connection(self,client_connection):
         """
@@ -1037,8 +980,10 @@ class GameServerManager:
             if game_servers == "all":
                 game_servers = list(self.game_servers.values())
 
+            # one scan of the socket table for every server's game port. The voice port checks share that scan while it's under fresh_ttl old
+            resolved_ports = MISC.resolve_ports([game_server.port for game_server in game_servers])
             for game_server in game_servers:
-                already_running = await game_server.get_running_server()
+                already_running = await game_server.get_running_server(resolved_ports=resolved_ports)
                 if already_running:
                     LOGGER.info(f"GameServer #{game_server.id} with public ports {game_server.get_public_game_port()}/{game_server.get_public_voice_port()} already running.")
 
@@ -1090,127 +1035,8 @@ class GameServerManager:
             if not launch:
                 raise
 
-    async def patch_extract_crc_from_file(self, url):
-        try:
-            with urllib.request.urlopen(url) as response:
-                content = response.read().decode('utf-8')
-            # sample: 4.10.8.0;4.10.8.honpatch;B30B80D1;hon_update_x64.zip;4DFDFDD5
-            components = content.strip().split(';')
-            version = components[0]
-            patch = components[1]
-            hon_exe_crc = components[2]
-            filename = components[3]
-            hon_update_exe_crc = components[-1]
-            return hon_update_exe_crc
-
-        except Exception as e:
-            LOGGER.error(f"URL: {url} - Error occurred while extracting CRC from file: {e}")
-            return None
-
     async def initialise_patching_procedure(self, timeout=300, source='startup'):
-        if self.patching:
-            LOGGER.warn("Patching is already in progress.")
-            return
-
-        for game_server in self.game_servers.values():
-            LOGGER.debug(f"GameServer #{game_server.id} - Initialising server shutdown for patching")
-            if game_server.started and game_server.enabled:
-                await self.cmd_message_server(game_server, "!! ANNOUNCEMENT !! This server will shutdown after the current match for patching.")
-            await self.cmd_shutdown_server(game_server)
-
-        if MISC.get_proc(self.global_config['hon_data']['hon_executable_name']):
-            LOGGER.debug("Some HoN servers are still running. Waiting until they've shut down.")
-            return
-        
-        if MISC.get_os_platform() == "win32":
-            launcher_binary = 'hon_update_x64.exe'
-            launcher_zip = 'hon_update_x64.zip'
-            hon_version_url = HON_WAS_VERSION_URL
-            launcher_download_url = HON_WAS_LAUNCHER_DOWNLOAD_URL
-        else:
-            launcher_binary = 'launcher'
-            launcher_zip = 'launcher.zip'
-            hon_version_url = HON_LAS_VERSION_URL
-            launcher_download_url = HON_LAS_LAUNCHER_DOWNLOAD_URL
-
-        launcher_crc = await self.patch_extract_crc_from_file(hon_version_url)
-        if not launcher_crc:
-            LOGGER.error("Patching failed.")
-            return False
-        if (not exists(self.global_config['hon_data']['hon_install_directory'] / launcher_binary)) or (launcher_crc and launcher_crc.lower() != MISC.calculate_crc32(self.global_config['hon_data']['hon_install_directory'] / launcher_binary).lower()):
-            LOGGER.debug(f"Beginning to download new launcher from {launcher_download_url}")
-            try:
-                temp_folder = tempfile.TemporaryDirectory()
-                temp_path = temp_folder.name
-                temp_zip_path = Path(temp_path) / launcher_zip
-
-                download_launcher = urllib.request.urlretrieve(launcher_download_url, temp_zip_path)
-                if not download_launcher:
-                    LOGGER.warn(f"Newer {launcher_zip} is available, however the download failed.\n\t1. Please download the file manually: {launcher_download_url}\n\t2. Unzip the file into {self.global_config['hon_data']['hon_install_directory']}")
-                    return
-
-                temp_extracted_path = temp_folder.name
-                extracted_file_name = MISC.unzip_file(source_zip=temp_zip_path, dest_unzip=temp_extracted_path)
-
-                temp_extracted_launcher_path = Path(temp_path) / extracted_file_name[0]
-
-                launcher_binary_path = self.global_config['hon_data']['hon_install_directory'] / launcher_binary
-
-                LOGGER.debug(f"Downloaded launcher files: {os.listdir(temp_extracted_path)}")
-
-                # Check if the file is in use before moving it
-                try:
-                    shutil.move(temp_extracted_launcher_path, launcher_binary_path)
-                    LOGGER.debug(f"Moved extracted launcher to HoN working directory: {launcher_binary_path}")
-                except PermissionError:
-                    LOGGER.warn(f"Hon Update - the file {self.global_config['hon_data']['hon_install_directory'] / launcher_zip} is currently in use. Closing the file..")
-                    process = MISC.get_proc(proc_name=launcher_zip)
-                    if process: process.terminate()
-                    try:
-                        shutil.move(temp_extracted_launcher_path, launcher_binary_path)
-                    except Exception:
-                        LOGGER.error(f"HoN Update - Failed to copy downloaded {launcher_binary} into {self.global_config['hon_data']['hon_install_directory']}\n\t1. Please download the file manually: {launcher_download_url}\n\t2. Unzip the file into {self.global_config['hon_data']['hon_install_directory']}")
-                        return
-
-            except Exception as e:
-                LOGGER.error(f"Error occurred during file download or extraction: {e}")
-
-        patcher_executable = self.global_config['hon_data']['hon_install_directory'] / launcher_binary
-        try:
-            if MISC.get_os_platform() == "win32":
-                subprocess.run([patcher_executable, "-norun"], timeout=timeout)
-            else:
-                os.chmod(patcher_executable, 0o700)
-                subprocess.run([patcher_executable], timeout=timeout)
-
-            if MISC.get_os_platform() == "linux":
-                executable = "hon-x86_64-server_KONGOR"
-                if not os.path.exists(self.global_config['hon_data']['hon_install_directory'] / executable):
-                    executable = "hon-x86_64-server"
-                self.global_config['hon_data']['hon_executable_path'] = self.global_config['hon_data']['hon_install_directory'] / executable
-                self.global_config['hon_data']['hon_executable_name'] = executable
-
-            svr_version = MISC.get_svr_version(self.global_config['hon_data']['hon_executable_path'])
-            if MISC.get_svr_version(self.global_config['hon_data']['hon_executable_path']) != self.latest_available_game_version:
-                LOGGER.error(f"Server patching failed. Current version: {svr_version}")
-                return False
-
-            LOGGER.info("Patching successful!")
-            self.global_config['hon_data']['svr_version'] = svr_version
-            if source == "startup":
-                return True
-            elif source == "healthcheck":
-                await self.start_game_servers("all")
-
-        except subprocess.TimeoutExpired:
-            LOGGER.warn(f"Patching failed as it exceeded {timeout} seconds to patch resources.")
-            return False
-        except Exception:
-            LOGGER.error(f"An unexpected error occured while patching: {traceback.format_exc()}")
-            return False
-        finally:
-            # patching is done. Whether it failed or otherwise.
-            self.patching = False
+        return await self.patch_orchestrator.run(timeout=timeout, source=source)
 
     async def disable_game_server(self, game_server):
         game_server.disable_server()
@@ -0,0 +1,402 @@
+import traceback
+import asyncio
+import time
+from collections import namedtuple, deque
+from cogs.misc.logger import get_logger
+from cogs.TCP.packet_parser import PlayerStatus
+
+LOGGER = get_logger()
+
+_MISSING = object()
+
+RosterChanges = namedtuple('RosterChanges', ['joined', 'left', 'updated'])
+
+class ChangeSetQueue:
+    """
+        The change sets waiting for one coroutine listener. A single consumer task delivers them, one change set after the other,
+        so a listener which awaits never has a later change set interleaved with an earlier one. The task runs while there are
+        change sets queued, and is started again by the next one.
+    """
+    __slots__ = ('callback', 'game_state_id', 'pending', 'task')
+
+    def __init__(self, callback, game_state_id):
+        self.callback = callback
+        self.game_state_id = game_state_id
+        self.pending = deque()
+        self.task = None
+
+    def put(self, changes):
+        self.pending.append(changes)
+        if self.task is None:
+            self.task = asyncio.create_task(self._consume())
+
+    async def _consume(self):
+        try:
+            while self.pending:
+                for key, value, old_value in self.pending.popleft():
+                    try:
+                        await self.callback(key, value, old_value)
+                    except Exception:
+                        LOGGER.error(f"GameServer #{self.game_state_id} - Error handling state change '{key}': {traceback.format_exc()}")
+        finally:
+            self.task = None
+
+class GameState:
+    """
+        Live state of a game server instance, as reported by the 0x42 status packets and the manager.
+
+        The nested dictionaries in _state / _performance are kept as the backing storage, since they are read directly
+        across the code base (API, MQTT, web UI). Writes go through update(), which carries the dotted path of each
+        value down the recursion instead of searching the tree for it, and checks it against a frozenset of monitored keys.
+        Every nested value written is also recorded in a path index (dotted path -> containing dict) so that lookups such as
+        game_state['match_info.mode'] resolve in constant time.
+
+        Changes to monitored keys are not dispatched immediately. They are queued, so that all the changes caused by one
+        packet form a single change set, which is dispatched once on the next event loop tick. Listeners receive the
+        changes in the order they were made. Coroutine listeners are fed through a ChangeSetQueue, so change sets reach them
+        strictly in order even when they await, plain functions are called inline.
+
+        Any change at all, monitored or not, increments revision. Revision listeners are called once per event loop tick after the state
+        changed, with the GameState, so views rendered from the whole state (the web UI status) only need rebuilding when it has.
+    """
+    __slots__ = ('_state', '_performance', '_listeners', '_paths', 'id', 'local_config',
+                 '_pending_changes', '_pending_since', '_dispatch_handle', 'dispatch_stats',
+                 'revision', '_revision_listeners', '_revision_handle')
+
+    MONITORED_KEYS = frozenset(["match_started", "match_info.mode", "game_phase", "players", "status"])
+
+    def __init__(self, id, local_config):
+        self._state = {}
+        self._performance = {}
+        self._listeners = []
+        self._paths = {"state": {}, "performance": {}}
+        self.id = id
+        self.local_config = local_config
+        self._pending_changes = []
+        self._pending_since = 0
+        self._dispatch_handle = None
+        self.revision = 0
+        self._revision_listeners = []
+        self._revision_handle = None
+        self.dispatch_stats = {
+            'change_sets_dispatched': 0,
+            'changes_dispatched': 0,
+            'queue_depth': 0,
+            'max_queue_depth': 0,
+            'last_dispatch_latency_ms': 0,
+            'max_dispatch_latency_ms': 0,
+            'total_dispatch_latency_ms': 0
+        }
+
+    def _target(self, dict_to_check):
+        return self._state if dict_to_check == "state" else self._performance
+
+    def __getitem__(self, key, dict_to_check="state"):
+        target_dict = self._target(dict_to_check)
+        if key in target_dict:
+            return target_dict[key]
+        container = self._paths[dict_to_check].get(key)
+        if container is not None:
+            return container[key.rsplit(".", 1)[1]]
+        value = target_dict
+        for part in key.split("."):
+            if not isinstance(value, dict) or part not in value:
+                raise KeyError(key)
+            value = value[part]
+        return value
+
+    def __setitem__(self, key, value, dict_to_check="state"):
+        target_dict = self._target(dict_to_check)
+        container = target_dict
+        leaf = key
+        if key not in target_dict and "." in key:
+            container = self._paths[dict_to_check].get(key)
+            if container is None:
+                container = self._container_for(key, dict_to_check)
+            leaf = key.rsplit(".", 1)[1]
+        old_value = container.get(leaf)
+        container[leaf] = value
+        if old_value != value:
+            self.touch()
+        self._emit_event(key, value, old_value)
+
+    def _container_for(self, path, dict_to_check):
+        """ Create (if necessary) the nested dictionaries for a dotted path and index it. """
+        container = self._target(dict_to_check)
+        parts = path.split(".")
+        for part in parts[:-1]:
+            child = container.get(part)
+            if not isinstance(child, dict):
+                child = container[part] = {}
+            container = child
+        self._paths[dict_to_check][path] = container
+        return container
+
+    def get(self, key, default=None, dict_to_check="state"):
+        try:
+            return self.__getitem__(key, dict_to_check)
+        except KeyError:
+            return default
+
+    def update(self, data, dict_to_check="state"):
+        monitored_keys = self.MONITORED_KEYS if dict_to_check == "state" else ()
+        if self._update_level(data, self._target(dict_to_check), "", monitored_keys, self._paths[dict_to_check]):
+            self.touch()
+
+    def _update_level(self, data, current_level, prefix, monitored_keys, paths):
+        """ Returns whether any value changed. """
+        changed = False
+        for key, value in data.items():
+            full_key = prefix + key if prefix else key
+            if isinstance(value, dict):
+                child = current_level.get(key)
+                if not isinstance(child, dict):
+                    child = current_level[key] = {}
+                    changed = True
+                if self._update_level(value, child, full_key + ".", monitored_keys, paths):
+                    changed = True
+                continue
+
+            if prefix:
+                paths[full_key] = current_level
+
+            old_value = current_level.get(key, _MISSING)
+            current_level[key] = value
+            if old_value is _MISSING or old_value != value:
+                changed = True
+                if full_key in monitored_keys:
+                    self._emit_event(full_key, value, None if old_value is _MISSING else old_value)
+        return changed
+
+    def add_listener(self, callback):
+        self._listeners.append((callback, ChangeSetQueue(callback, self.id) if asyncio.iscoroutinefunction(callback) else None))
+
+    def add_revision_listener(self, callback):
+        self._revision_listeners.append(callback)
+
+    def remove_revision_listener(self, callback):
+        if callback in self._revision_listeners:
+            self._revision_listeners.remove(callback)
+
+    def touch(self):
+        """ Record that the state changed. Also called by the game server for what it shows alongside the state, such as a scheduled shutdown. """
+        self.revision += 1
+        if not self._revision_listeners or self._revision_handle is not None:
+            return
+        try:
+            self._revision_handle = asyncio.get_running_loop().call_soon(self._dispatch_revision)
+        except RuntimeError:
+            # no event loop yet, while the game server is being created
+            pass
+
+    def _dispatch_revision(self):
+        self._revision_handle = None
+        for listener in self._revision_listeners:
+            try:
+                listener(self)
+            except Exception:
+                LOGGER.error(f"GameServer #{self.id} - Error handling state revision: {traceback.format_exc()}")
+
+    def _emit_event(self, key, value, old_value):
+        if not self._listeners:
+            return
+        if not self._pending_changes:
+            self._pending_since = time.perf_counter()
+        self._pending_changes.append((key, value, old_value))
+
+        depth = len(self._pending_changes)
+        self.dispatch_stats['queue_depth'] = depth
+        if depth > self.dispatch_stats['max_queue_depth']:
+            self.dispatch_stats['max_queue_depth'] = depth
+
+        if self._dispatch_handle is None:
+            self._dispatch_handle = asyncio.get_running_loop().call_soon(self._dispatch)
+
+    def _dispatch(self):
+        changes = self._pending_changes
+        self._pending_changes = []
+        self._dispatch_handle = None
+
+        latency_ms = (time.perf_counter() - self._pending_since) * 1000
+        self.dispatch_stats['queue_depth'] = 0
+        self.dispatch_stats['change_sets_dispatched'] += 1
+        self.dispatch_stats['changes_dispatched'] += len(changes)
+        self.dispatch_stats['last_dispatch_latency_ms'] = latency_ms
+        self.dispatch_stats['total_dispatch_latency_ms'] += latency_ms
+        if latency_ms > self.dispatch_stats['max_dispatch_latency_ms']:
+            self.dispatch_stats['max_dispatch_latency_ms'] = latency_ms
+
+        for listener, queue in self._listeners:
+            if queue is not None:
+                queue.put(changes)
+            else:
+                for key, value, old_value in changes:
+                    try:
+                        listener(key, value, old_value)
+                    except Exception:
+                        LOGGER.error(f"GameServer #{self.id} - Error handling state change '{key}': {traceback.format_exc()}")
+
+    def default_state(self):
+        return {
+            'instance_id':self.id,
+            'instance_name': self.local_config['name'],
+            'local_game_port': self.local_config['params']['svr_port'],
+            'remote_game_port': self.local_config['params']['svr_proxyPort'],
+            'local_voice_port': self.local_config['params']['svr_proxyLocalVoicePort'],
+            'remote_voice_port': self.local_config['params']['svr_proxyRemoteVoicePort'],
+            'proxy_enabled': self.local_config['params']['man_enableProxy'],
+            'svr_affinity': self.local_config['params']['host_affinity'],
+            'status': -1,
+            'uptime': 0,
+            'num_clients': 0,
+            'match_started': 0,
+            'game_phase': 0,
+            'current_match_id': 0,
+            'players': [],
+            'match_info':{
+                'map':None,
+                'mode':None,
+                'name':None,
+                'match_id':None,
+                'start_time': 0,
+                'duration':0
+            }
+        }
+
+    def default_performance(self):
+        return {
+            "now_ingame_skipped_frames": 0,
+            "total_ingame_skipped_frames": 0
+        }
+
+    def clear(self, dict_to_check=None):
+        if dict_to_check is None or dict_to_check == "state":
+            self.update(self.default_state(), dict_to_check="state")
+        if dict_to_check is None or dict_to_check == "performance":
+            self.update(self.default_performance(), dict_to_check="performance")
+
+class CowState(GameState):
+    """ State of the cow master. It reports the same status packets as a game server, but has no players or affinity. """
+    __slots__ = ()
+
+    MONITORED_KEYS = frozenset(["match_started", "match_info.mode", "game_phase"])
+
+    def default_state(self):
+        return {
+            'instance_id':self.id,
+            'instance_name': self.local_config['name'],
+            'local_game_port': self.local_config['params']['svr_port'],
+            'remote_game_port': self.local_config['params']['svr_proxyPort'],
+            'local_voice_port': self.local_config['params']['svr_proxyLocalVoicePort'],
+            'remote_voice_port': self.local_config['params']['svr_proxyRemoteVoicePort'],
+            'proxy_enabled': self.local_config['params']['man_enableProxy'],
+            'status': None,
+            'uptime': None,
+            'num_clients': None,
+            'match_started': None,
+            'game_phase': None,
+            'current_match_id': None,
+            'players': [],
+            'match_info':{
+                'map':None,
+                'mode':None,
+                'name':None,
+                'match_id':None,
+                'start_time': 0,
+                'duration':0
+            }
+        }
+
+class PlayerRoster:
+    """
+        Index of the connected players of a game server, keyed by account_id.
+
+        Each call to diff() takes the new player list from the status packets, and reports which players joined, left,
+        or had any of their details change (including pings), in a single pass over the old and new lists.
+        Updated players are reported as (old, new) record pairs.
+    """
+    __slots__ = ('players',)
+
+    def __init__(self):
+        self.players = {}
+
+    def diff(self, players):
+        current = {}
+        joined = []
+        updated = []
+        previous = self.players
+        for player in players:
+            record = player if isinstance(player, PlayerStatus) else PlayerStatus(**player)
+            current[record.account_id] = record
+            old = previous.get(record.account_id)
+            if old is None:
+                joined.append(record)
+            elif old != record:
+                updated.append((old, record))
+        left = [record for account_id, record in previous.items() if account_id not in current]
+        self.players = current
+        return RosterChanges(joined, left, updated)
+
+    def clear(self):
+        self.players = {}
+
+class SkippedFrameHistory:
+    """
+        Time ordered history of the skipped frame (0x43) packets of a game server, covering the last day.
+
+        Raw points are kept in a bounded deque, and expired from the left as new points arrive and whenever the history is read,
+        so each packet costs amortised O(1). A second deque keeps an aggregate per minute (number of packets, total and max skipped msec),
+        which the API serves with per_minute=true, instead of the day's worth of raw points it serves by default.
+        A server lagging badly enough to send more than capacity points in a day loses its oldest points early. Those are counted in
+        dropped, and logged once.
+    """
+    __slots__ = ('id', 'window', 'points', 'minutes', 'dropped')
+
+    def __init__(self, id, window=86400, capacity=50000):
+        self.id = id
+        self.window = window
+        self.points = deque(maxlen=capacity)
+        self.minutes = deque(maxlen=window // 60 + 1)
+        self.dropped = 0
+
+    def add(self, timestamp, frames):
+        self.expire(timestamp)
+        points = self.points
+        if len(points) == points.maxlen:
+            if not self.dropped:
+                LOGGER.warning(f"GameServer #{self.id} - More than {points.maxlen} skipped frame packets in the last {self.window} seconds, dropping the oldest from the history.")
+            self.dropped += 1
+        points.append((timestamp, frames))
+
+        minute = int(timestamp // 60 * 60)
+        if self.minutes and self.minutes[-1][0] == minute:
+            aggregate = self.minutes[-1]
+            aggregate[1] += 1
+            aggregate[2] += frames
+            if frames > aggregate[3]:
+                aggregate[3] = frames
+        else:
+            self.minutes.append([minute, 1, frames, frames])
+
+    def expire(self, now):
+        oldest = now - self.window
+        points = self.points
+        while points and points[0][0] < oldest:
+            points.popleft()
+        minutes = self.minutes
+        while minutes and minutes[0][0] + 60 <= oldest:
+            minutes.popleft()
+
+    def to_dict(self):
+        """ Raw points as {timestamp: skipped msec}, the format previously stored in 'skipped_frames_detailed'. """
+        self.expire(time.time())
+        return dict(self.points)
+
+    def per_minute(self):
+        self.expire(time.time())
+        return {minute: {'count': count, 'skipped_frames': total, 'max_skipped_frames': maximum} for minute, count, total, maximum in self.minutes}
+
+    def clear(self):
+        self.points.clear()
+        self.minutes.clear()
+        self.dropped = 0
@@ -1,57 +1,185 @@
 import re
+import os
+import codecs
+import asyncio
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from cogs.misc.logger import get_logger, get_misc
+
+LOGGER = get_logger()
+MISC = get_misc()
+
+READ_CHUNK_SIZE = 256 * 1024
+
+class MatchLogFollower:
+    """
+        Follows a match (or slave) log while it's written, remembering the byte offset read up to.
+
+        Each update() reads and decodes only the bytes appended since the last one, and parses the complete lines among them. Lobby info,
+        the player roster, chat messages and player IPs are kept in memory, so repeated queries during a match cost O(new bytes) rather
+        than re-reading the whole log. If the log shrinks (a new log with the same name), it's read again from the start.
+        Thread safe, as the API's synchronous endpoints run in a thread pool.
+    """
+    chat_pattern = re.compile(r'PLAYER_CHAT player:(\d+) target:"(\w+)" msg:"(.*?)"')
+    player_pattern = re.compile(r'PLAYER_CONNECT player:(\d+) name:"(.*?)" id:(\d+) psr:(\d+\.\d+)')
+    match_name_pattern = re.compile(r'INFO_MATCH name:"([^"]+)"')
+    map_name_pattern = re.compile(r'INFO_MAP name:"([^"]+)"')
+    map_mode_pattern = re.compile(r'INFO_SETTINGS mode:"([^"]+)"')
+    match_date_pattern = re.compile(r'INFO_DATE date:"([^"]+)" time:"([^"]+)"')
+    name_pattern = re.compile(r'Name: (.+)')
+    ip_pattern = re.compile(r'IP: (.+)')
+
+    def __init__(self, log_path):
+        self.log_path = Path(log_path)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.decoder = None
+        self.partial = ''
+        self.lines_parsed = 0
+        self.match_name = None
+        self.map_name = None
+        self.map_mode = None
+        self.match_date = None
+        self.player_details = {}
+        self.chat_messages = {}
+        self.names = []
+        self.ips = []
+
+    def detect_encoding(self, head):
+        """ Match logs are UTF-16 LE on Windows, and may be on Linux too, otherwise UTF-8. """
+        if head.startswith(codecs.BOM_UTF16_LE) or MISC.get_os_platform() == "win32" or b'\x00' in head[:64]:
+            return 'utf-16-le'
+        return 'utf-8'
+
+    def update(self):
+        """
+        Parse anything appended to the log since the last update.
+
+        Returns:
+            bool: False if the log doesn't exist.
+        """
+        with self.lock:
+            try:
+                size = os.path.getsize(self.log_path)
+            except FileNotFoundError:
+                return False
+            if size < self.offset:
+                LOGGER.debug(f"{self.log_path.name} is smaller than when last read, reading it again.")
+                self.reset()
+            if size == self.offset:
+                return True
+
+            with open(self.log_path, 'rb') as file:
+                file.seek(self.offset)
+                while chunk := file.read(READ_CHUNK_SIZE):
+                    if self.decoder is None:
+                        self.decoder = codecs.getincrementaldecoder(self.detect_encoding(chunk))(errors='replace')
+                    self.offset += len(chunk)
+                    self.parse_text(self.decoder.decode(chunk))
+            return True
+
+    def parse_text(self, text):
+        lines = (self.partial + text).split('\n')
+        # the last line is incomplete until a newline is written after it
+        self.partial = lines.pop()
+        for line in lines:
+            self.parse_line(line.lstrip('\ufeff').rstrip('\r'))
+        self.lines_parsed += len(lines)
+
+    def parse_line(self, line):
+        if self.match_name is None and (match := self.match_name_pattern.search(line)):
+            self.match_name = match.group(1)
+        if self.map_name is None and (match := self.map_name_pattern.search(line)):
+            self.map_name = match.group(1)
+        if self.map_mode is None and (match := self.map_mode_pattern.search(line)):
+            self.map_mode = match.group(1)
+        if self.match_date is None and (match := self.match_date_pattern.search(line)):
+            self.match_date = f"{match.group(1)} {match.group(2)}"
+
+        if match := self.player_pattern.search(line):
+            player_id, player_name, player_id_num, psr = match.groups()
+            self.player_details[player_id] = {
+                'name': player_name,
+                'id': player_id_num,
+                'psr': float(psr)
+            }
+        if match := self.chat_pattern.search(line):
+            player_id, target, message = match.groups()
+            self.chat_messages.setdefault(player_id, []).append((target, message))
+        if match := self.name_pattern.search(line):
+            self.names.append(match.group(1))
+        if match := self.ip_pattern.search(line):
+            self.ips.append(match.group(1))
+
+    async def refresh(self):
+        """ update() in a worker thread. """
+        return await asyncio.to_thread(self.update)
+
+    def get_lobby_info(self):
+        return {
+            'map': self.map_name.lower() if self.map_name else None,
+            'name': self.match_name.lower() if self.match_name else None,
+            'mode': self.map_mode.replace('Mode_','').lower() if self.map_mode else None
+        }
+
+    def get_chat(self):
+        with self.lock:
+            return {player_id: list(messages) for player_id, messages in self.chat_messages.items()}, dict(self.player_details)
+
+    def get_player_ips(self):
+        """ (name, ip) pairs, from the Name: and IP: lines of a slave log. """
+        with self.lock:
+            return list(zip(self.names, self.ips))
+
+class MatchLogFollowers:
+    """ The followers of recently read logs, so each log is only parsed once. The least recently used are dropped beyond max_followers. """
+    def __init__(self, max_followers=64):
+        self.max_followers = max_followers
+        self.followers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, log_path):
+        log_path = Path(log_path)
+        with self.lock:
+            follower = self.followers.get(log_path)
+            if follower is None:
+                follower = self.followers[log_path] = MatchLogFollower(log_path)
+                while len(self.followers) > self.max_followers:
+                    self.followers.popitem(last=False)
+            else:
+                self.followers.move_to_end(log_path)
+            return follower
+
+    def release(self, log_path):
+        with self.lock:
+            self.followers.pop(Path(log_path), None)
+
+match_log_followers = MatchLogFollowers()
 
 class MatchParser:
     def __init__(self, match_id, log_path):
         self.match_id = match_id
         self.log_path = log_path
-        self.player_details = {}
-        
-        # Pre-compile regex patterns
-        self.chat_pattern = re.compile(r'PLAYER_CHAT player:(\d+) target:"(\w+)" msg:"(.*?)"')
-        self.player_pattern = re.compile(r'PLAYER_CONNECT player:(\d+) name:"(.*?)" id:(\d+) psr:(\d+\.\d+)')
+        self.follower = match_log_followers.get(log_path)
 
     def parse_chat(self):
-        chat_messages = {}
-
         try:
-            with open(self.log_path, 'r', encoding='utf-16-le') as file:
-                for line in file:  # Process file line-by-line
-                    self._parse_player_line(line)
-                    self._parse_chat_line(line, chat_messages)
-        except FileNotFoundError:
-            print(f"File not found: {self.log_path}")
+            if not self.follower.update():
+                print(f"File not found: {self.log_path}")
         except Exception as e:
             print(f"An error occurred: {str(e)}")
-        
-        return chat_messages, self.player_details
+
+        return self.follower.get_chat()
 
     def parse_player_ids(self):
         try:
-            with open(self.log_path, 'r', encoding='utf-16-le') as file:
-                for line in file:
-                    self._parse_player_line(line)
-        except FileNotFoundError:
-            print(f"File not found: {self.log_path}")
+            if not self.follower.update():
+                print(f"File not found: {self.log_path}")
         except Exception as e:
             print(f"An error occurred: {str(e)}")
-        
-        return self.player_details
-        
-    
-    def _parse_player_line(self, line):
-        match = self.player_pattern.search(line)
-        if match:
-            player_id, player_name, player_id_num, psr = match.groups()
-            self.player_details[player_id] = {
-                'name': player_name,
-                'id': player_id_num,
-                'psr': float(psr)
-            }
 
-    def _parse_chat_line(self, line, chat_messages):
-        match = self.chat_pattern.search(line)
-        if match:
-            player_id, target, message = match.groups()
-            if player_id not in chat_messages:
-                chat_messages[player_id] = []
-            chat_messages[player_id].append((target, message))
+        return self.follower.get_chat()[1]
@@ -0,0 +1,268 @@
+import traceback
+import asyncio
+import tempfile
+import shutil
+import os
+import zipfile
+import aiohttp
+import aiofiles
+from datetime import datetime
+from pathlib import Path
+from os.path import exists
+from cogs.handlers.events import PatchPhase
+from cogs.misc.logger import get_logger, get_misc, get_mqtt
+
+LOGGER = get_logger()
+MISC = get_misc()
+
+HON_WAS_VERSION_URL = "http://gitea.kongor.online/administrator/KONGOR/raw/branch/main/patch/was-crIac6LASwoafrl8FrOa/x86_64/version.cfg"
+HON_WAS_LAUNCHER_DOWNLOAD_URL = "http://gitea.kongor.online/administrator/KONGOR/raw/branch/main/patch/was-crIac6LASwoafrl8FrOa/x86_64/hon_update_x64.zip"
+HON_LAS_VERSION_URL = "http://gitea.kongor.online/administrator/KONGOR/raw/branch/main/patch/las-crIac6LASwoafrl8FrOa/x86-biarch/version.cfg"
+HON_LAS_LAUNCHER_DOWNLOAD_URL = "http://gitea.kongor.online/administrator/KONGOR/raw/branch/main/patch/las-crIac6LASwoafrl8FrOa/x86-biarch/launcher.zip"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class PatchProgress:
+    """
+        The phase of the current (or last) patch, for the API.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self, source=None):
+        self.phase = PatchPhase.IDLE
+        self.source = source
+        self.message = None
+        self.started = None
+        self.finished = None
+        self.downloaded_bytes = 0
+        self.download_size = None
+        self.servers_running = 0
+        self.history = []
+
+    def start(self, source):
+        self.reset(source)
+        self.started = datetime.now()
+
+    def set_phase(self, phase, message=None):
+        self.phase = phase
+        self.message = message
+        self.history.append({"phase": phase.value, "time": datetime.now().isoformat(), "message": message})
+        if phase in (PatchPhase.COMPLETE, PatchPhase.FAILED, PatchPhase.WAITING_FOR_SERVERS):
+            self.finished = datetime.now()
+        LOGGER.debug(f"Patching - {phase.value}{f': {message}' if message else ''}")
+        if get_mqtt():
+            get_mqtt().publish_json("manager/admin", {"event_type": "patch_phase", "phase": phase.value, "message": message})
+
+    def to_dict(self):
+        return {
+            "phase": self.phase.value,
+            "source": self.source,
+            "message": self.message,
+            "started": self.started.isoformat() if self.started else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "downloaded_bytes": self.downloaded_bytes,
+            "download_size": self.download_size,
+            "servers_running": self.servers_running,
+            "history": self.history
+        }
+
+patch_progress = PatchProgress()
+
+class PatchOrchestrator:
+    """
+        Patches the HoN server without blocking the event loop, so the API and game server connections stay responsive throughout.
+
+        Shutdown commands go to every game server concurrently. The version file and launcher are fetched with aiohttp, the launcher is
+        streamed to disk, CRCs and extraction run in a worker thread, and the patcher runs as an asyncio subprocess.
+        Progress is recorded in patch_progress.
+    """
+    def __init__(self, manager, version_url=None, launcher_url=None, progress=patch_progress):
+        self.manager = manager
+        self.version_url = version_url
+        self.launcher_url = launcher_url
+        self.progress = progress
+
+    def get_launcher_details(self):
+        """ Returns (launcher_binary, launcher_zip, version_url, launcher_download_url) for this platform. """
+        if MISC.get_os_platform() == "win32":
+            details = ['hon_update_x64.exe', 'hon_update_x64.zip', HON_WAS_VERSION_URL, HON_WAS_LAUNCHER_DOWNLOAD_URL]
+        else:
+            details = ['launcher', 'launcher.zip', HON_LAS_VERSION_URL, HON_LAS_LAUNCHER_DOWNLOAD_URL]
+        if self.version_url: details[2] = self.version_url
+        if self.launcher_url: details[3] = self.launcher_url
+        return details
+
+    async def extract_crc_from_file(self, session, url):
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                content = await response.text()
+            # sample: 4.10.8.0;4.10.8.honpatch;B30B80D1;hon_update_x64.zip;4DFDFDD5
+            components = content.strip().split(';')
+            hon_update_exe_crc = components[-1]
+            return hon_update_exe_crc
+
+        except Exception as e:
+            LOGGER.error(f"URL: {url} - Error occurred while extracting CRC from file: {e}")
+            return None
+
+    async def download(self, session, url, destination):
+        """ Stream url to destination, recording progress. Returns True once the whole file is written. """
+        async with session.get(url) as response:
+            response.raise_for_status()
+            self.progress.download_size = response.content_length
+            self.progress.downloaded_bytes = 0
+            async with aiofiles.open(destination, 'wb') as file:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    await file.write(chunk)
+                    self.progress.downloaded_bytes += len(chunk)
+        return self.progress.download_size is None or self.progress.downloaded_bytes == self.progress.download_size
+
+    async def shutdown_servers(self):
+        game_servers = list(self.manager.game_servers.values())
+        await self.manager.cmd_message_servers([game_server for game_server in game_servers if game_server.started and game_server.enabled], "!! ANNOUNCEMENT !! This server will shutdown after the current match for patching.")
+        LOGGER.debug(f"Initialising shutdown of {len(game_servers)} GameServers for patching")
+        await asyncio.gather(*[self.manager.cmd_shutdown_server(game_server) for game_server in game_servers])
+
+    async def install_launcher(self, session, launcher_binary, launcher_zip, launcher_download_url):
+        """ Download the launcher and move it into the install directory. Returns True once installed, False if the download, the extraction or the move failed. """
+        install_directory = self.manager.global_config['hon_data']['hon_install_directory']
+        with tempfile.TemporaryDirectory() as temp_path:
+            temp_zip_path = Path(temp_path) / launcher_zip
+
+            self.progress.set_phase(PatchPhase.DOWNLOADING, launcher_download_url)
+            try:
+                downloaded = await self.download(session, launcher_download_url, temp_zip_path)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                LOGGER.error(f"Error occurred during file download: {e}")
+                downloaded = False
+            if not downloaded:
+                LOGGER.warn(f"Newer {launcher_zip} is available, however the download failed.\n\t1. Please download the file manually: {launcher_download_url}\n\t2. Unzip the file into {install_directory}")
+                return False
+
+            self.progress.set_phase(PatchPhase.EXTRACTING)
+            try:
+                extracted_file_name = await asyncio.to_thread(MISC.unzip_file, source_zip=temp_zip_path, dest_unzip=temp_path)
+                temp_extracted_launcher_path = Path(temp_path) / extracted_file_name[0]
+            except (zipfile.BadZipFile, IndexError, OSError) as e:
+                LOGGER.error(f"HoN Update - the downloaded {launcher_zip} could not be extracted ({e.__class__.__name__}: {e})\n\t1. Please download the file manually: {launcher_download_url}\n\t2. Unzip the file into {install_directory}")
+                return False
+            launcher_binary_path = install_directory / launcher_binary
+            LOGGER.debug(f"Downloaded launcher files: {os.listdir(temp_path)}")
+
+            # Check if the file is in use before moving it
+            try:
+                await asyncio.to_thread(shutil.move, temp_extracted_launcher_path, launcher_binary_path)
+                LOGGER.debug(f"Moved extracted launcher to HoN working directory: {launcher_binary_path}")
+            except PermissionError:
+                LOGGER.warn(f"Hon Update - the file {install_directory / launcher_zip} is currently in use. Closing the file..")
+                for process in MISC.get_proc(proc_name=launcher_zip, refresh=True):
+                    process.terminate()
+                try:
+                    await asyncio.to_thread(shutil.move, temp_extracted_launcher_path, launcher_binary_path)
+                except Exception:
+                    LOGGER.error(f"HoN Update - Failed to copy downloaded {launcher_binary} into {install_directory}\n\t1. Please download the file manually: {launcher_download_url}\n\t2. Unzip the file into {install_directory}")
+                    return False
+            except OSError as e:
+                LOGGER.error(f"HoN Update - Failed to copy downloaded {launcher_binary} into {install_directory} ({e})\n\t1. Please download the file manually: {launcher_download_url}\n\t2. Unzip the file into {install_directory}")
+                return False
+        return True
+
+    async def run_patcher(self, patcher_executable, timeout):
+        """ Run the patcher, killing it if it takes longer than timeout seconds. Returns the exit code. """
+        if MISC.get_os_platform() == "win32":
+            args = [str(patcher_executable), "-norun"]
+        else:
+            os.chmod(patcher_executable, 0o700)
+            args = [str(patcher_executable)]
+        process = await asyncio.create_subprocess_exec(*args)
+        try:
+            return await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+
+    async def run(self, timeout=300, source='startup'):
+        """
+        Shut down the game servers and patch them.
+
+        Returns:
+            True once patched, False if patching failed, or None if game servers are still running (patching is retried on the next check).
+        """
+        if self.manager.patching:
+            LOGGER.warn("Patching is already in progress.")
+            return
+
+        self.manager.patching = True
+        self.progress.start(source)
+        hon_data = self.manager.global_config['hon_data']
+        try:
+            self.progress.set_phase(PatchPhase.SHUTTING_DOWN)
+            await self.shutdown_servers()
+
+            running = MISC.get_proc(hon_data['hon_executable_name'], refresh=True)
+            if running:
+                self.progress.servers_running = len(running)
+                self.progress.set_phase(PatchPhase.WAITING_FOR_SERVERS, f"{len(running)} servers are still running")
+                LOGGER.debug("Some HoN servers are still running. Waiting until they've shut down.")
+                return
+
+            launcher_binary, launcher_zip, hon_version_url, launcher_download_url = self.get_launcher_details()
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+                self.progress.set_phase(PatchPhase.CHECKING_VERSION, hon_version_url)
+                launcher_crc = await self.extract_crc_from_file(session, hon_version_url)
+                if not launcher_crc:
+                    LOGGER.error("Patching failed.")
+                    self.progress.set_phase(PatchPhase.FAILED, "Could not read the launcher CRC from the version file")
+                    return False
+
+                launcher_binary_path = hon_data['hon_install_directory'] / launcher_binary
+                if not exists(launcher_binary_path) or launcher_crc.lower() != (await asyncio.to_thread(MISC.calculate_crc32, launcher_binary_path)).lower():
+                    LOGGER.debug(f"Beginning to download new launcher from {launcher_download_url}")
+                    try:
+                        if not await self.install_launcher(session, launcher_binary, launcher_zip, launcher_download_url):
+                            self.progress.set_phase(PatchPhase.FAILED, f"Failed to install {launcher_binary}")
+                            return False
+                    except Exception as e:
+                        LOGGER.error(f"Error occurred during file download or extraction: {traceback.format_exc()}")
+                        self.progress.set_phase(PatchPhase.FAILED, f"Failed to install {launcher_binary}: {e}")
+                        return False
+
+            self.progress.set_phase(PatchPhase.PATCHING)
+            await self.run_patcher(launcher_binary_path, timeout)
+
+            self.progress.set_phase(PatchPhase.VERIFYING)
+            if MISC.get_os_platform() == "linux":
+                executable = "hon-x86_64-server_KONGOR"
+                if not os.path.exists(hon_data['hon_install_directory'] / executable):
+                    executable = "hon-x86_64-server"
+                hon_data['hon_executable_path'] = hon_data['hon_install_directory'] / executable
+                hon_data['hon_executable_name'] = executable
+
+            svr_version = MISC.get_svr_version(hon_data['hon_executable_path'])
+            if svr_version != self.manager.latest_available_game_version:
+                LOGGER.error(f"Server patching failed. Current version: {svr_version}")
+                self.progress.set_phase(PatchPhase.FAILED, f"Version after patching is {svr_version}, expected {self.manager.latest_available_game_version}")
+                return False
+
+            LOGGER.info("Patching successful!")
+            hon_data['svr_version'] = svr_version
+            if get_mqtt():
+                get_mqtt().invalidate_metadata()
+            self.progress.set_phase(PatchPhase.COMPLETE, svr_version)
+            if source == "healthcheck":
+                await self.manager.start_game_servers("all")
+            return True
+
+        except asyncio.TimeoutError:
+            LOGGER.warn(f"Patching failed as it exceeded {timeout} seconds to patch resources.")
+            self.progress.set_phase(PatchPhase.FAILED, f"Timed out after {timeout} seconds")
+            return False
+        except Exception:
+            LOGGER.error(f"An unexpected error occured while patching: {traceback.format_exc()}")
+            self.progress.set_phase(PatchPhase.FAILED, "Unexpected error, see the log")
+            return False
+        finally:
+            # patching is done. Whether it failed or otherwise.
+            self.manager.patching = False
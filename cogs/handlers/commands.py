@@ -373,8 +373,7 @@ class Commands:
                 return
 
             if game_server == "all":
-                for game_server in list(self.game_servers.values()):
-                    await self.manager_event_bus.emit('cmd_message_server', game_server, message)
+                await self.manager_event_bus.emit('cmd_message_servers', list(self.game_servers.values()), message)
             else:
                 await self.manager_event_bus.emit('cmd_message_server', game_server, message)
         except Exception as e:
@@ -0,0 +1,64 @@
+import asyncio
+from pathlib import Path
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from cogs.misc.logger import get_logger
+
+LOGGER = get_logger()
+
+class _EventForwarder(FileSystemEventHandler):
+    """ Runs on the watchdog thread, and hands each file event to the event loop, or straight to the callback. """
+    def __init__(self, loop, callback, suffixes):
+        self.loop = loop    # None to call the callback on the watchdog thread
+        self.callback = callback
+        self.suffixes = suffixes
+
+    def forward(self, event_type, path):
+        path = Path(path)
+        if self.suffixes and path.suffix not in self.suffixes:
+            return
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.callback, event_type, path)
+        else:
+            self.callback(event_type, path)
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        if event.event_type == 'moved':
+            # a rename within the directory is the old name being deleted and the new one created
+            self.forward('deleted', event.src_path)
+            self.forward('created', event.dest_path)
+        elif event.event_type in ('created', 'modified', 'deleted'):
+            self.forward(event.event_type, event.src_path)
+
+class DirectoryWatcher:
+    """
+        Watches a directory with OS file notifications (inotify on Linux, ReadDirectoryChangesW on Windows), instead of listing it repeatedly.
+
+        callback(event_type, path) is called on the event loop, with event_type one of 'created', 'modified' or 'deleted'.
+        If suffixes is given (e.g. ['.stats']), only files with those suffixes are reported.
+        With on_loop=False the callback is instead called directly on the watchdog thread, for high volume events (such as every write
+        to a log) which would otherwise each be a callback on the event loop. The callback must then be thread safe.
+    """
+    def __init__(self, directory, callback, suffixes=None, recursive=False, on_loop=True):
+        self.directory = Path(directory)
+        self.callback = callback
+        self.suffixes = suffixes
+        self.recursive = recursive
+        self.on_loop = on_loop
+        self.observer = None
+
+    def start(self):
+        """ Start watching. Must be called from the event loop. Raises OSError if the directory can't be watched. """
+        handler = _EventForwarder(asyncio.get_running_loop() if self.on_loop else None, self.callback, self.suffixes)
+        self.observer = Observer()
+        self.observer.daemon = True
+        self.observer.schedule(handler, str(self.directory), recursive=self.recursive)
+        self.observer.start()
+        LOGGER.debug(f"Watching {self.directory} for file changes.")
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer = None
@@ -48,6 +48,18 @@ class ReplayStatus(Enum):
     UPLOADING = 6
     UPLOAD_COMPLETE = 7
 
+class PatchPhase(Enum):
+    IDLE = "idle"
+    SHUTTING_DOWN = "shutting_down"
+    WAITING_FOR_SERVERS = "waiting_for_servers"
+    CHECKING_VERSION = "checking_version"
+    DOWNLOADING = "downloading"
+    EXTRACTING = "extracting"
+    PATCHING = "patching"
+    VERIFYING = "verifying"
+    COMPLETE = "complete"
+    FAILED = "failed"
+
 class GameStatus(Enum):
     # the 'status' object within the gameserver game_state dictionary
     UNKNOWN = -1
@@ -0,0 +1,210 @@
+import traceback
+import threading
+import asyncio
+import time
+import re
+import os
+from pathlib import Path
+from cogs.handlers.directory_watcher import DirectoryWatcher
+from cogs.handlers.scheduler import scheduler
+from cogs.misc.logger import get_logger
+
+LOGGER = get_logger()
+
+SLAVE_ID_PATTERN = re.compile(r'^Slave(\d+)_')
+MATCH_ID_PATTERN = re.compile(r'M(\d+)')
+
+class LogFile:
+    """ A file in the logs directory. created and modified are timestamps, from the last scan or the last file notification. """
+    __slots__ = ('path', 'suffix', 'slave_id', 'match_id', 'created', 'modified')
+
+    def __init__(self, path, created, modified):
+        self.path = path
+        self.suffix = path.suffix
+        slave_id = SLAVE_ID_PATTERN.match(path.name)
+        self.slave_id = int(slave_id.group(1)) if slave_id else None
+        match_id = MATCH_ID_PATTERN.search(path.name)
+        self.match_id = match_id.group(1) if match_id else None
+        self.created = created
+        self.modified = modified
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+class LogDirectoryIndex:
+    """
+        In memory index of the HoN logs directory, so finding a game server's latest console log, a match's files, or old logs to clean up
+        doesn't list a directory holding tens of thousands of files.
+
+        Files are indexed by slave id (Slave<id>_...), match id (M<match_id>) and suffix. The index is kept up to date from file notifications,
+        handled on the watchdog thread, as game servers write to their logs constantly. A full scan reconciles it every reconcile_interval
+        seconds, or every fallback_interval seconds if the directory can't be watched.
+        Queries are thread safe, so the replay cleaner's background thread can use the index too.
+
+        Until the first scan completes, covers() is False, and callers should read the directory themselves.
+        Listeners added with add_listener(callback) are called on the event loop as callback(event_type, path) when files are created or deleted.
+    """
+    def __init__(self, reconcile_interval=600, fallback_interval=60, name='log_index'):
+        self.reconcile_interval = reconcile_interval
+        self.fallback_interval = fallback_interval
+        self.job_name = f"{name}_reconcile"
+        self.directory = None
+        self.lock = threading.Lock()
+        self.files = {}
+        self.by_slave = {}
+        self.by_match = {}
+        self.by_suffix = {}
+        self.listeners = []
+        self.loop = None
+        self.watcher = None
+        self.is_ready = False
+        self._ready = None
+        self.stats = {
+            'events': 0,
+            'reconciliations': 0,
+            'corrections': 0,
+            'last_reconcile_seconds': None
+        }
+
+    def covers(self, directory):
+        """ Whether the index is ready, and is of this directory. """
+        return self.is_ready and Path(directory) == self.directory
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _notify(self, changes):
+        for event_type, path in changes:
+            for callback in self.listeners:
+                self.loop.call_soon_threadsafe(callback, event_type, path)
+
+    def _add(self, entry):
+        self.files[entry.path] = entry
+        if entry.slave_id is not None:
+            self.by_slave.setdefault(entry.slave_id, set()).add(entry.path)
+        if entry.match_id is not None:
+            self.by_match.setdefault(entry.match_id, set()).add(entry.path)
+        self.by_suffix.setdefault(entry.suffix, set()).add(entry.path)
+
+    def _remove(self, path):
+        entry = self.files.pop(path)
+        for index, key in ((self.by_slave, entry.slave_id), (self.by_match, entry.match_id), (self.by_suffix, entry.suffix)):
+            paths = index.get(key)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del index[key]
+
+    def on_file_event(self, event_type, path):
+        """ Called on the watchdog thread for every change in the directory. """
+        now = time.time()
+        changes = []
+        with self.lock:
+            self.stats['events'] += 1
+            entry = self.files.get(path)
+            if event_type == 'deleted':
+                if entry:
+                    self._remove(path)
+                    changes.append(('deleted', path))
+            elif entry:
+                entry.modified = now
+            else:
+                self._add(LogFile(path, now, now))
+                changes.append(('created', path))
+        self._notify(changes)
+
+    def scan(self):
+        """ List the whole directory, including subdirectories. Run in a worker thread. """
+        files = {}
+        directories = [self.directory]
+        while directories:
+            try:
+                with os.scandir(directories.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            path = Path(entry.path)
+                            files[path] = LogFile(path, stat.st_ctime, stat.st_mtime)
+            except FileNotFoundError:
+                continue
+        return files
+
+    async def reconcile(self):
+        """ Replace the index with a full scan of the directory, keeping files which appeared after the scan started. """
+        started = time.time()
+        scanned = await asyncio.to_thread(self.scan)
+        with self.lock:
+            old_paths = set(self.files)
+            for path, entry in self.files.items():
+                if path not in scanned and entry.created >= started:
+                    scanned[path] = entry
+            self.files, self.by_slave, self.by_match, self.by_suffix = {}, {}, {}, {}
+            for entry in scanned.values():
+                self._add(entry)
+            changes = [('created', path) for path in scanned.keys() - old_paths] + [('deleted', path) for path in old_paths - scanned.keys()]
+            self.stats['reconciliations'] += 1
+            self.stats['last_reconcile_seconds'] = round(time.time() - started, 3)
+            if self.is_ready:
+                self.stats['corrections'] += len(changes)
+        if self.is_ready:
+            # the first scan only fills the index, anything after that is something the notifications missed
+            if changes:
+                LOGGER.debug(f"Log index reconciliation found {len(changes)} changes missed by file notifications.")
+            self._notify(changes)
+        self.is_ready = True
+        self._ready.set()
+
+    def start(self, directory):
+        """ Watch directory, and fill the index from a scan run by the scheduler. Must be called from the event loop. """
+        self.directory = Path(directory)
+        self.loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self.watcher = DirectoryWatcher(self.directory, self.on_file_event, recursive=True, on_loop=False)
+        try:
+            self.watcher.start()
+            interval = self.reconcile_interval
+        except Exception:
+            LOGGER.error(f"Unable to watch {self.directory} for changes, the log index will be rescanned every {self.fallback_interval} seconds. {traceback.format_exc()}")
+            self.watcher = None
+            interval = self.fallback_interval
+        scheduler.add_job(self.job_name, self.reconcile, interval=interval, initial_delay=0)
+
+    def stop(self):
+        scheduler.remove_job(self.job_name)
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        self.is_ready = False
+
+    async def wait_ready(self, directory):
+        """ Wait for the first scan, if the index is of this directory. Returns covers(directory). """
+        if self.directory is None or Path(directory) != self.directory:
+            return False
+        await self._ready.wait()
+        return True
+
+    def find(self, slave_id=None, match_id=None, suffix=None, subdirectories=False):
+        """ Files matching every given key. Unless subdirectories is True, only files directly in the logs directory are returned. """
+        with self.lock:
+            candidates = None
+            for index, key in ((self.by_slave, slave_id), (self.by_match, None if match_id is None else str(match_id)), (self.by_suffix, suffix)):
+                if key is None:
+                    continue
+                paths = index.get(key, set())
+                candidates = paths if candidates is None else candidates & paths
+            entries = [self.files[path] for path in (self.files if candidates is None else candidates)]
+        if not subdirectories:
+            entries = [entry for entry in entries if entry.path.parent == self.directory]
+        return entries
+
+    def latest(self, key='modified', **kwargs):
+        """ The most recently modified (or created, with key='created') file matching find(**kwargs), or None. """
+        return max(self.find(**kwargs), key=lambda entry: getattr(entry, key), default=None)
+
+log_index = LogDirectoryIndex()
@@ -0,0 +1,96 @@
+import threading
+import asyncio
+import logging
+from cogs.misc.logger import FileFormatter
+from cogs.misc.log_reader import LogLineFilter
+
+class LogSubscriber:
+    """
+        A client of the log stream. Records wait in a bounded buffer until the client takes them. When a slow client lets the buffer fill,
+        the oldest records are dropped, so the manager never holds more than max_buffer records for it, and the number dropped is
+        reported with the next record the client gets.
+    """
+    def __init__(self, line_filter, max_buffer):
+        self.line_filter = line_filter
+        self.queue = asyncio.Queue(maxsize=max_buffer)
+        self.dropped = 0
+
+    def offer(self, entry):
+        """ Called on the event loop. """
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(entry)
+
+    async def get(self):
+        """ The next record, and how many records were dropped before it. """
+        entry = await self.queue.get()
+        dropped, self.dropped = self.dropped, 0
+        return entry, dropped
+
+class LogBroadcaster(logging.Handler):
+    """
+        A logging handler pushing each record of the logger it's attached to to the subscribed API clients, instead of them polling the log file.
+
+        Records are formatted as they're written to server.log, once per record, and only while someone is subscribed.
+        Handlers run on whichever thread logged, so records are filtered there and handed to the event loop for delivery.
+    """
+    def __init__(self, max_subscribers=20, max_buffer=1000):
+        super().__init__()
+        self.setFormatter(FileFormatter())
+        self.max_subscribers = max_subscribers
+        self.max_buffer = max_buffer
+        self.subscribers = []
+        self.loop = None
+        self.loop_thread_id = None
+        self.sequence = 0
+        self.subscribers_lock = threading.Lock()
+
+    def attach(self, logger):
+        """ Start handling the logger's records. Must be called from the event loop. """
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        if self not in logger.handlers:
+            logger.addHandler(self)
+
+    def subscribe(self, line_filter=None, max_buffer=None):
+        """ Returns a LogSubscriber, or None if there are max_subscribers already. Called on the event loop. """
+        with self.subscribers_lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            subscriber = LogSubscriber(line_filter or LogLineFilter(), min(max_buffer or self.max_buffer, self.max_buffer))
+            # copied rather than changed in place, so emit() can read the list without taking the lock
+            self.subscribers = self.subscribers + [subscriber]
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.subscribers_lock:
+            self.subscribers = [existing for existing in self.subscribers if existing is not subscriber]
+
+    def emit(self, record):
+        subscribers = self.subscribers
+        if not subscribers or self.loop is None:
+            return
+        try:
+            line = self.format(record)
+            level = record.levelname
+            matched = [subscriber for subscriber in subscribers if subscriber.line_filter.matches(line, level)]
+            if not matched:
+                return
+            self.sequence += 1
+            entry = {"id": self.sequence, "time": record.created, "level": level, "line": line}
+            if threading.get_ident() == self.loop_thread_id:
+                self.deliver(entry, matched)
+            else:
+                self.loop.call_soon_threadsafe(self.deliver, entry, matched)
+        except RuntimeError:
+            # the event loop has closed, during shutdown
+            pass
+        except Exception:
+            self.handleError(record)
+
+    def deliver(self, entry, subscribers):
+        for subscriber in subscribers:
+            subscriber.offer(entry)
+
+log_broadcaster = LogBroadcaster()
@@ -1,4 +1,6 @@
 import paho.mqtt.client as mqtt
+import threading
+import queue
 import json
 import datetime
 from cogs.misc.logger import get_logger, get_misc
@@ -9,7 +11,7 @@ LOGGER = get_logger()
 
 class MQTTHandler:
 
-    def __init__(self, server="doormat.honfigurator.app", port=8883, keepalive=60, username=None, password=None, global_config=None, certificate_path=None, key_path=None):
+    def __init__(self, server="doormat.honfigurator.app", port=8883, keepalive=60, username=None, password=None, global_config=None, certificate_path=None, key_path=None, queue_size=1000, drop_policy="drop_oldest", block_timeout=0.05):
         self.server = server
         self.port = port
         self.keepalive = keepalive
@@ -18,6 +20,7 @@ class MQTTHandler:
         self.discord_id = None
         self.mastersv_state = None
         self.chatsv_state = None
+        self.connection_generation = 0     # incremented on every successful connection, so delta encoded publishers know to send a snapshot
 
         # Create a new MQTT client instance
         self.client = mqtt.Client()
@@ -40,8 +43,33 @@ class MQTTHandler:
 
         self.global_config = global_config
 
+        # The static part of the metadata envelope, serialised once. See get_metadata_json()
+        self._metadata_json = None
+        self._timestamp_second = None
+        self._timestamp_json = None
+
+        # Publishes are queued and sent by a worker thread, so a slow broker can't stall the event loop.
+        # drop_policy decides what happens when the queue is full:
+        #   drop_oldest - discard the oldest queued message to make room
+        #   drop_newest - discard the message being published
+        #   block       - wait up to block_timeout seconds for room, then discard the message being published
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self._publish_queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        self._stats_lock = threading.Lock()
+        self.publish_stats = {
+            'queued': 0,
+            'published': 0,
+            'failed': 0,
+            'dropped_oldest': 0,
+            'dropped_newest': 0,
+            'max_queue_depth': 0
+        }
+
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
+            self.connection_generation += 1
             LOGGER.highlight("Connected successfully to MQTT broker")
         else:
             LOGGER.error(f"Connection failed with code {rc}")
@@ -52,19 +80,37 @@ class MQTTHandler:
     def connect(self):
         self.client.connect(self.server, self.port, self.keepalive)
         self.client.loop_start()
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._publish_worker, name="mqtt-publisher", daemon=True)
+            self._worker.start()
 
-    def disconnect(self):
+    def disconnect(self, flush_timeout=5):
+        if self._worker and self._worker.is_alive():
+            # let the worker send whatever is already queued, such as the shutdown event
+            try:
+                self._publish_queue.put(None, timeout=flush_timeout)
+                self._worker.join(flush_timeout)
+            except queue.Full:
+                LOGGER.warn(f"MQTT publish queue still full after {flush_timeout} seconds, {self._publish_queue.qsize()} messages were not sent.")
+        self._worker = None
         self.client.loop_stop()
         self.client.disconnect()
     
     def set_discord_id(self, discord_id):
         self.discord_id = discord_id
+        self.invalidate_metadata()
     
     def set_mastersv_state(self, state):
         self.mastersv_state = state
+        self.invalidate_metadata()
     
     def set_chatsv_state(self, state):
         self.chatsv_state = state
+        self.invalidate_metadata()
+
+    def invalidate_metadata(self):
+        """ Rebuild the metadata envelope on the next publish. Call this whenever global_config values in the envelope change. """
+        self._metadata_json = None
 
     def add_metadata(self):
         metadata = {
@@ -87,8 +133,88 @@ class MQTTHandler:
             
         return metadata
 
+    def get_metadata_json(self):
+        """
+        The metadata envelope as a JSON fragment (the object members, without braces), ready to be spliced into a payload.
+        Everything except the timestamp is serialised once, until invalidate_metadata() is called.
+        The timestamp only has second resolution, so it is serialised at most once per second.
+        """
+        if self._metadata_json is None:
+            metadata = self.add_metadata()
+            del metadata['timestamp']
+            self._metadata_json = json.dumps(metadata)[1:-1]
+
+        now = datetime.datetime.utcnow()
+        second = now.replace(microsecond=0)
+        if second != self._timestamp_second:
+            self._timestamp_second = second
+            self._timestamp_json = '"timestamp": ' + json.dumps(now.strftime('%Y-%m-%d %H:%M:%S'))
+
+        return f"{self._metadata_json}, {self._timestamp_json}"
+
+    def build_payload(self, data):
+        """
+        Serialise the message and splice in the metadata envelope. The caller's dict is left untouched.
+        Metadata members come last, so as before, they take precedence over any keys of the same name in data.
+        """
+        body = json.dumps(data)
+        if body == "{}":
+            return "{" + self.get_metadata_json() + "}"
+        return body[:-1] + ", " + self.get_metadata_json() + "}"
+
     def publish_json(self, topic, data, qos=1):
-        data.update(self.add_metadata())
-        payload = json.dumps(data)
-        result = self.client.publish(topic, payload, qos)
-        return result.rc == mqtt.MQTT_ERR_SUCCESS
\ No newline at end of file
+        """
+        Queue a message for publishing. The payload is serialised here, so later changes to data (often a copy of a live game state) don't leak into it.
+        Returns False if the message was dropped because the queue is full.
+        """
+        item = (topic, self.build_payload(data), qos)
+        try:
+            if self.drop_policy == "block":
+                self._publish_queue.put(item, timeout=self.block_timeout)
+            else:
+                self._publish_queue.put_nowait(item)
+        except queue.Full:
+            if self.drop_policy != "drop_oldest":
+                self._increment_stat('dropped_newest')
+                return False
+            try:
+                self._publish_queue.get_nowait()
+                self._increment_stat('dropped_oldest')
+            except queue.Empty:
+                pass
+            try:
+                self._publish_queue.put_nowait(item)
+            except queue.Full:
+                self._increment_stat('dropped_newest')
+                return False
+
+        with self._stats_lock:
+            self.publish_stats['queued'] += 1
+            depth = self._publish_queue.qsize()
+            if depth > self.publish_stats['max_queue_depth']:
+                self.publish_stats['max_queue_depth'] = depth
+        return True
+
+    def get_publish_stats(self):
+        with self._stats_lock:
+            stats = dict(self.publish_stats)
+        stats['queue_depth'] = self._publish_queue.qsize()
+        stats['drop_policy'] = self.drop_policy
+        return stats
+
+    def _increment_stat(self, key):
+        with self._stats_lock:
+            self.publish_stats[key] += 1
+
+    def _publish_worker(self):
+        while True:
+            item = self._publish_queue.get()
+            if item is None:
+                return
+            topic, payload, qos = item
+            try:
+                result = self.client.publish(topic, payload, qos)
+                self._increment_stat('published' if result.rc == mqtt.MQTT_ERR_SUCCESS else 'failed')
+            except Exception as e:
+                self._increment_stat('failed')
+                LOGGER.error(f"Failed to publish MQTT message to {topic}: {e}")
@@ -0,0 +1,105 @@
+"""
+    Delta encoding of the game state published to MQTT.
+
+    By default, every game server MQTT event carries the whole game state. With application_data.mqtt.delta_status enabled,
+    the state is instead sent as:
+        {"encoding": "snapshot", "seq": int, "state": {...}}
+            The full state. Sent on the first publish, after every (re)connection to the broker, and then every snapshot_interval seconds.
+        {"encoding": "delta", "seq": int, "base_seq": int, "changed": {...}, "removed": [...]}
+            Only the top level state keys that changed since the previous message. Nested values (players, match_info) are sent whole when they change.
+    Each topic (game_server/status, game_server/match, game_server/lag) is encoded separately, with its own snapshots and sequence numbers,
+    so a subscriber to any one topic can follow it on its own. Sequence numbers are per game server and topic, and increase by 1 with every
+    message on that topic. A subscriber that sees a gap must wait for the next snapshot. StatusDeltaDecoder implements this for subscribers,
+    with one decoder per game server and topic.
+"""
+import time
+
+def _copy_value(value):
+    # State values are at most one level deep (match_info is a dict of scalars, players is a list of dicts which are replaced rather than modified)
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+class StatusDeltaEncoder:
+    def __init__(self, snapshot_interval=300):
+        self.snapshot_interval = snapshot_interval
+        self.seq = 0
+        self._last_state = None
+        self._last_snapshot = 0
+        self._generation = None
+
+    def encode(self, state, generation=None, force_snapshot=False):
+        """
+        Encode the state as a snapshot or a delta against the previously encoded state.
+
+        Parameters:
+            state (dict): The current game state.
+            generation (int): The MQTT connection generation. A change means the broker connection was re-established, so a snapshot is sent.
+            force_snapshot (bool): Send a snapshot regardless of the interval.
+
+        Returns:
+            dict: The members to publish alongside the event_type.
+        """
+        self.seq += 1
+        now = time.monotonic()
+        if force_snapshot or self._last_state is None or generation != self._generation or now - self._last_snapshot >= self.snapshot_interval:
+            self._generation = generation
+            self._last_snapshot = now
+            self._last_state = {key: _copy_value(value) for key, value in state.items()}
+            return {"encoding": "snapshot", "seq": self.seq, "state": state}
+
+        last_state = self._last_state
+        changed = {}
+        for key, value in state.items():
+            if key not in last_state or last_state[key] != value:
+                changed[key] = value
+                last_state[key] = _copy_value(value)
+        removed = [key for key in last_state if key not in state]
+        for key in removed:
+            del last_state[key]
+        return {"encoding": "delta", "seq": self.seq, "base_seq": self.seq - 1, "changed": changed, "removed": removed}
+
+    def reset(self):
+        """ Send a snapshot with the next message. """
+        self._last_state = None
+
+class StatusDeltaDecoder:
+    """
+        Subscriber side reconstruction of the game state of one game server from the snapshot and delta messages of one topic.
+    """
+    def __init__(self):
+        self.state = None
+        self.seq = None
+        self.gaps = 0
+
+    def apply(self, message):
+        """
+        Apply a received message.
+
+        Returns:
+            dict: The reconstructed state, or None if a message was missed and the state is unknown until the next snapshot.
+        """
+        encoding = message.get("encoding")
+        if encoding == "snapshot":
+            self.state = {key: _copy_value(value) for key, value in message["state"].items()}
+            self.seq = message["seq"]
+            return self.state
+
+        if encoding != "delta":
+            return self.state
+
+        if self.state is None or message["base_seq"] != self.seq:
+            if self.state is not None:
+                self.gaps += 1
+            self.state = None
+            self.seq = None
+            return None
+
+        for key, value in message["changed"].items():
+            self.state[key] = _copy_value(value)
+        for key in message["removed"]:
+            self.state.pop(key, None)
+        self.seq = message["seq"]
+        return self.state
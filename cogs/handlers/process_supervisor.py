@@ -0,0 +1,140 @@
+import traceback
+import asyncio
+import psutil
+import os
+from cogs.handlers.scheduler import scheduler
+from cogs.misc.logger import get_logger
+
+LOGGER = get_logger()
+
+class ProcessSupervisor:
+    """
+        Notifies callbacks when watched processes exit, without every owner polling psutil on its own timer.
+
+        On Linux (kernel 5.3+), each process gets a pidfd, which the event loop watches for readability. It becomes readable the
+        moment the process exits, for children and for processes we didn't spawn (adopted servers found by port, cow master forks).
+        Elsewhere, if the pidfd can't be opened, or with use_pidfd=False, the process is polled by a single scheduler job shared by all polled processes.
+
+        Callbacks are called as callback(pid, returncode). returncode is only known for processes we spawned (the Popen object was
+        given to watch()), otherwise it is None. Coroutine functions are run as tasks.
+    """
+    def __init__(self, poll_interval=1, name='process_supervisor', use_pidfd=True):
+        self.poll_interval = poll_interval
+        self.use_pidfd = use_pidfd and hasattr(os, 'pidfd_open')
+        self.poll_job_name = f"{name}_poll"
+        self._watches = {}
+        self.stats = {
+            'pidfd_watches': 0,
+            'polled_watches': 0,
+            'exits_detected': 0
+        }
+
+    def watch(self, pid, callback, popen=None):
+        """
+        Watch a process, calling callback(pid, returncode) when it exits. A process may have several callbacks.
+
+        Args:
+            pid (int): the process ID.
+            callback (callable): called once the process exits.
+            popen (subprocess.Popen): the Popen object if we spawned the process, so it can be reaped and the return code reported.
+        """
+        entry = self._watches.get(pid)
+        if entry:
+            if callback not in entry['callbacks']:
+                entry['callbacks'].append(callback)
+            return
+
+        entry = {'callbacks': [callback], 'popen': popen, 'fd': None, 'proc': None}
+        self._watches[pid] = entry
+
+        if self.use_pidfd:
+            try:
+                entry['fd'] = os.pidfd_open(pid)
+                asyncio.get_running_loop().add_reader(entry['fd'], self._on_pidfd_ready, pid)
+                self.stats['pidfd_watches'] += 1
+                return
+            except ProcessLookupError:
+                # already gone
+                asyncio.get_running_loop().call_soon(self._exited, pid)
+                return
+            except (OSError, NotImplementedError):
+                # pidfds not supported by this kernel, or this event loop can't watch file descriptors
+                if entry['fd'] is not None:
+                    os.close(entry['fd'])
+                    entry['fd'] = None
+
+        try:
+            entry['proc'] = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            asyncio.get_running_loop().call_soon(self._exited, pid)
+            return
+        self.stats['polled_watches'] += 1
+        if self.poll_job_name not in scheduler.jobs:
+            scheduler.add_job(self.poll_job_name, self._poll, interval=self.poll_interval)
+
+    def unwatch(self, pid, callback=None):
+        """ Stop watching a process, either for one callback or entirely. """
+        entry = self._watches.get(pid)
+        if not entry:
+            return
+        if callback is not None and callback in entry['callbacks']:
+            entry['callbacks'].remove(callback)
+        if callback is None or not entry['callbacks']:
+            self._release(pid)
+
+    def is_watched(self, pid):
+        return pid in self._watches
+
+    def _release(self, pid):
+        entry = self._watches.pop(pid, None)
+        if entry is None:
+            return None
+        if entry['fd'] is not None:
+            asyncio.get_running_loop().remove_reader(entry['fd'])
+            os.close(entry['fd'])
+            entry['fd'] = None
+        if entry['proc'] is not None and not any(watch['proc'] for watch in self._watches.values()):
+            scheduler.remove_job(self.poll_job_name)
+        return entry
+
+    def _on_pidfd_ready(self, pid):
+        self._exited(pid)
+
+    def _exited(self, pid):
+        entry = self._release(pid)
+        if entry is None:
+            return
+        self.stats['exits_detected'] += 1
+
+        returncode = None
+        if entry['popen'] is not None:
+            try:
+                returncode = entry['popen'].wait(timeout=1)   # reaps the child, it has already exited
+            except Exception:
+                returncode = entry['popen'].poll()
+
+        for callback in entry['callbacks']:
+            try:
+                if asyncio.iscoroutinefunction(callback):
+                    asyncio.create_task(callback(pid, returncode))
+                else:
+                    callback(pid, returncode)
+            except Exception:
+                LOGGER.error(f"Process exit callback for PID {pid} failed: {traceback.format_exc()}")
+
+    def _poll(self):
+        for pid, entry in list(self._watches.items()):
+            if entry['proc'] is None:
+                continue
+            if entry['popen'] is not None:
+                exited = entry['popen'].poll() is not None
+            else:
+                try:
+                    # a "suspended" process also shows as stopped on windows
+                    exited = not entry['proc'].is_running() or entry['proc'].status() in (psutil.STATUS_ZOMBIE, psutil.STATUS_STOPPED)
+                except psutil.NoSuchProcess:
+                    exited = True
+            if exited:
+                self._exited(pid)
+
+process_supervisor = ProcessSupervisor()
@@ -0,0 +1,115 @@
+import traceback
+import asyncio
+import os
+from cogs.handlers.events import ReplayStatus
+from cogs.misc.logger import get_logger, get_mqtt
+
+LOGGER = get_logger()
+
+class ReplayUpload:
+    def __init__(self, match_id, account_id):
+        self.match_id = match_id
+        self.account_ids = [account_id]
+        self.status = ReplayStatus.QUEUED
+
+class ReplayUploader:
+    """
+        Uploads replays requested by players through the chat server.
+
+        Several players often request the replay of the same match. While a replay is being uploaded, further requests for it join the
+        in-flight upload instead of starting another, and every requesting account is sent each status update.
+        At most max_concurrent_uploads replays are uploaded at once; requests beyond that stay queued until an upload finishes.
+    """
+    def __init__(self, global_config, master_server_handler, find_replay_file, send_status_update, max_concurrent_uploads=3):
+        self.global_config = global_config
+        self.master_server_handler = master_server_handler
+        self.find_replay_file = find_replay_file
+        self.send_status_update = send_status_update    # coroutine function (match_id, account_id, ReplayStatus), sends the status to the player
+        self.upload_slots = asyncio.Semaphore(max_concurrent_uploads)
+        self.uploads = {}
+        self.stats = {
+            'requests': 0,
+            'coalesced': 0,
+            'uploaded': 0,
+            'failed': 0
+        }
+
+    async def send_status(self, upload, status):
+        """ Send a status update to every account waiting for this upload. """
+        upload.status = status
+        for account_id in list(upload.account_ids):
+            await self.send_status_update(upload.match_id, account_id, status)
+
+    async def handle_replay_request(self, match_id, extension, account_id):
+        replay_file_name = f"M{match_id}.{extension}"
+        LOGGER.debug(f"Received replay upload request.\n\tFile Name: {replay_file_name}\n\tAccount ID (requestor): {account_id}")
+        self.stats['requests'] += 1
+
+        upload = self.uploads.get(replay_file_name)
+        if upload:
+            # already being uploaded, this account gets the remaining status updates
+            self.stats['coalesced'] += 1
+            if account_id not in upload.account_ids:
+                upload.account_ids.append(account_id)
+            await self.send_status_update(match_id, account_id, upload.status)
+            LOGGER.debug(f"{replay_file_name} is already being uploaded, account {account_id} added to the {len(upload.account_ids)} waiting for it.")
+            return
+
+        upload = ReplayUpload(match_id, account_id)
+        self.uploads[replay_file_name] = upload
+        try:
+            if await self.upload(upload, replay_file_name, extension):
+                self.stats['uploaded'] += 1
+            else:
+                self.stats['failed'] += 1
+        finally:
+            del self.uploads[replay_file_name]
+
+    async def upload(self, upload, replay_file_name, extension):
+        match_id = upload.match_id
+        file_exists, replay_file_path = await self.find_replay_file(replay_file_name)
+
+        if not file_exists:
+            # Send the "does not exist" packet
+            await self.send_status(upload, ReplayStatus.DOES_NOT_EXIST)
+            LOGGER.warn(f"Replay file {replay_file_name} does not exist.")
+            return False
+
+        # Send the "exists" packet
+        await self.send_status(upload, ReplayStatus.QUEUED)
+        LOGGER.debug(f"Replay file exists ({replay_file_name}). Obtaining upload location information.")
+
+        async with self.upload_slots:
+            # Upload the file and send status updates as required
+            file_size = os.path.getsize(replay_file_path)
+
+            upload_details = await self.master_server_handler.get_replay_upload_info(match_id, extension, self.global_config['hon_data']['svr_login'], file_size)
+
+            if upload_details is None or upload_details[1] != 200:
+                await self.send_status(upload, ReplayStatus.GENERAL_FAILURE)
+                LOGGER.error(f"{replay_file_name} - Failed to obtain upload location information. HTTP Response ({upload_details[1] if upload_details else None}):\n\t{upload_details[0] if upload_details else None}")
+                return False
+
+            upload_details_parsed = {key.decode(): (value.decode() if isinstance(value, bytes) else value) for key, value in upload_details[0].items()}
+            LOGGER.debug(f"Uploading {replay_file_name} to {upload_details_parsed['TargetURL']}")
+
+            await self.send_status(upload, ReplayStatus.UPLOADING)
+            try:
+                upload_result = await self.master_server_handler.upload_replay_file(replay_file_path, replay_file_name, upload_details_parsed['TargetURL'])
+            except Exception:
+                LOGGER.error(f"Error uploading replay file {replay_file_path}")
+                LOGGER.error(f"Undefined Exception: {traceback.format_exc()}")
+                upload_result = ("Premature failure.", -1)
+
+        if upload_result[1] not in [204,200]:
+            await self.send_status(upload, ReplayStatus.GENERAL_FAILURE)
+            LOGGER.error(f"Replay upload failed! HTTP Upload Response ({upload_result[1]})\n\t{upload_result[0]}")
+            if get_mqtt():
+                get_mqtt().publish_json("manager/admin", {"event_type":"replay_upload_failure","message":f"failed. HTTP response code: {upload_result[1]}"})
+            return False
+
+        await self.send_status(upload, ReplayStatus.UPLOAD_COMPLETE)
+        LOGGER.debug(f"Replay upload completed successfully. Notified {len(upload.account_ids)} accounts.")
+        if get_mqtt():
+            get_mqtt().publish_json("manager/admin", {"event_type":"replay_upload_success","message":"successful"})
+        return True
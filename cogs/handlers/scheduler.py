@@ -0,0 +1,153 @@
+import traceback
+import asyncio
+import inspect
+import heapq
+import random
+import time
+from datetime import datetime, timedelta
+from cogs.handlers.events import stop_event
+from cogs.misc.logger import get_logger
+
+LOGGER = get_logger()
+
+class ScheduledJob:
+    def __init__(self, name, func, interval, jitter, initial_delay):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self.deadline = None
+        self.task = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_run = None
+        self.last_duration = None
+        self.max_duration = 0
+        self.removed = False
+
+    def get_interval(self):
+        return self.interval() if callable(self.interval) else self.interval
+
+    def next_deadline(self, now, first=False):
+        delay = self.initial_delay if first and self.initial_delay is not None else self.get_interval()
+        return now + delay + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+class Scheduler:
+    """
+        One scheduler for all periodic jobs (heartbeats, health checks, task cleanup), instead of each job polling stop_event in its own 1 second sleep loop.
+
+        Deadlines are kept in a heap, and the scheduler only wakes when the earliest one is due, a job is added, or stop_event is set.
+        Each run is started as its own task so a slow job doesn't delay the others. If a job's previous run is still going when it is due,
+        the run is skipped. When stop_event is set, the scheduler returns and cancels any running jobs.
+    """
+    def __init__(self):
+        self.jobs = {}
+        self._heap = []
+        self._counter = 0
+        self._wakeup = None
+
+    def add_job(self, name, func, interval, jitter=0, initial_delay=None):
+        """
+        Add (or replace) a periodic job.
+
+        Args:
+            name (str): unique name of the job, shown in the API.
+            func (callable): a coroutine function, or plain function, called with no arguments.
+            interval (int | float | callable): seconds between runs. A callable is evaluated each time, so jobs can follow config changes.
+            jitter (int | float): up to this many seconds are randomly added to each deadline, to spread jobs out.
+            initial_delay (int | float): seconds before the first run. Defaults to the interval.
+        """
+        if name in self.jobs:
+            self.remove_job(name)
+        job = ScheduledJob(name, func, interval, jitter, initial_delay)
+        self.jobs[name] = job
+        self._push(job, job.next_deadline(time.monotonic(), first=True))
+        return job
+
+    def remove_job(self, name):
+        job = self.jobs.pop(name, None)
+        if job is None:
+            return False
+        job.removed = True  # lazily dropped from the heap when its deadline comes up
+        if job.task and not job.task.done():
+            job.task.cancel()
+        return True
+
+    def _push(self, job, deadline):
+        job.deadline = deadline
+        self._counter += 1
+        heapq.heappush(self._heap, (deadline, self._counter, job))
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        stop_waiter = asyncio.create_task(stop_event.wait())
+        try:
+            while not stop_event.is_set():
+                # drop removed or rescheduled entries from the top of the heap
+                while self._heap and (self._heap[0][2].removed or self._heap[0][2].deadline != self._heap[0][0]):
+                    heapq.heappop(self._heap)
+
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, job = heapq.heappop(self._heap)
+                    self._start(job)
+                    self._push(job, job.next_deadline(now))
+                    continue
+
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._wakeup.clear()
+                wakeup_waiter = asyncio.create_task(self._wakeup.wait())
+                await asyncio.wait({stop_waiter, wakeup_waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                wakeup_waiter.cancel()
+        finally:
+            stop_waiter.cancel()
+            for job in self.jobs.values():
+                if job.task and not job.task.done():
+                    job.task.cancel()
+
+    def _start(self, job):
+        if job.task and not job.task.done():
+            job.skipped += 1
+            LOGGER.debug(f"Scheduled job '{job.name}' is still running from its last run, skipping this run.")
+            return
+        job.task = asyncio.create_task(self._run_job(job))
+
+    async def _run_job(self, job):
+        job.last_run = datetime.now()
+        started = time.perf_counter()
+        try:
+            result = job.func()
+            if inspect.isawaitable(result):
+                await result
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            job.failures += 1
+            LOGGER.error(f"Scheduled job '{job.name}' failed: {traceback.format_exc()}")
+        finally:
+            job.runs += 1
+            job.last_duration = time.perf_counter() - started
+            job.max_duration = max(job.max_duration, job.last_duration)
+
+    def get_jobs_status(self):
+        now = time.monotonic()
+        status = {}
+        for name, job in self.jobs.items():
+            status[name] = {
+                'interval': job.get_interval(),
+                'next_run': (datetime.now() + timedelta(seconds=max(job.deadline - now, 0))).isoformat() if job.deadline is not None else None,
+                'running': bool(job.task and not job.task.done()),
+                'runs': job.runs,
+                'failures': job.failures,
+                'skipped_overlapping_runs': job.skipped,
+                'last_run': job.last_run.isoformat() if job.last_run else None,
+                'last_duration_seconds': job.last_duration,
+                'max_duration_seconds': job.max_duration
+            }
+        return status
+
+scheduler = Scheduler()
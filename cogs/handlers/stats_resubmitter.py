@@ -0,0 +1,231 @@
+import traceback
+import asyncio
+import random
+import shutil
+import json
+import time
+import re
+import os
+from pathlib import Path
+from cogs.handlers.directory_watcher import DirectoryWatcher
+from cogs.handlers.log_index import log_index
+from cogs.misc.exceptions import HoNServerConnectionError, HoNStatsRejectedError, HoNAuthenticationError
+from cogs.misc.logger import get_logger, get_mqtt
+
+LOGGER = get_logger()
+
+DEAD_LETTER_DIRECTORY = "failed_stats"
+
+class StatsResubmitter:
+    """
+        Resubmits match stats files (M<match_id>.stats) written to the HoN logs directory by game servers which couldn't submit them.
+
+        New stats files are discovered through file notifications, from the log index when it covers the logs directory. The logs directory
+        is only listed once at startup, to find files written while the manager wasn't running. Pending files are kept in a state file, so retry counts and backoff survive restarts.
+        Up to max_concurrent files are submitted at once, starting no more than one every min_interval seconds, so a backlog after an
+        outage drains quickly without flooding the master server.
+
+        A failed file is retried with exponential backoff. Files the master server rejects as invalid, or that fail max_attempts times,
+        are moved to the failed_stats folder of the logs directory, as are files which can't be decoded. Only when the request to the
+        master server got no response at all is the attempt not counted. Local errors, such as not being authenticated yet, are.
+    """
+    def __init__(self, logs_directory, resubmit_match_stats, state_path, max_concurrent=4, min_interval=0.2, max_attempts=10, base_backoff=10, max_backoff=3600, settle_delay=2):
+        self.logs_directory = Path(logs_directory)
+        self.resubmit_match_stats = resubmit_match_stats    # coroutine function (match_id, file_path), returns True once accepted
+        self.state_path = Path(state_path)
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.settle_delay = settle_delay    # seconds to wait after a file appears before submitting it, so the game server has finished writing it
+
+        self.pending = {}   # file name: {'match_id', 'attempts', 'next_attempt', 'last_error'}
+        self.timers = {}
+        self.ready = asyncio.Queue()
+        self.state_lock = asyncio.Lock()
+        self.rate_lock = asyncio.Lock()
+        self.last_start = 0
+        self.watcher = None
+        self.stats = {
+            'submitted': 0,
+            'retried': 0,
+            'dead_lettered': 0
+        }
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r') as state_file:
+                self.pending = json.load(state_file)
+        except FileNotFoundError:
+            self.pending = {}
+        except Exception:
+            LOGGER.error(f"Stats resubmission state {self.state_path} is unreadable, starting with an empty queue. {traceback.format_exc()}")
+            self.pending = {}
+
+    def _write_state(self, state):
+        temp_path = self.state_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as state_file:
+            state_file.write(state)
+        os.replace(temp_path, self.state_path)
+
+    async def save_state(self):
+        async with self.state_lock:
+            try:
+                await asyncio.to_thread(self._write_state, json.dumps(self.pending))
+            except Exception:
+                LOGGER.error(f"Failed to save stats resubmission state: {traceback.format_exc()}")
+
+    def schedule(self, file_name, delay):
+        if file_name in self.timers:
+            self.timers[file_name].cancel()
+        self.timers[file_name] = asyncio.get_running_loop().call_later(max(delay, 0), self._make_ready, file_name)
+
+    def _make_ready(self, file_name):
+        self.timers.pop(file_name, None)
+        self.ready.put_nowait(file_name)
+
+    def discover(self, file_name):
+        """ Queue a stats file, unless it's already queued. Returns True if it was added. """
+        if not file_name.endswith('.stats') or file_name in self.pending:
+            return False
+        match_id = re.search(r'([0-9]+)', file_name)    # Extract match_id from file name (M<match_id>.stats)
+        if not match_id:
+            return False
+        self.pending[file_name] = {'match_id': match_id.group(0), 'attempts': 0, 'next_attempt': time.time() + self.settle_delay, 'last_error': None}
+        self.schedule(file_name, self.settle_delay)
+        return True
+
+    def on_file_event(self, event_type, path):
+        if path.parent != self.logs_directory:
+            return
+        if event_type == 'created':
+            if self.discover(path.name):
+                LOGGER.debug(f"Queued {path.name} for stats resubmission.")
+                asyncio.create_task(self.save_state())
+        elif event_type == 'deleted' and path.name in self.timers:
+            # removed while waiting for a retry. Files already handed to a worker are dropped by the worker
+            self.timers.pop(path.name).cancel()
+            self.pending.pop(path.name, None)
+            asyncio.create_task(self.save_state())
+
+    def scan(self):
+        """ List the logs directory for stats files. Only done at startup, afterwards files are discovered through notifications. """
+        with os.scandir(self.logs_directory) as entries:
+            return [entry.name for entry in entries if entry.name.endswith('.stats') and entry.is_file()]
+
+    async def wait_for_rate_limit(self):
+        async with self.rate_lock:
+            loop = asyncio.get_running_loop()
+            wait = self.last_start + self.min_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_start = loop.time()
+
+    async def dead_letter(self, file_name, reason):
+        self.pending.pop(file_name, None)
+        self.stats['dead_lettered'] += 1
+        dead_letter_directory = self.logs_directory / DEAD_LETTER_DIRECTORY
+        try:
+            os.makedirs(dead_letter_directory, exist_ok=True)
+            await asyncio.to_thread(shutil.move, self.logs_directory / file_name, dead_letter_directory / file_name)
+        except Exception:
+            LOGGER.error(traceback.format_exc())
+        LOGGER.error(f"Stats resubmission for {file_name} failed permanently, moved to {dead_letter_directory}. Reason: {reason}")
+        if get_mqtt():
+            get_mqtt().publish_json("manager/admin", {"event_type": "stats_resubmission_failure", "file_name": file_name, "message": reason})
+        await self.save_state()
+
+    async def process(self, file_name):
+        entry = self.pending.get(file_name)
+        if not entry:
+            return
+        file_path = self.logs_directory / file_name
+        if not file_path.exists():
+            LOGGER.debug(f"{file_name} no longer exists, removing it from the stats resubmission queue.")
+            self.pending.pop(file_name, None)
+            await self.save_state()
+            return
+
+        count_attempt = True
+        try:
+            if await self.resubmit_match_stats(entry['match_id'], file_path):
+                LOGGER.debug(f"Removing {file_path}")
+                os.remove(file_path)  # Remove the .stats file after processing
+                self.pending.pop(file_name, None)
+                self.stats['submitted'] += 1
+                await self.save_state()
+                return
+            error = "Master server did not accept the stats"
+        except HoNStatsRejectedError as e:
+            await self.dead_letter(file_name, str(e))
+            return
+        except HoNServerConnectionError as e:
+            error = str(e)
+            count_attempt = False
+        except HoNAuthenticationError as e:
+            LOGGER.warn(f"Stats resubmission for {file_name}: {e}")
+            error = str(e)
+        except Exception:
+            LOGGER.error(f"Error resubmitting {file_name}: {traceback.format_exc()}")
+            error = "Unexpected error, see the log"
+
+        if count_attempt:
+            entry['attempts'] += 1
+            if entry['attempts'] >= self.max_attempts:
+                await self.dead_letter(file_name, f"Failed {entry['attempts']} times. Last error: {error}")
+                return
+        self.stats['retried'] += 1
+        delay = min(self.base_backoff * 2 ** max(entry['attempts'] - 1, 0), self.max_backoff) * random.uniform(0.8, 1.2)
+        entry['next_attempt'] = time.time() + delay
+        entry['last_error'] = error
+        self.schedule(file_name, delay)
+        LOGGER.debug(f"Stats resubmission for {file_name} failed ({error}). Retrying in {delay:.0f} seconds (attempt {entry['attempts']}/{self.max_attempts}).")
+        await self.save_state()
+
+    async def worker(self):
+        while True:
+            file_name = await self.ready.get()
+            await self.wait_for_rate_limit()
+            try:
+                await self.process(file_name)
+            except Exception:
+                LOGGER.error(f"Stats resubmission worker error: {traceback.format_exc()}")
+
+    async def run(self):
+        """ Restore the pending queue, pick up stats files written while the manager was down, then watch for new ones and submit them. """
+        self.load_state()
+        now = time.time()
+        for file_name, entry in self.pending.items():
+            self.schedule(file_name, entry['next_attempt'] - now)
+        if await log_index.wait_ready(self.logs_directory):
+            # the log index already watches the logs directory, and passes on new files
+            log_index.add_listener(self.on_file_event)
+            file_names = [entry.path.name for entry in log_index.find(suffix='.stats')]
+        else:
+            self.watcher = DirectoryWatcher(self.logs_directory, self.on_file_event, suffixes=['.stats'])
+            try:
+                self.watcher.start()
+            except Exception:
+                LOGGER.error(f"Unable to watch {self.logs_directory} for new stats files, they will only be found at startup. {traceback.format_exc()}")
+            try:
+                file_names = await asyncio.to_thread(self.scan)
+            except Exception:
+                LOGGER.error(f"Error while listing the stats directory: {traceback.format_exc()}")
+                file_names = []
+        discovered = [file_name for file_name in file_names if self.discover(file_name)]
+        if discovered:
+            LOGGER.info(f"Found {len(discovered)} stats files to resubmit.")
+        await self.save_state()
+
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.max_concurrent)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            for timer in self.timers.values():
+                timer.cancel()
+            log_index.remove_listener(self.on_file_event)
+            if self.watcher:
+                self.watcher.stop()
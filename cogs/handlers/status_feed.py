@@ -0,0 +1,165 @@
+import traceback
+import asyncio
+import json
+from cogs.misc.logger import get_logger
+
+LOGGER = get_logger()
+
+RESYNC = object()
+
+class StatusSubscriber:
+    """
+        A client of the status feed, with a bounded buffer of encoded messages. Diffs only make sense applied in order, so instead of
+        dropping some of them, a client which lets its buffer fill has it emptied, and is sent a new snapshot when it next reads.
+    """
+    def __init__(self, max_buffer):
+        self.queue = asyncio.Queue(maxsize=max_buffer)
+        self.resyncs = 0
+
+    def offer(self, message):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.resyncs += 1
+            return
+        self.queue.put_nowait(message)
+
+class InstanceStatusFeed:
+    """
+        The web UI status of every game server (get_pretty_status_for_webui()), rendered once per change of that server's state rather than once per request.
+
+        Game servers are added with add_server() and removed with remove_server(). A server is re-rendered after its GameState revision changes
+        (status packets, match changes, a scheduled shutdown...), and only the fields which differ are sent to subscribers, batched every
+        flush_interval seconds. Each message is encoded once, and shared by every subscriber. Messages are server-sent events:
+            event: snapshot, data: {name: status, ...}, sent first and after a subscriber fell behind.
+            event: diff, data: {name: {field: value, ...}, ...}, with a whole status for a new server and null for a removed one.
+        Runs on the event loop.
+    """
+    def __init__(self, flush_interval=0.5, max_buffer=100, max_subscribers=500):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_subscribers = max_subscribers
+        self.servers = {}
+        self.names = {}
+        self.rendered = {}
+        self.dirty = set()
+        self.removed = []
+        self.subscribers = []
+        self.flush_handle = None
+        self.sequence = 0
+        self.snapshot_cache = None
+        self.stats = {
+            'renders': 0,
+            'diffs_sent': 0,
+            'snapshots_encoded': 0,
+            'resyncs': 0
+        }
+
+    def add_server(self, game_server):
+        self.servers[game_server.id] = game_server
+        game_server.game_state.add_revision_listener(self.on_revision)
+        self.on_revision(game_server.game_state)
+
+    def remove_server(self, game_server):
+        if self.servers.pop(game_server.id, None) is None:
+            return
+        game_server.game_state.remove_revision_listener(self.on_revision)
+        self.dirty.discard(game_server.id)
+        self.rendered.pop(game_server.id, None)
+        name = self.names.pop(game_server.id, None)
+        if name is not None:
+            self.removed.append(name)
+        self.schedule_flush()
+
+    def invalidate(self):
+        """ Re-render every server, e.g. after the configuration changed. """
+        self.dirty.update(self.servers)
+        self.schedule_flush()
+
+    def on_revision(self, game_state):
+        self.dirty.add(game_state.id)
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        # without subscribers, servers are only rendered when the status is asked for
+        if self.subscribers and self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        self.flush_handle = None
+        self.refresh()
+
+    def render(self, server_id):
+        game_server = self.servers[server_id]
+        status = game_server.get_pretty_status_for_webui()
+        self.stats['renders'] += 1
+        return game_server.config.get_local_by_key('svr_name'), status
+
+    def refresh(self):
+        """ Render the servers whose state changed, and send what differs from their last status to the subscribers. """
+        if not self.dirty and not self.removed:
+            return
+        changes = {name: None for name in self.removed}
+        self.removed = []
+        for server_id in list(self.dirty):
+            try:
+                name, status = self.render(server_id)
+            except Exception:
+                LOGGER.error(f"GameServer #{server_id} - Unable to render the status: {traceback.format_exc()}")
+                continue
+            old_name = self.names.get(server_id)
+            old_status = self.rendered.get(server_id)
+            self.names[server_id] = name
+            self.rendered[server_id] = status
+            if old_name != name or old_status is None:
+                if old_name is not None and old_name != name:
+                    changes[old_name] = None
+                changes[name] = status
+                continue
+            diff = {field: value for field, value in status.items() if old_status.get(field) != value}
+            if diff:
+                changes[name] = diff
+        self.dirty.clear()
+        if not changes:
+            return
+        self.snapshot_cache = None
+        if self.subscribers:
+            self.sequence += 1
+            message = f"id: {self.sequence}\nevent: diff\ndata: {json.dumps(changes)}\n\n"
+            for subscriber in self.subscribers:
+                subscriber.offer(message)
+            self.stats['diffs_sent'] += len(self.subscribers)
+
+    def snapshot(self):
+        """ The status of every server, keyed by server name. """
+        self.refresh()
+        return {self.names[server_id]: self.rendered[server_id] for server_id in self.servers if server_id in self.rendered}
+
+    def snapshot_message(self):
+        self.refresh()
+        if self.snapshot_cache is None:
+            self.snapshot_cache = f"id: {self.sequence}\nevent: snapshot\ndata: {json.dumps(self.snapshot())}\n\n"
+            self.stats['snapshots_encoded'] += 1
+        return self.snapshot_cache
+
+    def subscribe(self, max_buffer=None):
+        """ Returns a StatusSubscriber, or None if there are max_subscribers already. """
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        subscriber = StatusSubscriber(min(max_buffer or self.max_buffer, self.max_buffer))
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+            self.stats['resyncs'] += subscriber.resyncs
+
+    async def next_message(self, subscriber):
+        message = await subscriber.queue.get()
+        if message is RESYNC:
+            return self.snapshot_message()
+        return message
+
+instance_status_feed = InstanceStatusFeed()
@@ -13,6 +13,9 @@ class HoNConfigError(Exception):
 class HoNUnexpectedVersionError(Exception):
     """Raised when there is an issue with the hon files"""
 
+class HoNStatsRejectedError(Exception):
+    """Raised when resubmitted match stats are invalid, either rejected by the master server or unreadable. Resubmitting them again won't succeed."""
+
 class HoNPatchError(Exception):
     """Raised when there is an issue with patching"""
 
@@ -0,0 +1,205 @@
+import threading
+import locale
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+BLOCK_SIZE = 64 * 1024
+# "2026-10-18 12:00:00,000 - INFO - file.py:10 - message", as written by FileFormatter. Other lines continue the entry above them (tracebacks).
+ENTRY_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - ([A-Z]+) - ')
+
+class LogLineFilter:
+    """ Matches lines of a log by level and/or a case insensitive substring. Lines without a level take the level of their entry. """
+    def __init__(self, levels=None, contains=None):
+        self.levels = {level.strip().upper() for level in levels if level.strip()} if levels else None
+        self.contains = contains.lower() if contains else None
+
+    def __bool__(self):
+        return bool(self.levels or self.contains)
+
+    def key(self):
+        return (frozenset(self.levels or ()), self.contains)
+
+    def matches(self, line, level):
+        if self.levels and level not in self.levels:
+            return False
+        return self.contains is None or self.contains in line.lower()
+
+class LogFileReader:
+    """
+        Reads a text log from its end, a block at a time, so the cost of reading the last lines doesn't grow with the log.
+
+        Lines are addressed by byte offsets, which serve as pagination cursors: lines_before(offset) pages back through older lines,
+        and lines_after(offset) returns lines written since an earlier read. Only complete lines are returned, so a cursor never points
+        part way through a line. If the log was rotated and is now shorter than a cursor, lines_after() starts again from the beginning.
+        Results of tail() are cached until the log changes, as the same tail is polled repeatedly.
+    """
+    def __init__(self, path, encoding=None, block_size=BLOCK_SIZE, cache_size=32):
+        self.path = Path(path)
+        # logging's file handlers write with the locale's encoding unless told otherwise
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.block_size = block_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def decode(self, line):
+        return line.decode(self.encoding, errors='replace').rstrip('\r')
+
+    def iter_backward(self, file, end):
+        """ Yields (offset, end, line) for each complete line which ends before the byte offset end, the last line first. """
+        position = end
+        carry = b''
+        trailing = True
+        while position > 0:
+            read = min(self.block_size, position)
+            position -= read
+            file.seek(position)
+            lines = (file.read(read) + carry).split(b'\n')
+            carry = b''
+            if trailing:
+                # the text after the last newline is either nothing, or a line still being written
+                lines.pop()
+                if not lines:
+                    continue
+                trailing = False
+            offset = position
+            if position > 0:
+                # the first line may have started in an earlier block
+                carry = lines.pop(0)
+                offset += len(carry) + 1
+            lines_read = []
+            for line in lines:
+                lines_read.append((offset, offset + len(line) + 1, line))
+                offset += len(line) + 1
+            for offset, line_end, line in reversed(lines_read):
+                yield offset, line_end, self.decode(line)
+
+    def iter_forward(self, file, start):
+        """ Yields (offset, end, line) for each complete line starting at or after the byte offset start, which must be the start of a line. """
+        file.seek(start)
+        offset = start
+        partial = b''
+        while block := file.read(self.block_size):
+            lines = (partial + block).split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                yield offset, offset + len(line) + 1, self.decode(line)
+                offset += len(line) + 1
+
+    def filter_backward(self, lines, line_filter):
+        """ Filters lines read backwards. A line's level is only known once its entry's first line is reached, so continuation lines wait for it. """
+        pending = []
+        for item in lines:
+            entry = ENTRY_PATTERN.match(item[2])
+            if entry is None:
+                pending.append(item)
+                continue
+            level = entry.group(1)
+            for pending_item in pending + [item]:
+                if line_filter.matches(pending_item[2], level):
+                    yield pending_item
+            pending = []
+        # lines at the start of the log, before its first entry, have no level
+        for pending_item in pending:
+            if line_filter.matches(pending_item[2], None):
+                yield pending_item
+
+    def filter_forward(self, lines, line_filter):
+        level = None
+        for item in lines:
+            entry = ENTRY_PATTERN.match(item[2])
+            if entry:
+                level = entry.group(1)
+            if line_filter.matches(item[2], level):
+                yield item
+
+    def entry_level(self, file, offset):
+        """ The level of the entry which the line before offset belongs to, for lines read from offset which continue that entry. """
+        for _, _, line in self.iter_backward(file, offset):
+            if entry := ENTRY_PATTERN.match(line):
+                return entry.group(1)
+        return None
+
+    def lines_before(self, offset=None, limit=100, line_filter=None):
+        """
+        Up to limit lines ending before the byte offset (the end of the log if None), newest first.
+
+        Returns:
+            tuple: ([(offset, line), ...], the offset to read older lines before, or None if the start of the log was reached,
+                the offset after the newest line returned, to read newer lines from, or None if none were, size of the log)
+        """
+        result = []
+        after = None
+        if limit <= 0:
+            return result, offset, after, os.path.getsize(self.path)
+        with open(self.path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            lines = self.iter_backward(file, size if offset is None else min(offset, size))
+            if line_filter:
+                lines = self.filter_backward(lines, line_filter)
+            for line_offset, line_end, line in lines:
+                if after is None:
+                    after = line_end
+                result.append((line_offset, line))
+                if len(result) >= limit:
+                    break
+        before = result[-1][0] if len(result) >= limit and result[-1][0] > 0 else None
+        return result, before, after, size
+
+    def lines_after(self, offset=0, limit=100, line_filter=None):
+        """
+        Up to limit lines starting at or after the byte offset, oldest first.
+
+        Returns:
+            tuple: ([(offset, line), ...], the offset to read newer lines from, size of the log, whether the log was rotated since offset)
+        """
+        with open(self.path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            rotated = offset > size
+            if rotated:
+                offset = 0
+            result = []
+            after = offset
+            level = self.entry_level(file, offset) if line_filter and line_filter.levels else None
+            for line_offset, line_end, line in self.iter_forward(file, offset):
+                entry = ENTRY_PATTERN.match(line)
+                if entry:
+                    level = entry.group(1)
+                if line_filter and not line_filter.matches(line, level):
+                    # skipped lines needn't be read again
+                    after = line_end
+                    continue
+                if len(result) >= limit:
+                    break
+                result.append((line_offset, line))
+                after = line_end
+        return result, after, size, rotated
+
+    def tail(self, num, line_filter=None):
+        """ The last num lines of the log (matching line_filter, if given), newest first. """
+        stat = os.stat(self.path)
+        key = (stat.st_size, stat.st_mtime_ns, num, line_filter.key() if line_filter else None)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        lines = [line for _, line in self.lines_before(None, num, line_filter)[0]]
+        with self.lock:
+            self.cache[key] = lines
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return lines
+
+    def stream(self, line_filter):
+        """ The lines of the whole log matching line_filter, as encoded chunks for a streaming response. """
+        with open(self.path, 'rb') as file:
+            chunk = []
+            for _, _, line in self.filter_forward(self.iter_forward(file, 0), line_filter):
+                chunk.append(line)
+                if len(chunk) >= 1000:
+                    yield ('\n'.join(chunk) + '\n').encode('utf-8')
+                    chunk = []
+            if chunk:
+                yield ('\n'.join(chunk) + '\n').encode('utf-8')
@@ -1,6 +1,7 @@
-import asyncio
 import re
 from cogs.misc.logger import get_logger, get_misc
+from cogs.handlers.log_index import log_index
+from cogs.game.match_parser import match_log_followers
 
 LOGGER = get_logger()
 MISC = get_misc()
@@ -18,38 +19,21 @@ async def extract_player_info(log_file_path, target_player_name=None):
         list or str: A list of tuples containing player names and IPs if
                      target_player_name is None, else the IP of the target player.
     """
-    # Regular expressions for extracting player names and IPs
-    name_re = re.compile(r'Name: (.+)')
-    ip_re = re.compile(r'IP: (.+)')
-    
     try:
-        # Open the file with UTF-16 LE encoding
-        loop = asyncio.get_running_loop()
-        with open(log_file_path, 'r', encoding='utf-16-le') as file:
-            # Run the blocking file read operation in the default thread pool
-            log_content = await loop.run_in_executor(None, file.read)
-            
-            # Find all names and IPs
-            names = name_re.findall(log_content)
-            ips = ip_re.findall(log_content)
-            
+        # Only the lines appended since the log was last read are parsed
+        follower = match_log_followers.get(log_file_path)
+        if await follower.refresh():
+            player_info = follower.get_player_ips()
+
             # Check if target_player_name is provided
             if target_player_name:
-                # Pair names and IPs together and create a dictionary
-                player_dict = dict(zip(names, ips))
                 # Return the IP of the target player
-                return player_dict.get(target_player_name, None)
+                return dict(player_info).get(target_player_name, None)
             else:
-                # Pair names and IPs together
-                player_info = list(zip(names, ips))
                 return player_info
-
-    except FileNotFoundError:
         print(f"File not found: {log_file_path}")
     except PermissionError:
         print(f"Permission denied: {log_file_path}")
-    except UnicodeDecodeError:
-        print(f"Error decoding file: {log_file_path}")
 
     # Return an empty list or None if an exception is encountered
     return [] if target_player_name is None else None
@@ -72,11 +56,18 @@ async def find_match_id_post_launch(slave_id, log_path):
         LOGGER.warning(f"GameServer #{slave_id} - Directory {log_path} does not exist.")
         return
     
-    # Get all matching files and their creation times
-    files_and_times = [
-        (f, f.stat().st_ctime)
-        for f in log_path.glob(f'Slave{slave_id}_M*_console.clog')
-    ]
+    # Get all matching files and their creation times, from the log index if it's ready
+    if log_index.covers(log_path):
+        files_and_times = [
+            (entry.path, entry.created)
+            for entry in log_index.find(slave_id=slave_id, suffix='.clog')
+            if entry.path.name.endswith('_console.clog') and entry.match_id
+        ]
+    else:
+        files_and_times = [
+            (f, f.stat().st_ctime)
+            for f in log_path.glob(f'Slave{slave_id}_M*_console.clog')
+        ]
 
     # If no files found, return None
     if not files_and_times:
@@ -106,37 +97,14 @@ async def find_game_info_post_launch(slave_id, file_path):
     Returns:
         dict: Lobby information
     """
-    loop = asyncio.get_running_loop()
-    
-    encoding = 'utf-16-le' if MISC.get_os_platform() == "win32" else 'utf-8'
     try:
-        with open(file_path, 'r', encoding=encoding) as file:
-            # Run the blocking file read operation in the default thread pool
-            text = await loop.run_in_executor(None, file.read)
-    except FileNotFoundError:
-        LOGGER.warning(f"GameServer #{slave_id} - File not found: {file_path}")
-        return
+        # Only the lines appended since the log was last read are parsed
+        follower = match_log_followers.get(file_path)
+        if not await follower.refresh():
+            LOGGER.warning(f"GameServer #{slave_id} - File not found: {file_path}")
+            return
     except PermissionError:
         LOGGER.warning(f"GameServer #{slave_id} - Permission denied: {file_path}")
         return
-    except UnicodeDecodeError:
-        LOGGER.warning(f"GameServer #{slave_id} - Error decoding file: {file_path}")
-        return
-    
-    # Regular expressions for extracting the necessary information
-    match_name_re = re.compile(r'INFO_MATCH name:"([^"]+)"')
-    map_name_re = re.compile(r'INFO_MAP name:"([^"]+)"')
-    map_mode_re = re.compile(r'INFO_SETTINGS mode:"([^"]+)"')
-    
-    # Extract information using the regular expressions
-    match_name = match_name_re.search(text)
-    map_name = map_name_re.search(text)
-    map_mode = map_mode_re.search(text)
 
-    # Extracting the matched groups or None if not found
-    info = {
-        'map': match_name.group(1).lower() if match_name else None,
-        'name': map_name.group(1).lower() if map_name else None,
-        'mode': map_mode.group(1).replace('Mode_','').lower() if map_mode else None
-    }
-    return info
\ No newline at end of file
+    return follower.get_lobby_info()
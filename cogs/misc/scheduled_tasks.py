@@ -13,6 +13,7 @@ from pathlib import Path
 from tinydb import TinyDB
 from cogs.misc.logger import get_logger, get_home
 from cogs.handlers.events import stop_event
+from cogs.handlers.log_index import log_index
 
 LOGGER = get_logger()
 HOME_PATH = get_home()
@@ -214,12 +215,13 @@ class ReplayCleaner(HonfiguratorSchedule):
         counter = 0
         if self.max_clog_age_days == 0:
             return counter
-        for clog in self.path_to_log_locally.glob("**/*.clog"):
-            if time.time() - clog.stat().st_mtime > self.max_clog_age_days * 86400:
-                counter += 1
-                self.delete(clog, method = "file")
-        for clog in self.path_to_log_locally.glob("**/*.log"):
-            if time.time() - clog.stat().st_mtime > self.max_clog_age_days * 86400:
+        # the log index has the modified time of every log, otherwise the logs directory is listed
+        if log_index.covers(self.path_to_log_locally):
+            logs = [(entry.path, entry.modified) for suffix in (".clog", ".log") for entry in log_index.find(suffix=suffix, subdirectories=True)]
+        else:
+            logs = [(clog, clog.stat().st_mtime) for pattern in ("**/*.clog", "**/*.log") for clog in self.path_to_log_locally.glob(pattern)]
+        for clog, modified in logs:
+            if time.time() - modified > self.max_clog_age_days * 86400:
                 counter += 1
                 self.delete(clog, method = "file")
         return counter
@@ -131,6 +131,10 @@ class SetupEnvironment:
                 },
                 "filebeat": {
                     "send_diagnostics_data" : True
+                },
+                "mqtt": {
+                    "delta_status": False,
+                    "snapshot_interval": 300
                 }
             }
         }
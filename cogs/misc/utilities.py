@@ -1,4 +1,5 @@
 import subprocess, psutil
+import socket
 import os
 import hashlib
 import crcmod
@@ -21,8 +22,166 @@ import time
 LOGGER = get_logger()
 HOME_PATH = get_home()
 
+class PortIndex:
+    """
+        Index of which process owns which local port, built from a single psutil.net_connections() scan.
+
+        psutil can't tell us about a single port, every lookup means reading the whole socket table. Instead the table is read once,
+        and lookups are answered from the index until it is older than ttl seconds. A lookup that misses (no process on the port) only
+        triggers a rescan if the index is older than miss_ttl seconds, so bulk lookups at startup share one scan, while a server
+        that has only just bound its port is still found shortly after.
+        Answers can be up to ttl seconds old. Lookups deciding whether to terminate, start or adopt a process pass fresh=True, which rescans
+        first unless the index is under fresh_ttl seconds old, so a burst of such decisions (servers starting or connecting together) shares a scan.
+    """
+    def __init__(self, ttl=5, miss_ttl=1, fresh_ttl=0.5):
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.fresh_ttl = fresh_ttl
+        self.ports = {}
+        self.established = {}
+        self.bound = set()
+        self.built_at = 0
+        self.scans = 0
+
+    @staticmethod
+    def connection_kind(connection):
+        protocol = 'tcp' if connection.type == socket.SOCK_STREAM else 'udp'
+        return f"{protocol}{6 if connection.family == socket.AF_INET6 else 4}"
+
+    def refresh(self):
+        ports = {}
+        established = {}
+        bound = set()
+        for connection in psutil.net_connections(kind='inet'):
+            if not connection.laddr:
+                continue
+            kind = self.connection_kind(connection)
+            bound.add((kind[:3], connection.laddr.port))
+            if connection.pid is None:
+                continue    # owned by a process we aren't allowed to inspect
+            ports.setdefault((kind, connection.laddr.port), connection.pid)
+            ports.setdefault((kind[:3], connection.laddr.port), connection.pid)
+            if connection.raddr and connection.status == 'ESTABLISHED':
+                established[(connection.laddr.port, connection.raddr.port)] = connection.pid
+        self.ports = ports
+        self.established = established
+        self.bound = bound
+        self.built_at = time.monotonic()
+        self.scans += 1
+
+    def age(self):
+        return time.monotonic() - self.built_at
+
+    def _lookup(self, index_name, key, fresh=False):
+        if self.age() > (self.fresh_ttl if fresh else self.ttl):
+            self.refresh()
+        value = getattr(self, index_name).get(key) if index_name != 'bound' else (key in self.bound or None)
+        if value is None and not fresh and self.age() > self.miss_ttl:
+            self.refresh()
+            value = getattr(self, index_name).get(key) if index_name != 'bound' else (key in self.bound or None)
+        return value
+
+    def get_pid(self, port, protocol='udp4', fresh=False):
+        """ The PID bound to the local port. protocol is one of tcp4, tcp6, udp4, udp6, or tcp / udp for either address family. """
+        return self._lookup('ports', (protocol, port), fresh)
+
+    def get_established_pid(self, local_port, remote_port, fresh=False):
+        """ The PID of an established connection with the given local and remote ports. """
+        return self._lookup('established', (local_port, remote_port), fresh)
+
+    def is_bound(self, port, protocol='udp', fresh=False):
+        """ Whether anything is bound to the local port (tcp or udp), even if the owning process can't be inspected. """
+        return bool(self._lookup('bound', (protocol, port), fresh))
+
+    def resolve_ports(self, ports, protocol='udp4'):
+        """ Resolve many ports with a single scan of the socket table. Returns {port: pid or None}. """
+        self.refresh()
+        return {port: self.ports.get((protocol, port)) for port in ports}
+
+class ProcessRegistry:
+    """
+        Snapshot of the process table, indexed by process name and by game server slave ID.
+
+        Finding a game server by slave ID used to mean walking psutil.process_iter() and reading each process' name and command line,
+        once for every lookup. Instead the table is read once with the name and command line prefetched, the svr_slave ID is parsed
+        out of the -execute argument, and lookups are answered from the snapshot until it is older than ttl seconds.
+        Processes that have exited since the snapshot was taken are left out of the results.
+    """
+    def __init__(self, ttl=2):
+        self.ttl = ttl
+        self.by_name = {}
+        self.by_slave_id = {}
+        self.processes = []
+        self.built_at = 0
+        self.scans = 0
+
+    @staticmethod
+    def parse_slave_id(cmdline):
+        """ The svr_slave ID from the -execute argument of a game server command line, or None. """
+        if not cmdline or len(cmdline) < 5:
+            return None
+        for i in range(len(cmdline) - 1):
+            if cmdline[i] == "-execute":
+                for item in cmdline[i+1].split(";"):
+                    if "svr_slave" in item:
+                        try:
+                            return int(item.split(" ")[-1])
+                        except ValueError:
+                            return None
+        return None
+
+    def refresh(self):
+        by_name = {}
+        by_slave_id = {}
+        processes = []
+        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+            # attributes we aren't allowed to read come back as None
+            processes.append(proc)
+            by_name.setdefault(proc.info['name'], []).append(proc)
+            slave_id = self.parse_slave_id(proc.info['cmdline'])
+            if slave_id is not None:
+                by_slave_id.setdefault(slave_id, []).append(proc)
+        self.by_name = by_name
+        self.by_slave_id = by_slave_id
+        self.processes = processes
+        self.built_at = time.monotonic()
+        self.scans += 1
+
+    def invalidate(self):
+        """ Rescan on the next lookup. """
+        self.built_at = 0
+
+    def age(self):
+        return time.monotonic() - self.built_at
+
+    def _snapshot(self, refresh):
+        if refresh or self.age() > self.ttl:
+            self.refresh()
+
+    @staticmethod
+    def _alive(procs):
+        return [proc for proc in procs if proc.is_running()]
+
+    def get(self, name, slave_id='', refresh=False):
+        """ Running processes with the given name, optionally only the game server with the given slave ID. """
+        self._snapshot(refresh)
+        if slave_id == '':
+            return self._alive(self.by_name.get(name, []))
+        return self._alive([proc for proc in self.by_slave_id.get(slave_id, []) if proc.info['name'] == name])
+
+    def find_by_cmdline_keyword(self, keyword, name=None, refresh=False):
+        """ The first running process with keyword as one of its command line arguments, optionally only with the given name. """
+        self._snapshot(refresh)
+        procs = self.by_name.get(name, []) if name else self.processes
+        for proc in procs:
+            if proc.info['cmdline'] and keyword in proc.info['cmdline'] and proc.is_running():
+                return proc
+        return None
+
 class Misc:
     def __init__(self):
+        self.port_index = PortIndex()
+        self.process_registry = ProcessRegistry()
         self.cpu_count = psutil.cpu_count(logical=True)
         self.cpu_name = get_cpu_info().get('brand_raw', 'Unknown CPU')
         self.total_ram = psutil.virtual_memory().total
@@ -84,66 +243,43 @@ class Misc:
         return base_cmd
 
     def parse_linux_procs(self, proc_name, slave_id):
-        for proc in psutil.process_iter():
-            if proc_name == proc.name():
-                if slave_id == '':
-                    return [ proc ]
-                else:
-                    cmd_line = proc.cmdline()
-                    if len(cmd_line) < 5:
-                        continue
-                    for i in range(len(cmd_line)):
-                        if cmd_line[i] == "-execute":
-                            for item in cmd_line[i+1].split(";"):
-                                if "svr_slave" in item:
-                                    if int(item.split(" ")[-1]) == slave_id:
-                                        return [ proc ]
-        return []
-
-    def get_proc(self, proc_name, slave_id=''):
-        if sys.platform == "linux":
-            return self.parse_linux_procs(proc_name, slave_id)
-        procs = []
-        for proc in psutil.process_iter():
-            try:
-                if proc_name == proc.name():
-                    if slave_id == '':
-                        procs.append(proc)
-                    else:
-                        cmd_line = proc.cmdline()
-                        if len(cmd_line) < 5:
-                            continue
-                        for i in range(len(cmd_line)):
-                            if cmd_line[i] == "-execute":
-                                for item in cmd_line[i+1].split(";"):
-                                    if "svr_slave" in item:
-                                        if int(item.split(" ")[-1]) == slave_id:
-                                            procs.append(proc)
-            except psutil.NoSuchProcess:
-                pass
-        return procs
-
-    def get_process_by_port(self, port, protocol='udp4'):
-        for connection in psutil.net_connections(kind=protocol):
-            if connection.laddr.port == port:
-                return psutil.Process(connection.pid)
-        return None
+        return self.process_registry.get(proc_name, slave_id)[:1]
+
+    def get_proc(self, proc_name, slave_id='', refresh=False):
+        """ Running processes with the given name (or the game server with the given slave ID), from the shared process registry. """
+        return self.process_registry.get(proc_name, slave_id, refresh=refresh)
 
-    def get_client_pid_by_tcp_source_port(self, local_server_port, client_source_port):
+    def get_process_by_port(self, port, protocol='udp4', fresh=False):
+        """ fresh=True rescans the socket table first (unless it was scanned within fresh_ttl), for decisions to terminate, start or adopt a process. """
+        return self._process_from_pid(self.port_index.get_pid(port, protocol, fresh), lambda: self.port_index.get_pid(port, protocol))
+
+    def resolve_ports(self, ports, protocol='udp4'):
+        """
+        Get the Process objects owning each of the given local ports, with a single scan of the socket table.
+        Returns {port: psutil.Process or None}.
+        """
+        return {port: self._process_from_pid(pid) for port, pid in self.port_index.resolve_ports(ports, protocol).items()}
+
+    def get_client_pid_by_tcp_source_port(self, local_server_port, client_source_port, fresh=False):
         """
         Get the Process object of a local client based on its source port and the server port it's connecting to.
         """
-        for connection in psutil.net_connections(kind='inet'):
-            # Check for a match on both client source port and server port
-            if connection.laddr.port == client_source_port and connection.raddr.port == local_server_port and connection.status == 'ESTABLISHED':
-                return psutil.Process(connection.pid)
-        return None
+        return self._process_from_pid(self.port_index.get_established_pid(client_source_port, local_server_port, fresh), lambda: self.port_index.get_established_pid(client_source_port, local_server_port))
 
-    def check_port(self, port):
-        for conn in psutil.net_connections('udp'):
-            if conn.laddr.port == port:
-                return True
-        return False
+    def _process_from_pid(self, pid, retry=None):
+        """ psutil.Process for a PID from the port index. If the process has since exited, the index is stale, so rescan once and retry. """
+        if pid is None:
+            return None
+        try:
+            return psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            if retry is None:
+                return None
+            self.port_index.refresh()
+            return self._process_from_pid(retry())  # no retry this time, the index was just rebuilt
+
+    def check_port(self, port, fresh=False):
+        return self.port_index.is_bound(port, 'udp', fresh)
 
     def get_process_priority(proc_name):
         pid = False
@@ -284,15 +420,7 @@ class Misc:
         return f"cpu: {self.get_cpu_name()}"
 
     def find_process_by_cmdline_keyword(self, keyword, proc_name=None):
-        for process in psutil.process_iter(['cmdline']):
-            if process.info['cmdline']:
-                if keyword in process.info['cmdline']:
-                    if proc_name:
-                        if proc_name == process.name():
-                            return process
-                    else:
-                        return process
-        return None
+        return self.process_registry.find_by_cmdline_keyword(keyword, proc_name)
 
     def get_svr_version(self,hon_exe):
         def validate_version_format(version):
@@ -0,0 +1,181 @@
+"""
+Load generator for the game server -> manager TCP receive path (cogs/TCP/game_packet_lsnr.py).
+
+Starts a listener using either the previous StreamReader receive loop (a readexactly() and wait_for() per header and body, and a
+1 ms sleep after every packet) or GameServerProtocol, then connects --servers fake game servers from a separate process. Each one
+sends a server hello, followed by 0x42 status packets at --rate packets per second (0 sends as fast as the socket allows).
+The packets are handed to a parser that only counts them, so only the receive path is measured. The protocol path hands the
+parser batches, in which superseded status packets are skipped; these are reported as collapsed.
+While the load runs, the listener's event loop lag is sampled every 10 ms.
+Usage: python utilities/benchmarks/game_server_load_generator.py [--servers 40] [--rate 20] [--duration 10] [--mode both]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import statistics
+import time
+from cogs.TCP.game_packet_lsnr import GameServerProtocol
+from cogs.TCP.packet_parser import GameManagerParser
+from utilities.benchmarks.status_packet_benchmark import build_status_packet
+
+BASE_GAME_PORT = 10001
+LAG_SAMPLE_INTERVAL = 0.01
+
+class CountingParser(GameManagerParser):
+    def __init__(self, counter):
+        super().__init__(None)
+        self.counter = counter
+
+    async def handle_packets(self, packets, game_server=None, cowmaster=None):
+        await super().handle_packets(packets, game_server, cowmaster)
+        self.counter['collapsed'] = self.counter.get('collapsed', 0) + self.status_packet_counters['collapsed']
+        self.status_packet_counters['collapsed'] = 0
+
+    async def handle_packet(self, packet, game_server=None, cowmaster=None):
+        self.counter['packets'] += 1
+
+class FakeGameServer:
+    def __init__(self, port, counter):
+        self.id = port - BASE_GAME_PORT + 1
+        self.port = port
+        self.game_manager_parser = CountingParser(counter)
+
+    def reset_game_state(self):
+        pass
+
+class FakeCowMaster:
+    def get_port(self):
+        return None
+
+class FakeManager:
+    """ The parts of GameServerManager used by the receive path. """
+    def __init__(self, counter):
+        self.counter = counter
+        self.cowmaster = FakeCowMaster()
+        self.game_servers = {}
+        self.client_connections = {}
+
+    def get_game_server_by_port(self, port):
+        return self.game_servers.setdefault(port, FakeGameServer(port, self.counter))
+
+    def create_game_server(self, port):
+        return self.get_game_server_by_port(port)
+
+    async def add_client_connection(self, client_connection, port):
+        self.client_connections[port] = client_connection
+
+    async def remove_client_connection(self, client_connection):
+        for port, connection in list(self.client_connections.items()):
+            if connection is client_connection:
+                del self.client_connections[port]
+
+async def legacy_handle_client(reader, writer, manager, timeout=60):
+    """ The previous receive loop: two wait_for(readexactly()) calls per packet, and a 1 ms sleep after every packet. """
+    async def receive_packet():
+        length_bytes = await asyncio.wait_for(reader.readexactly(2), timeout)
+        length = int.from_bytes(length_bytes, byteorder='little')
+        data = await asyncio.wait_for(reader.readexactly(length), timeout)
+        return (length, data)
+
+    try:
+        hello = await receive_packet()
+        game_server = manager.get_game_server_by_port(int.from_bytes(hello[1][1:], byteorder='little'))
+        while True:
+            packet = await receive_packet()
+            await game_server.game_manager_parser.handle_packet(packet, game_server=game_server)
+            await asyncio.sleep(0.001)
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+async def sample_loop_lag(samples):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LAG_SAMPLE_INTERVAL
+        await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+        samples.append(max(loop.time() - expected, 0))
+
+def frame(data):
+    return len(data).to_bytes(2, byteorder='little') + data
+
+async def fake_game_server(port, listener_port, rate, duration, packet):
+    reader, writer = await asyncio.open_connection('127.0.0.1', listener_port)
+    writer.write(frame(b'\x40' + port.to_bytes(2, byteorder='little')))
+    packet = frame(packet)
+    sent = 0
+    started = time.monotonic()
+    end = started + duration
+    while time.monotonic() < end:
+        if rate:
+            writer.write(packet)
+            sent += 1
+            await writer.drain()
+            await asyncio.sleep(max(started + sent / rate - time.monotonic(), 0))
+        else:
+            writer.write(packet * 16)
+            sent += 16
+            await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+    return sent
+
+def run_fake_game_servers(servers, listener_port, rate, duration, players, result):
+    async def main():
+        packet = build_status_packet(players)
+        sent = await asyncio.gather(*[fake_game_server(BASE_GAME_PORT + i, listener_port, rate, duration, packet) for i in range(servers)])
+        result.value = sum(sent)
+    asyncio.run(main())
+
+async def run_mode(mode, args):
+    counter = {'packets': 0, 'collapsed': 0}
+    manager = FakeManager(counter)
+    loop = asyncio.get_running_loop()
+    if mode == 'legacy':
+        server = await asyncio.start_server(lambda reader, writer: legacy_handle_client(reader, writer, manager), '127.0.0.1', 0)
+    else:
+        server = await loop.create_server(lambda: GameServerProtocol(game_server_manager=manager), '127.0.0.1', 0)
+    listener_port = server.sockets[0].getsockname()[1]
+
+    lag_samples = []
+    lag_task = asyncio.create_task(sample_loop_lag(lag_samples))
+    sent = multiprocessing.Value('q', 0)
+    load = multiprocessing.Process(target=run_fake_game_servers, args=(args.servers, listener_port, args.rate, args.duration, args.players, sent))
+    started = time.monotonic()
+    load.start()
+    await loop.run_in_executor(None, load.join)
+    # let the listener finish handling what is still buffered
+    deadline = time.monotonic() + 5
+    while counter['packets'] + counter['collapsed'] < sent.value and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+    lag_task.cancel()
+    server.close()
+
+    lag_samples.sort()
+    print(f"{mode}: {args.servers} servers, {args.rate or 'unlimited'} packets/s each, {args.duration}s")
+    print(f"\tPackets sent:     {sent.value}, handled: {counter['packets']}, collapsed: {counter['collapsed']}")
+    print(f"\tThroughput:       {(counter['packets'] + counter['collapsed']) / elapsed:,.0f} packets/s")
+    if lag_samples:
+        print(f"\tLoop lag:         mean {statistics.mean(lag_samples) * 1000:.2f} ms, p99 {lag_samples[int(len(lag_samples) * 0.99)] * 1000:.2f} ms, max {lag_samples[-1] * 1000:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate game servers sending status packets to the manager listener")
+    parser.add_argument("--servers", type=int, default=40, help="Number of fake game servers")
+    parser.add_argument("--rate", type=int, default=20, help="Status packets per second per server (0 for unlimited)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to send for")
+    parser.add_argument("--players", type=int, default=10, help="Players in each status packet")
+    parser.add_argument("--mode", choices=["legacy", "protocol", "both"], default="both", help="Receive path to measure")
+    args = parser.parse_args()
+
+    # every fake server disconnecting at the end is logged as a warning
+    logging.getLogger('Server').setLevel(logging.ERROR)
+    for mode in (["legacy", "protocol"] if args.mode == "both" else [args.mode]):
+        asyncio.run(run_mode(mode, args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark for the GameState store in cogs/game/game_state.py.
+
+Replays a recorded-style stream of 0x42 status packets (a lobby filling up, a match starting, players leaving) through
+the previous get_full_key based store and the current path indexed store, then checks that both end up with the same state.
+Usage: python utilities/benchmarks/game_state_benchmark.py [--rounds 200]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import timeit
+from cogs.TCP.packet_parser import decode_status_players, STATUS_HEADER
+from cogs.game.game_state import GameState
+from utilities.benchmarks.status_packet_benchmark import build_status_packet
+
+LOCAL_CONFIG = {
+    'name': 'benchmark-1',
+    'params': {
+        'svr_port': 10001,
+        'svr_proxyPort': 11001,
+        'svr_proxyLocalVoicePort': 10061,
+        'svr_proxyRemoteVoicePort': 11061,
+        'man_enableProxy': True,
+        'host_affinity': '0'
+    }
+}
+
+class LegacyGameState:
+    """ The previous implementation of GameState.update, kept here for comparison. """
+    def __init__(self, id, local_config):
+        self._state = {}
+        self._performance = {}
+        self._listeners = []
+        self.id = id
+        self.local_config = local_config
+
+    def __getitem__(self, key, dict_to_check="state"):
+        target_dict = self._state if dict_to_check == "state" else self._performance
+        return target_dict[key]
+
+    def __setitem__(self, key, value, dict_to_check="state"):
+        if dict_to_check == "state":
+            self._state[key] = value
+        else:
+            self._performance[key] = value
+
+    def get_full_key(self, key, current_level, level=None, path=None, dict_to_check="state"):
+        if level is None:
+            level = self._state if dict_to_check == "state" else self._performance
+        if path is None:
+            path = []
+        if level is current_level:
+            path.append(key)
+            return ".".join(path)
+        for k, v in level.items():
+            if isinstance(v, dict):
+                new_path = path.copy()
+                new_path.append(k)
+                result = self.get_full_key(key, current_level, v, new_path, dict_to_check)
+                if result:
+                    return result
+        return None
+
+    def update(self, data, current_level=None, dict_to_check="state"):
+        monitored_keys = ["match_started", "match_info.mode", "game_phase", "players", "status"]
+        if current_level is None:
+            current_level = self._state if dict_to_check == "state" else self._performance
+        target_dict = self._state if dict_to_check == "state" else self._performance
+        for key, value in data.items():
+            if isinstance(value, dict):
+                if key not in current_level:
+                    current_level[key] = {}
+                self.update(value, current_level[key], dict_to_check)
+            else:
+                full_key = self.get_full_key(key, current_level, dict_to_check=dict_to_check)
+                if full_key in monitored_keys and (full_key not in target_dict or self.__getitem__(full_key, dict_to_check) != value):
+                    self.__setitem__(full_key, value, dict_to_check)
+                else:
+                    current_level[key] = value
+
+def build_stream():
+    """
+    A status packet stream for one match. The lobby fills up one player at a time, then the match runs with all 10 players
+    and the players drop off at the end. Each step repeats a few times, as the server sends a status packet every second.
+    """
+    stream = []
+    for num_players in list(range(0, 11)) + [10] * 20 + list(range(10, -1, -1)):
+        packet = bytearray(build_status_packet(num_players))
+        packet[1] = 3 if num_players else 1
+        packet[11] = 1 if num_players == 10 else 0
+        packet[40] = 6 if num_players == 10 else 1 if num_players else 0
+        for _ in range(3):
+            stream.append(bytes(packet))
+    return stream
+
+def decode_stream(stream):
+    """
+    Decode each packet into the updates GameManagerParser.server_status applies, without the unchanged-section cache.
+    Decoding is done once up front, so that the timings only cover the state store.
+    """
+    updates = []
+    for packet in stream:
+        _, status, uptime, server_load, num_clients, match_started = STATUS_HEADER.unpack_from(packet)
+        updates.append({
+            'status': status,
+            'uptime': uptime,
+            'cpu_core_util': server_load / 100,
+            'num_clients': num_clients,
+            'match_started': match_started,
+            'game_phase': packet[40],
+        })
+        updates.append({'players': [player._asdict() for player in decode_status_players(packet)]})
+        updates.append({'match_info': {'map': 'caldavar', 'mode': 'normal', 'name': 'benchmark'}})
+    return updates
+
+def replay(state, updates):
+    for update in updates:
+        state.update(update)
+
+def new_state(cls):
+    state = cls(1, LOCAL_CONFIG)
+    if isinstance(state, GameState):
+        state.clear()
+    else:
+        state.update(GameState(1, LOCAL_CONFIG).default_state())
+        state.update(GameState(1, LOCAL_CONFIG).default_performance(), dict_to_check="performance")
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GameState updates against a replayed status packet stream")
+    parser.add_argument("--rounds", type=int, default=200, help="Number of times to replay the stream")
+    args = parser.parse_args()
+
+    stream = build_stream()
+    updates = decode_stream(stream)
+
+    legacy = new_state(LegacyGameState)
+    current = new_state(GameState)
+    replay(legacy, updates)
+    replay(current, updates)
+    # the previous store wrote monitored nested keys to a flat dotted key at the top level, rather than into match_info
+    legacy._state.pop('match_info.mode', None)
+    legacy._state['match_info']['mode'] = current._state['match_info']['mode']
+    if legacy._state != current._state:
+        print("Stores disagree after replaying the stream!")
+        print(f"\tLegacy: {legacy._state}\n\tCurrent: {current._state}")
+        sys.exit(1)
+
+    legacy_time = timeit.timeit(lambda: replay(legacy, updates), number=args.rounds)
+    current_time = timeit.timeit(lambda: replay(current, updates), number=args.rounds)
+
+    num_packets = len(stream) * args.rounds
+    print(f"{len(stream)} status packets per stream, {args.rounds} rounds")
+    print(f"\tLegacy (get_full_key walk): {legacy_time * 1e6 / num_packets:.2f} usec/packet")
+    print(f"\tPath indexed store:         {current_time * 1e6 / num_packets:.2f} usec/packet")
+    print(f"\tSpeedup: {legacy_time / current_time:.2f}x")
+
+if __name__ == "__main__":
+    main()
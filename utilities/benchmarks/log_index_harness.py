@@ -0,0 +1,165 @@
+"""
+Test harness for the logs directory index (cogs/handlers/log_index.py), on a temporary logs directory filled with --files logs.
+
+Scenarios:
+    - find_match_id_post_launch and the latest console log lookup of tail_game_log_then_close, from the index and from the disk,
+      give the same result. The time per lookup is compared.
+    - Files created, written to and deleted are reflected in the index through file notifications, and listeners are told.
+    - A reconciliation scan picks up changes the notifications missed.
+    - ReplayCleaner.delete_clog_files deletes the same old logs using the index.
+Usage: python utilities/benchmarks/log_index_harness.py [--files 20000] [--slaves 20]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import glob
+import tempfile
+import time
+from pathlib import Path
+from cogs.misc.logger import set_home, set_misc
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+async def wait_until(condition, timeout=5):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+def fill_logs_directory(logs_directory, files, slaves):
+    """ Console logs for each slave, and match logs and diagnostics for each match, with the newest match last. """
+    match_id = 100000
+    created = 0
+    now = time.time()
+    while created < files:
+        for slave_id in range(1, slaves + 1):
+            match_id += 1
+            for name in (f"Slave{slave_id}_M{match_id}_console.clog", f"M{match_id}.log", f"Slave{slave_id}_M{match_id}_diagnostics.log"):
+                path = logs_directory / name
+                path.write_text("log")
+                # older matches have older files, a few of them older than the cleaner's maximum age
+                age = (files - created) * 60
+                os.utime(path, (now - age, now - age))
+                created += 1
+    return match_id
+
+def timed(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return result, (time.perf_counter() - start) / repeats
+
+async def main(args):
+    from cogs.handlers.scheduler import scheduler
+    from cogs.handlers.log_index import log_index
+    from cogs.misc.logparser import find_match_id_post_launch
+    from cogs.misc.scheduled_tasks import ReplayCleaner
+
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        logs_directory = Path(root) / "logs"
+        os.makedirs(logs_directory)
+        fill_logs_directory(logs_directory, args.files, args.slaves)
+
+        scheduler_task = asyncio.create_task(scheduler.run())
+        start = time.perf_counter()
+        log_index.start(logs_directory)
+        await log_index.wait_ready(logs_directory)
+        print(f"Indexed {len(log_index.files)} files in {time.perf_counter() - start:.2f}s")
+
+        # lookups, with the index and with the disk
+        slave_id = args.slaves // 2
+        indexed_match_id = await find_match_id_post_launch(slave_id, logs_directory)
+        start = time.perf_counter()
+        for _ in range(20):
+            await find_match_id_post_launch(slave_id, logs_directory)
+        indexed_seconds = (time.perf_counter() - start) / 20
+        indexed_latest, indexed_latest_seconds = timed(lambda: log_index.latest(slave_id=slave_id, suffix='.clog').path, 20)
+        log_index.is_ready = False
+        disk_match_id = await find_match_id_post_launch(slave_id, logs_directory)
+        start = time.perf_counter()
+        for _ in range(5):
+            await find_match_id_post_launch(slave_id, logs_directory)
+        disk_seconds = (time.perf_counter() - start) / 5
+        disk_latest, disk_latest_seconds = timed(lambda: Path(max(glob.glob(os.path.join(logs_directory, f"Slave{slave_id}_*.clog")), key=os.path.getmtime)), 5)
+        log_index.is_ready = True
+        results.append(report("Lookups match the disk", indexed_match_id == disk_match_id and indexed_latest == disk_latest,
+            f"find_match_id_post_launch: {indexed_match_id} in {indexed_seconds * 1000:.2f} ms from the index, {disk_match_id} in {disk_seconds * 1000:.2f} ms from the disk",
+            f"Latest console log: {indexed_latest.name} in {indexed_latest_seconds * 1000:.2f} ms from the index, {disk_latest.name} in {disk_latest_seconds * 1000:.2f} ms from the disk"))
+
+        # notifications
+        notified = []
+        log_index.add_listener(lambda event_type, path: notified.append((event_type, path.name)))
+        new_log = logs_directory / f"Slave{slave_id}_M999999_console.clog"
+        new_log.write_text("new match")
+        found = await wait_until(lambda: log_index.latest(slave_id=slave_id, suffix='.clog', key='created').path == new_log)
+        new_match_id = await find_match_id_post_launch(slave_id, logs_directory)
+        before = log_index.find(match_id=999999)[0].modified
+        await asyncio.sleep(0.05)
+        with open(new_log, 'a') as log:
+            log.write("more")
+        modified = await wait_until(lambda: log_index.find(match_id=999999)[0].modified > before)
+        new_log.unlink()
+        deleted = await wait_until(lambda: not log_index.find(match_id=999999))
+        # listeners are called on the event loop, after the index has changed
+        await asyncio.sleep(0.05)
+        results.append(report("Notifications keep the index current", found and new_match_id == '999999' and modified and deleted
+            and notified == [('created', new_log.name), ('deleted', new_log.name)],
+            f"Created found: {found} (match id {new_match_id}), write seen: {modified}, deletion seen: {deleted}, listener told: {notified}"))
+
+        # reconciliation, with the watcher stopped so changes are missed
+        log_index.watcher.stop()
+        notified.clear()
+        missed_log = logs_directory / f"Slave{slave_id}_M1000000_console.clog"
+        missed_log.write_text("missed")
+        await asyncio.sleep(0.2)
+        missed_before = len(log_index.find(match_id=1000000))
+        await log_index.reconcile()
+        await asyncio.sleep(0)
+        results.append(report("Reconciliation finds missed changes", missed_before == 0 and len(log_index.find(match_id=1000000)) == 1 and log_index.stats['corrections'] == 1
+            and notified == [('created', missed_log.name)],
+            f"Index stats: {log_index.stats}, listener told: {notified}"))
+        missed_log.unlink()
+        await log_index.reconcile()
+
+        # the replay cleaner, with the index and the disk giving the same logs to delete
+        max_age_days = 7
+        expected = sorted(str(path) for pattern in ("**/*.clog", "**/*.log") for path in logs_directory.glob(pattern) if time.time() - path.stat().st_mtime > max_age_days * 86400)
+        deleted_paths = []
+        cleaner = ReplayCleaner.__new__(ReplayCleaner)
+        cleaner.path_to_log_locally = logs_directory
+        cleaner.max_clog_age_days = max_age_days
+        cleaner.delete = lambda file_path, method: deleted_paths.append(str(file_path))
+        start = time.perf_counter()
+        count = cleaner.delete_clog_files()
+        cleaner_seconds = time.perf_counter() - start
+        results.append(report("Replay cleaner finds old logs from the index", count == len(expected) and sorted(deleted_paths) == expected,
+            f"{count} logs older than {max_age_days} days found in {cleaner_seconds * 1000:.1f} ms, {len(expected)} expected"))
+
+        log_index.stop()
+        scheduler_task.cancel()
+        await asyncio.gather(scheduler_task, return_exceptions=True)
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the logs directory index against a temporary logs directory")
+    parser.add_argument("--files", type=int, default=20000, help="Number of logs in the directory")
+    parser.add_argument("--slaves", type=int, default=20, help="Number of game servers writing logs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, and the modules using it, need a home directory and the shared Misc instance
+        os.makedirs(Path(home) / "logs")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+        if not asyncio.run(main(args)):
+            sys.exit(1)
@@ -0,0 +1,151 @@
+"""
+Test harness for the log reader behind the HoNfigurator log endpoints (cogs/misc/log_reader.py), on a generated server.log.
+
+Scenarios:
+    - tail() gives the same lines as the previous readlines() of the whole log. The time per call is compared, uncached and cached.
+    - Paging back with the 'before' cursor, and forward with the 'after' cursor, each return every line of the log exactly once,
+      with level and text filters giving the same lines as filtering the whole log. Traceback lines keep the level of their entry.
+    - Block boundaries anywhere in a line, a line still being written, and a rotated log.
+    - The filtered download streams the same lines as filtering the whole log.
+Usage: python utilities/benchmarks/log_reader_harness.py [--lines 300000]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from cogs.misc.log_reader import LogFileReader, LogLineFilter, ENTRY_PATTERN
+
+LEVELS = ["DEBUG", "INFO", "INFO", "INFO", "WARNING", "ERROR"]
+
+def write_log(log_path, lines, rng):
+    text = []
+    while len(text) < lines:
+        level = rng.choice(LEVELS)
+        text.append(f"2026-10-18 12:{len(text) // 6000 % 60:02d}:00,{len(text) % 1000:03d} - {level} - game_server.py:{rng.randint(1, 999)} - GameServer #{rng.randint(1, 20)} - message {len(text)} ✓")
+        if level == "ERROR":
+            text += ["Traceback (most recent call last):", f'  File "game_server.py", line {rng.randint(1, 999)}, in heartbeat', "KeyError: 'match_id'"]
+    log_path.write_text(''.join(f"{line}\n" for line in text), encoding='utf-8')
+    return text
+
+def filtered(lines, levels=None, contains=None):
+    """ The lines of the log matching the filter, each line taking the level of the entry it belongs to. """
+    result, level = [], None
+    for line in lines:
+        entry = ENTRY_PATTERN.match(line)
+        if entry:
+            level = entry.group(1)
+        if (not levels or level in levels) and (not contains or contains.lower() in line.lower()):
+            result.append(line)
+    return result
+
+def legacy_tail(log_path, num):
+    """ The previous /api/get_honfigurator_log_entries/{num}. """
+    with open(log_path, 'r', encoding='utf-8') as f:
+        file_content = f.readlines()
+    file_content = [line.strip() for line in file_content]
+    return file_content[-num:][::-1]
+
+def page_back(reader, limit, line_filter=None):
+    lines, before = [], None
+    while True:
+        page, before, _, _ = reader.lines_before(before, limit, line_filter)
+        lines += [line for _, line in page]
+        if before is None:
+            return lines[::-1]
+
+def page_forward(reader, limit, line_filter=None):
+    lines, after = [], 0
+    while True:
+        page, after, _, _ = reader.lines_after(after, limit, line_filter)
+        lines += [line for _, line in page]
+        if not page:
+            return lines
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+def main(args):
+    rng = random.Random(1)
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        log_path = Path(root) / "server.log"
+        lines = write_log(log_path, args.lines, rng)
+        reader = LogFileReader(log_path, encoding='utf-8')
+
+        # tail
+        start = time.perf_counter()
+        legacy = legacy_tail(log_path, 500)
+        legacy_seconds = time.perf_counter() - start
+        tail = reader.tail(500)
+        start = time.perf_counter()
+        for num in range(501, 521):
+            reader.tail(num)
+        tail_seconds = (time.perf_counter() - start) / 20
+        start = time.perf_counter()
+        cached = reader.tail(500)
+        cached_seconds = time.perf_counter() - start
+        errors = reader.tail(50, LogLineFilter(["error"]))
+        results.append(report("Tail matches the previous endpoint", [line.strip() for line in tail] == legacy and cached is tail and errors == filtered(lines, {"ERROR"})[-50:][::-1],
+            f"Last 500 of {len(lines)} lines ({log_path.stat().st_size / 1024 / 1024:.1f} MiB): {tail_seconds * 1000:.2f} ms reading from the end, {cached_seconds * 1000:.3f} ms cached, {legacy_seconds * 1000:.0f} ms with readlines()"))
+
+        # pagination, unfiltered and filtered
+        passed = True
+        details = []
+        for levels, contains in ((None, None), (["ERROR"], None), (None, "gameserver #7 "), (["WARNING", "ERROR"], "#1")):
+            line_filter = LogLineFilter(levels, contains)
+            expected = filtered(lines, set(levels or ()), contains)
+            start = time.perf_counter()
+            back = page_back(reader, 997, line_filter)
+            back_seconds = time.perf_counter() - start
+            forward = page_forward(reader, 997, line_filter)
+            passed = passed and back == expected and forward == expected
+            details.append(f"levels {levels}, text {contains!r}: {len(expected)} lines, paged back in {back_seconds * 1000:.0f} ms")
+        results.append(report("Paging covers every line once", passed, *details))
+
+        # block boundaries, with a small log and blocks smaller than a line
+        small_path = Path(root) / "small.log"
+        small_lines = write_log(small_path, 300, rng)
+        boundaries = True
+        for block_size in (1, 2, 7, 64, 1000):
+            small = LogFileReader(small_path, encoding='utf-8', block_size=block_size)
+            boundaries = boundaries and page_back(small, 13) == small_lines and page_forward(small, 13) == small_lines \
+                and page_back(small, 13, LogLineFilter(["ERROR"])) == filtered(small_lines, {"ERROR"})
+
+        # a line still being written isn't returned until it's complete
+        small = LogFileReader(small_path, encoding='utf-8')
+        _, _, after, _ = small.lines_before(None, 10)
+        with open(small_path, 'a', encoding='utf-8') as log:
+            log.write("2026-10-18 13:00:00,000 - INFO - api_server.py:1 - half writ")
+        partial_hidden = small.lines_before(None, 1)[0][0][1] == small_lines[-1] and small.lines_after(after, 10)[0] == []
+        with open(small_path, 'a', encoding='utf-8') as log:
+            log.write("ten\n")
+        completed = [line for _, line in small.lines_after(after, 10)[0]] == ["2026-10-18 13:00:00,000 - INFO - api_server.py:1 - half written"]
+
+        # rotated, so the cursor is beyond the new log
+        cursor = small_path.stat().st_size
+        small_path.write_text("2026-10-18 14:00:00,000 - INFO - main.py:1 - new log\n", encoding='utf-8')
+        page, _, _, rotated = small.lines_after(cursor, 10)
+        results.append(report("Block boundaries, partial lines and rotation", boundaries and partial_hidden and completed and rotated and [line for _, line in page] == ["2026-10-18 14:00:00,000 - INFO - main.py:1 - new log"],
+            f"Any block size: {boundaries}, partial line hidden: {partial_hidden}, then returned once complete: {completed}, rotation detected: {rotated}"))
+
+        # filtered download
+        start = time.perf_counter()
+        streamed = b''.join(reader.stream(LogLineFilter(["WARNING", "ERROR"]))).decode('utf-8').split('\n')[:-1]
+        stream_seconds = time.perf_counter() - start
+        results.append(report("Filtered download", streamed == filtered(lines, {"WARNING", "ERROR"}),
+            f"{len(streamed)} warning and error lines streamed in {stream_seconds * 1000:.0f} ms"))
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the log reader against a generated server.log")
+    parser.add_argument("--lines", type=int, default=300000, help="Lines in the generated log")
+    args = parser.parse_args()
+    if not main(args):
+        sys.exit(1)
@@ -0,0 +1,177 @@
+"""
+Test harness for the live log stream (/api/stream_honfigurator_log, cogs/handlers/log_stream.py), with the API server on a local port.
+
+Scenarios:
+    - Two streaming clients, one of them asking only for errors, get the records logged on the event loop and on other threads,
+      in order, with the time from logging a record to a client receiving it measured.
+    - Requests without a token are refused, and a client disconnecting is unsubscribed.
+    - A subscriber which doesn't read keeps at most its buffer of records, and is told how many were dropped.
+    - The cost of logging a record, with and without subscribers.
+The Discord token lookup is replaced with a fixed user, who is given the default roles, so no Discord account is needed.
+Usage: python utilities/benchmarks/log_stream_harness.py [--records 200]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import tempfile
+import time
+from pathlib import Path
+import aiohttp
+import uvicorn
+from cogs.misc.logger import set_home, set_misc, set_setup, get_logger
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+async def wait_until(condition, timeout=5):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def read_events(response, events, sent_times):
+    """ Collects the stream's records, with the delay from each being logged. """
+    event_type = 'message'
+    async for raw_line in response.content:
+        line = raw_line.decode('utf-8').rstrip('\n')
+        if line.startswith('event: '):
+            event_type = line[len('event: '):]
+        elif line.startswith('data: '):
+            data = json.loads(line[len('data: '):])
+            if event_type == 'message':
+                message = data['line'].rsplit(' - ', 1)[-1]
+                data['delay'] = time.perf_counter() - sent_times.get(message, time.perf_counter())
+            events.append((event_type, data))
+            event_type = 'message'
+
+async def main(args):
+    import cogs.connectors.api_server as api_server
+    from cogs.handlers.log_stream import log_broadcaster
+    logger = get_logger()
+    logger.setLevel(logging.DEBUG)
+
+    api_server.roles_database.add_default_data(discord_id="1")
+    api_server.app.dependency_overrides[api_server.verify_token] = lambda: {"token": "harness", "user_info": {"id": "1"}}
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    await wait_until(lambda: server.started)
+    log_broadcaster.attach(logger)
+    base_url = f"http://127.0.0.1:{port}/api/stream_honfigurator_log"
+    headers = {"Authorization": "Bearer harness"}
+
+    results = []
+    async with aiohttp.ClientSession() as session:
+        # two clients, one all records and one errors only, with records logged on the loop and on a thread
+        all_events, error_events, sent_times = [], [], {}
+        all_response = await session.get(base_url, headers=headers)
+        error_response = await session.get(base_url, headers=headers, params={"level": "ERROR"})
+        readers = [asyncio.create_task(read_events(all_response, all_events, sent_times)), asyncio.create_task(read_events(error_response, error_events, sent_times))]
+        await wait_until(lambda: len(log_broadcaster.subscribers) == 2)
+        all_events.clear()
+
+        def log_records(source, count):
+            for number in range(count):
+                message = f"{source} record {number}"
+                sent_times[message] = time.perf_counter()
+                (logger.error if number % 10 == 0 else logger.info)(message)
+        log_records("loop", args.records)
+        await asyncio.to_thread(log_records, "thread", args.records)
+        # the API server logs requests too, so only this harness's records are compared
+        records = lambda events: [data['line'].rsplit(' - ', 1)[-1] for _, data in events if " record " in data['line']]
+        received = await wait_until(lambda: len(records(all_events)) >= args.records * 2 and len(records(error_events)) >= args.records // 5)
+        expected_lines = [f"{source} record {number}" for source in ("loop", "thread") for number in range(args.records)]
+        burst_delays = sorted(data['delay'] for _, data in all_events if 'delay' in data)
+        # records logged one at a time, for the delay of each on its own
+        all_events.clear()
+        for number in range(20):
+            log_records(f"paced {number}", 1)
+            await wait_until(lambda: len(all_events) > number)
+        delays = sorted(data['delay'] for _, data in all_events)
+        results.append(report("Clients receive new records as they're logged", received and records(all_events) == [f"paced {number} record 0" for number in range(20)]
+            and records(error_events)[:args.records // 5] == [line for line in expected_lines if int(line.rsplit(' ', 1)[1]) % 10 == 0],
+            f"{args.records * 2} records to the unfiltered client, {args.records // 5} errors to the filtered one",
+            f"Delay from logging to receiving: median {delays[len(delays) // 2] * 1000:.2f} ms for single records, {burst_delays[-1] * 1000:.1f} ms at most in a burst of {args.records * 2}"))
+
+        # authorisation and disconnection
+        overrides = dict(api_server.app.dependency_overrides)
+        api_server.app.dependency_overrides.clear()
+        async with session.get(base_url) as unauthorised:
+            status = unauthorised.status
+        api_server.app.dependency_overrides.update(overrides)
+        all_response.close()
+        error_response.close()
+        unsubscribed = await wait_until(lambda: not log_broadcaster.subscribers)
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        results.append(report("Unauthorised requests refused, disconnected clients unsubscribed", status == 401 and unsubscribed,
+            f"Without a token: HTTP {status}, subscribers after disconnecting: {len(log_broadcaster.subscribers)}"))
+
+    # a subscriber which stops reading
+    subscriber = log_broadcaster.subscribe(max_buffer=10)
+    for number in range(500):
+        logger.info(f"slow record {number}")
+    await asyncio.sleep(0)
+    buffered = subscriber.queue.qsize()
+    entry, dropped = await subscriber.get()
+    rest = [(await subscriber.get())[0] for _ in range(subscriber.queue.qsize())]
+    log_broadcaster.unsubscribe(subscriber)
+    results.append(report("Slow subscribers drop their oldest records", buffered == 10 and dropped == 490 and entry['line'].endswith("slow record 490") and rest[-1]['line'].endswith("slow record 499"),
+        f"{buffered} records buffered of 500 logged, told {dropped} were dropped"))
+
+    # the cost of logging a record
+    logger.removeHandler(log_broadcaster)
+    start = time.perf_counter()
+    for number in range(10000):
+        logger.debug(f"timing record {number}")
+    without_handler = (time.perf_counter() - start) / 10000
+    logger.addHandler(log_broadcaster)
+    start = time.perf_counter()
+    for number in range(10000):
+        logger.debug(f"timing record {number}")
+    no_subscribers = (time.perf_counter() - start) / 10000
+    subscriber = log_broadcaster.subscribe()
+    start = time.perf_counter()
+    for number in range(10000):
+        logger.debug(f"timing record {number}")
+    one_subscriber = (time.perf_counter() - start) / 10000
+    log_broadcaster.unsubscribe(subscriber)
+    results.append(report("Cost of logging a record", True,
+        f"Without the handler: {without_handler * 1e6:.1f} us, no subscribers: {no_subscribers * 1e6:.1f} us, one subscriber: {one_subscriber * 1e6:.1f} us"))
+
+    server.should_exit = True
+    await server_task
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream the log from the API server to local clients")
+    parser.add_argument("--records", type=int, default=200, help="Records logged from the event loop, and as many from a thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, the setup and the modules using them need a home directory and the shared instances
+        os.makedirs(Path(home) / "logs")
+        os.makedirs(Path(home) / "cogs" / "db")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+        from cogs.misc.setup import SetupEnvironment
+        set_setup(SetupEnvironment(Path(home) / "config" / "config.json"))
+        if not asyncio.run(main(args)):
+            sys.exit(1)
@@ -0,0 +1,214 @@
+"""
+Test harness for master server requests (cogs/connectors/masterserver_connector.py), against a local aiohttp stand-in master server.
+
+Scenarios:
+    - Repeated requests reuse one pooled connection, compared with the previous implementation which opened a session per request.
+    - Requests answered with 503, or dropped before a response, are retried according to the endpoint's policy.
+    - A request slower than the endpoint's timeout raises once its retries are used up.
+    - A retried replay upload sends the whole file again. Uploads and stats submissions aren't retried once they may have reached
+      the server (a 503, a dropped connection or a timeout), only when the connection was refused, and no file is left open.
+    - Latency histograms are recorded for each endpoint, as returned by /api/get_master_server_stats.
+Usage: python utilities/benchmarks/master_server_session_harness.py [--requests 200]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+import aiohttp
+from aiohttp import web
+from cogs.misc.logger import set_home, set_misc, get_home
+
+class StandInMasterServer:
+    """
+        Answers server_requester.php, stats_requester.php, patcher.php and replay uploads, failing the next requests as set by fail_next,
+        and recording the client port of each request and the file of each upload.
+    """
+    def __init__(self):
+        self.client_ports = set()
+        self.requests = 0
+        self.uploads = []
+        self.fail_next = []     # per request: a status to return, 'drop' to close the connection, or a delay in seconds
+        self.port = None
+
+    async def handle(self, request):
+        self.requests += 1
+        self.client_ports.add(request.transport.get_extra_info('peername')[1])
+        await request.read()
+        return await self.respond(request)
+
+    async def handle_upload(self, request):
+        self.requests += 1
+        reader = await request.multipart()
+        part = await reader.next()
+        self.uploads.append(await part.read())
+        return await self.respond(request)
+
+    async def respond(self, request):
+        if self.fail_next:
+            failure = self.fail_next.pop(0)
+            if failure == 'drop':
+                request.transport.close()
+                raise ConnectionResetError()
+            elif isinstance(failure, float):
+                await asyncio.sleep(failure)
+            else:
+                return web.Response(status=failure)
+        return web.Response(text='a:1:{s:7:"version";s:8:"4.10.9.0";}')
+
+    async def start(self):
+        app = web.Application()
+        app.add_routes([web.post('/server_requester.php', self.handle), web.post('/stats_requester.php', self.handle),
+            web.post('/patcher/patcher.php', self.handle), web.post('/upload', self.handle_upload)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        self.site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await self.site.start()
+        self.port = self.site._server.sockets[0].getsockname()[1]
+
+    async def stop_listening(self):
+        """ Connections are refused until listen() is called. """
+        await self.site.stop()
+
+    async def listen(self, delay=0):
+        await asyncio.sleep(delay)
+        self.site = web.TCPSite(self.runner, '127.0.0.1', self.port)
+        await self.site.start()
+
+async def legacy_compare_upstream_patch(handler):
+    """ The previous implementation of compare_upstream_patch, which opened a session (and connection) per request. """
+    url = f"{handler.patch_url}/patcher/patcher.php"
+    data = {"latest": "", "os": f"{handler.architecture}", "arch": handler.arch_platform}
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+        async with session.post(url, headers=handler.headers, data=data) as response:
+            return await response.text(), response.status
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+async def main(args):
+    from cogs.handlers.events import EventBus
+    from cogs.connectors import masterserver_connector
+    from cogs.connectors.masterserver_connector import MasterServerHandler, MasterServerStats
+
+    server = StandInMasterServer()
+    await server.start()
+    address = f"127.0.0.1:{server.port}"
+    stats = MasterServerStats()
+    handler = MasterServerHandler(master_server=address, patch_server=address, event_bus=EventBus(), stats=stats)
+    results = []
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        await legacy_compare_upstream_patch(handler)
+    legacy_seconds = time.perf_counter() - start
+    legacy_connections = len(server.client_ports)
+
+    server.client_ports.clear()
+    start = time.perf_counter()
+    responses = [await handler.compare_upstream_patch() for _ in range(args.requests)]
+    pooled_seconds = time.perf_counter() - start
+    results.append(report("Pooled session reuses its connection", len(server.client_ports) == 1 and all(response[1] == 200 for response in responses),
+        f"Session per request: {args.requests} requests over {legacy_connections} connections, {legacy_seconds / args.requests * 1000:.2f} ms per request",
+        f"Pooled session: {args.requests} requests over {len(server.client_ports)} connections, {pooled_seconds / args.requests * 1000:.2f} ms per request"))
+
+    server.fail_next = [503, 'drop']
+    before = server.requests
+    response = await handler.send_replay_auth("harness:", "password")
+    results.append(report("503 and dropped connection are retried", response[1] == 200 and server.requests - before == 3 and stats.get('replay_auth').retries == 2,
+        f"Status {response[1]} after {server.requests - before} attempts, retries recorded: {stats.get('replay_auth').retries}"))
+
+    server.fail_next = [503, 503, 503]
+    response = await handler.get_spectator_header()
+    results.append(report("Status is returned once retries are used up", response[1] == 503 and not server.fail_next,
+        f"Status {response[1]}, unanswered failures left: {len(server.fail_next)}"))
+
+    policy = masterserver_connector.ENDPOINT_POLICIES['compare_upstream_patch']
+    masterserver_connector.ENDPOINT_POLICIES['compare_upstream_patch'] = {'timeout': 0.2, 'retries': 1, 'backoff': 0.05, 'idempotent': True}
+    server.fail_next = [0.5, 0.5]
+    try:
+        await handler.compare_upstream_patch()
+        timed_out = False
+    except asyncio.TimeoutError:
+        timed_out = True
+    masterserver_connector.ENDPOINT_POLICIES['compare_upstream_patch'] = policy
+    results.append(report("Request slower than the timeout raises after its retry", timed_out and stats.get('compare_upstream_patch').errors == 2,
+        f"Raised TimeoutError: {timed_out}, errors recorded: {stats.get('compare_upstream_patch').errors}"))
+
+    # replay uploads and stats submissions, with short delays between attempts
+    policies = {endpoint: dict(policy) for endpoint, policy in masterserver_connector.ENDPOINT_POLICIES.items()}
+    for endpoint in ('replay_upload', 'sm_upload_request', 'resubmit_stats'):
+        masterserver_connector.ENDPOINT_POLICIES[endpoint] = {**policies[endpoint], 'backoff': 0.2}
+    replay_path = Path(get_home()) / "M1.honreplay"
+    replay = random.Random(1).randbytes(1024 * 1024)
+    replay_path.write_bytes(replay)
+    upload_url = f"{address}/upload"
+
+    masterserver_connector.ENDPOINT_POLICIES['replay_upload']['idempotent'] = True
+    server.fail_next = [503]
+    server.uploads.clear()
+    response = await handler.upload_replay_file(replay_path, replay_path.name, upload_url)
+    masterserver_connector.ENDPOINT_POLICIES['replay_upload']['idempotent'] = False
+    results.append(report("A retried replay upload sends the whole file again", response[1] == 200 and server.uploads == [replay, replay],
+        f"Status {response[1]} after {len(server.uploads)} attempts, each with the whole file: {all(upload == replay for upload in server.uploads)}"))
+
+    sent_once = {}
+    server.fail_next = [503]
+    server.uploads.clear()
+    response = await handler.upload_replay_file(replay_path, replay_path.name, upload_url)
+    sent_once['replay upload answered 503'] = response[1] == 503 and len(server.uploads) == 1
+    for endpoint, failure, send in (('sm_upload_request', 'drop', lambda: handler.get_replay_upload_info(1, "honreplay", "harness", len(replay))),
+                                    ('resubmit_stats', 0.5, lambda: handler.request('resubmit_stats', f"http://{address}/stats_requester.php", data=b"f=resubmit_stats"))):
+        masterserver_connector.ENDPOINT_POLICIES[endpoint]['timeout'] = 0.2
+        server.fail_next = [failure]
+        before = server.requests
+        try:
+            await send()
+            raised = False
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            raised = True
+        sent_once[f"{endpoint} {'dropped' if failure == 'drop' else 'timed out'}"] = raised and server.requests - before == 1
+    results.append(report("Uploads and submissions aren't sent twice", all(sent_once.values()),
+        *(f"{case}: sent once: {passed}" for case, passed in sent_once.items())))
+
+    server.uploads.clear()
+    await handler.close_session()   # pooled connections would otherwise still reach the server
+    await server.stop_listening()
+    listening = asyncio.create_task(server.listen(delay=0.1))
+    response = await handler.upload_replay_file(replay_path, replay_path.name, upload_url)
+    await listening
+    open_replays = [fd for fd in os.listdir("/proc/self/fd") if os.path.realpath(f"/proc/self/fd/{fd}") == str(replay_path.resolve())] if os.path.isdir("/proc/self/fd") else []
+    results.append(report("A refused upload is retried, and no file is left open", response[1] == 200 and server.uploads == [replay] and not open_replays,
+        f"Status {response[1]} with {len(server.uploads)} upload received, replay files still open: {len(open_replays)}"))
+    masterserver_connector.ENDPOINT_POLICIES.update(policies)
+
+    summary = stats.to_dict()
+    histogram_total = sum(summary['compare_upstream_patch']['histogram_ms'].values())
+    results.append(report("Latency histogram counts every attempt", histogram_total == summary['compare_upstream_patch']['requests'] == args.requests + 2,
+        json.dumps(summary['compare_upstream_patch'])))
+
+    await handler.close_session()
+    await server.runner.cleanup()
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run master server requests against a local stand-in master server")
+    parser.add_argument("--requests", type=int, default=200, help="Number of requests for the connection reuse comparison")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, and the modules using it, need a home directory and the shared Misc instance
+        os.makedirs(Path(home) / "logs")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+        if not asyncio.run(main(args)):
+            sys.exit(1)
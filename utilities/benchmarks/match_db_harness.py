@@ -0,0 +1,160 @@
+"""
+Test harness for the match database (cogs/db/match_db_connector.py), on --matches generated match logs.
+
+Scenarios:
+    - Indexed matches give the same chat and players as parsing their logs. The time per /api/get_chat_logs answer is compared
+      between the database and parsing the whole log.
+    - Searching players by the start of their name, across every match, gives the same matches as checking each match, and uses the name index.
+    - index_if_finished leaves logs still being written to the log parser, indexes finished logs once, indexes a log again if it grew,
+      and still answers for a match once its log is deleted.
+    - The backfill indexes only finished logs which aren't indexed, up to its limit.
+Usage: python utilities/benchmarks/match_db_harness.py [--matches 500] [--lines 20000]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+from cogs.misc.logger import set_home, set_misc
+
+NAMES = ["Moonwalker", "moonlight", "Pebbles", "Glacius_Fan", "Thunder", "thunderbird", "Zephyr", "Scout%Main", "Arachna", "Pyro"]
+
+def write_match_log(log_path, match_id, lines, rng):
+    players = rng.sample(range(len(NAMES)), 10)
+    text = [
+        'INFO_DATE date:"2026/10/18" time:"12:00:00"',
+        f'INFO_MATCH name:"Match {match_id}"',
+        'INFO_MAP name:"caldavar" version:"0.0.0"',
+        'INFO_SETTINGS mode:"Mode_Normal" options:""',
+    ]
+    for slot, name_index in enumerate(players):
+        text.append(f'PLAYER_CONNECT player:{slot} name:"{NAMES[name_index]}{name_index}" id:{1000 + name_index} psr:{1500 + name_index}.000')
+    for number in range(lines):
+        if number % 9 == 0:
+            text.append(f'PLAYER_CHAT player:{number % 10} target:"all" msg:"gl hf {number}"')
+        else:
+            text.append(f'GAME_EVENT time:{number} x:{number % 100}')
+    log_path.write_bytes(b'\xff\xfe' + ''.join(f"{line}\r\n" for line in text).encode('utf-16-le'))
+    return {f"{NAMES[name_index]}{name_index}" for name_index in players}
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+async def main(args):
+    from cogs.db.match_db_connector import MatchDatabase, FINISHED_LOG_AGE
+    from cogs.game.match_parser import MatchLogFollower
+    rng = random.Random(1)
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        logs_directory = Path(root) / "logs"
+        os.makedirs(logs_directory)
+        database = MatchDatabase(str(Path(root) / "matches.db"))
+
+        rosters = {}
+        for match_id in range(1, args.matches + 1):
+            log_path = logs_directory / f"M{match_id}.log"
+            rosters[str(match_id)] = write_match_log(log_path, match_id, args.lines, rng)
+            age(log_path, FINISHED_LOG_AGE * 2)
+
+        # index everything, then compare with parsing the logs
+        start = time.perf_counter()
+        indexed = database.backfill_logs(sorted(logs_directory.glob("M*.log")), limit=args.matches)
+        index_seconds = (time.perf_counter() - start) / args.matches
+        sample = [str(match_id) for match_id in rng.sample(range(1, args.matches + 1), min(20, args.matches))]
+        parse_seconds, query_seconds, same = [], [], True
+        for match_id in sample:
+            start = time.perf_counter()
+            follower = MatchLogFollower(logs_directory / f"M{match_id}.log")
+            follower.update()
+            parsed = follower.get_chat()
+            parse_seconds.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            stored = database.get_chat(f"M{match_id}")
+            query_seconds.append(time.perf_counter() - start)
+            same = same and stored == parsed
+        results.append(report("Indexed matches give the parsed chat and players", indexed == args.matches and same,
+            f"{indexed} matches indexed, {index_seconds * 1000:.1f} ms each",
+            f"Chat for a match: {sum(query_seconds) / len(query_seconds) * 1000:.2f} ms from the database, {sum(parse_seconds) / len(parse_seconds) * 1000:.1f} ms parsing the log"))
+
+        # player search across every match
+        passed = True
+        search_seconds = []
+        for prefix in ("moon", "THUNDER", "Scout%", "glacius_", "nobody"):
+            start = time.perf_counter()
+            found = database.find_player_matches(name=prefix, limit=args.matches * 10)
+            search_seconds.append(time.perf_counter() - start)
+            expected = {(match_id, name) for match_id, names in rosters.items() for name in names if name.lower().startswith(prefix.lower())}
+            passed = passed and {(row['match_id'], row['name']) for row in found} == expected
+        by_account = database.find_player_matches(account_id=1002, limit=args.matches * 10)
+        passed = passed and {row['match_id'] for row in by_account} == {match_id for match_id, names in rosters.items() if f"{NAMES[2]}2" in names}
+        with database.get_conn() as conn:
+            plan = ' '.join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM players WHERE name LIKE ? ESCAPE '\\'", ("moon%",)))
+        results.append(report("Player search across matches", passed and "players_name" in plan,
+            f"{len(search_seconds)} name searches across {args.matches} matches: {sum(search_seconds) / len(search_seconds) * 1000:.2f} ms each",
+            f"Query plan: {plan}"))
+
+        # index_if_finished
+        live_log = logs_directory / "M900001.log"
+        write_match_log(live_log, 900001, 100, rng)
+        recent = database.index_if_finished("M900001", live_log)
+        age(live_log, FINISHED_LOG_AGE * 2)
+        active = database.index_if_finished("M900001", live_log, active_match_ids={"900001"})
+        finished = database.index_if_finished("M900001", live_log)
+        indexed_at = database.get_match("900001")['indexed_at']
+        again = database.index_if_finished("900001", live_log)
+        unchanged = database.get_match("900001")['indexed_at'] == indexed_at
+        with open(live_log, 'ab') as log:
+            log.write('PLAYER_CHAT player:0 target:"all" msg:"late message"\r\n'.encode('utf-16-le'))
+        age(live_log, FINISHED_LOG_AGE * 2)
+        grown = database.index_if_finished("900001", live_log) and database.get_chat("900001")[0]['0'][-1] == ('all', 'late message')
+        live_log.unlink()
+        deleted = database.index_if_finished("900001", live_log) and bool(database.get_chat("900001")[1])
+        missing = database.index_if_finished("900002", logs_directory / "M900002.log")
+        results.append(report("Only finished logs are indexed, once", not recent and not active and finished and again and unchanged and grown and deleted and not missing,
+            f"Recently written: {recent}, being played: {active}, finished: {finished}, asked again without parsing: {again and unchanged}, grown log indexed again: {grown}, log deleted: {deleted}, never seen: {missing}"))
+
+        # backfill
+        new_logs = []
+        for match_id in range(950000, 950010):
+            log_path = logs_directory / f"M{match_id}.log"
+            write_match_log(log_path, match_id, 100, rng)
+            age(log_path, FINISHED_LOG_AGE * 2)
+            new_logs.append(log_path)
+        write_match_log(logs_directory / "M950010.log", 950010, 100, rng)
+        all_logs = sorted(logs_directory.glob("*.log"))
+        first = database.backfill_logs(all_logs, limit=6)
+        start = time.perf_counter()
+        second = database.backfill_logs(all_logs, active_match_ids={"950009"}, limit=6)
+        backfill_seconds = time.perf_counter() - start
+        third = database.backfill_logs(all_logs, limit=6)
+        results.append(report("Backfill indexes new finished logs only", (first, second, third) == (6, 3, 1) and not database.get_match("950010"),
+            f"Runs indexed {first}, {second} (one match being played) and {third} logs, the log still being written wasn't indexed",
+            f"A run over {len(all_logs)} logs, most already indexed: {backfill_seconds * 1000:.1f} ms"))
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the match database against generated match logs")
+    parser.add_argument("--matches", type=int, default=500, help="Number of match logs")
+    parser.add_argument("--lines", type=int, default=20000, help="Lines in each match log")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, and the modules using it, need a home directory and the shared Misc instance
+        os.makedirs(Path(home) / "logs")
+        os.makedirs(Path(home) / "cogs" / "db")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+        if not asyncio.run(main(args)):
+            sys.exit(1)
@@ -0,0 +1,132 @@
+"""
+Test harness for the match log follower (MatchLogFollower in cogs/game/match_parser.py), on generated match logs.
+
+Scenarios:
+    - A UTF-16 LE log (with BOM) and a UTF-8 log give the same lobby info, roster and chat as the previous whole file parsing.
+    - While a match log grows, each update only reads the appended bytes, including writes which end part way through a character
+      or line. The time per update is compared with re-reading the whole log, as /api/get_chat_logs did on every call.
+    - A log replaced by a smaller one is read again from the start.
+Usage: python utilities/benchmarks/match_log_follower_harness.py [--lines 200000] [--appends 50]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import re
+import tempfile
+import time
+from pathlib import Path
+from cogs.misc.logger import set_home, set_misc
+
+HEADER = [
+    'INFO_DATE date:"2026/10/18" time:"12:00:00"',
+    'INFO_MATCH name:"Harness Match"',
+    'INFO_MAP name:"caldavar" version:"0.0.0"',
+    'INFO_SETTINGS mode:"Mode_Normal" options:""',
+]
+
+def match_lines(start, count):
+    lines = []
+    for number in range(start, start + count):
+        player = number % 10
+        if number % 50 == 0:
+            player = number // 50 % 10
+            lines.append(f'PLAYER_CONNECT player:{player} name:"Plâyer{player}" id:{1000 + player} psr:{1500 + player}.000')
+        elif number % 7 == 0:
+            lines.append(f'PLAYER_CHAT player:{player} target:"team" msg:"message {number} ✓"')
+        else:
+            lines.append(f'GAME_EVENT time:{number} x:{number % 100} y:{number % 77}')
+    return lines
+
+def legacy_parse(log_path, encoding):
+    """ The previous MatchParser.parse_chat and find_game_info_post_launch, reading the whole log. """
+    chat_pattern = re.compile(r'PLAYER_CHAT player:(\d+) target:"(\w+)" msg:"(.*?)"')
+    player_pattern = re.compile(r'PLAYER_CONNECT player:(\d+) name:"(.*?)" id:(\d+) psr:(\d+\.\d+)')
+    chat_messages, player_details = {}, {}
+    with open(log_path, 'r', encoding=encoding) as file:
+        text = file.read()
+    for line in text.split('\n'):
+        if match := player_pattern.search(line):
+            player_id, player_name, player_id_num, psr = match.groups()
+            player_details[player_id] = {'name': player_name, 'id': player_id_num, 'psr': float(psr)}
+        if match := chat_pattern.search(line):
+            player_id, target, message = match.groups()
+            chat_messages.setdefault(player_id, []).append((target, message))
+    lobby = {
+        'map': re.search(r'INFO_MAP name:"([^"]+)"', text).group(1).lower(),
+        'name': re.search(r'INFO_MATCH name:"([^"]+)"', text).group(1).lower(),
+        'mode': re.search(r'INFO_SETTINGS mode:"([^"]+)"', text).group(1).replace('Mode_', '').lower()
+    }
+    return lobby, chat_messages, player_details
+
+def encode(lines, encoding):
+    return ''.join(f"{line}\r\n" for line in lines).encode(encoding)
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+async def main(args):
+    from cogs.game.match_parser import MatchLogFollower, MatchParser
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        for encoding, bom in (('utf-16-le', b'\xff\xfe'), ('utf-8', b'')):
+            log_path = Path(root) / f"M1{len(bom)}.log"
+            log_path.write_bytes(bom + encode(HEADER + match_lines(0, args.lines), encoding))
+            follower = MatchLogFollower(log_path)
+            await follower.refresh()
+            chat, roster = follower.get_chat()
+            lobby, legacy_chat, legacy_roster = legacy_parse(log_path, 'utf-16' if bom else encoding)
+            results.append(report(f"Whole {encoding} log matches the previous parser", follower.get_lobby_info() == lobby and chat == legacy_chat and roster == legacy_roster,
+                f"{log_path.stat().st_size / 1024 / 1024:.1f} MiB, lobby: {follower.get_lobby_info()}, {sum(len(messages) for messages in chat.values())} chat messages, {len(roster)} players"))
+
+        # a growing log, written in pieces which split characters and lines
+        log_path = Path(root) / "M2.log"
+        log_path.write_bytes(b'\xff\xfe' + encode(HEADER + match_lines(0, args.lines), 'utf-16-le'))
+        parser = MatchParser('M2', log_path)
+        parser.parse_chat()
+        next_line = args.lines
+        update_seconds, legacy_seconds, consistent = [], [], True
+        for _ in range(args.appends):
+            data = encode(match_lines(next_line, 200), 'utf-16-le')
+            next_line += 200
+            split = len(data) // 2 + 1      # an odd offset, part way through a UTF-16 code unit
+            for piece in (data[:split], data[split:]):
+                with open(log_path, 'ab') as log:
+                    log.write(piece)
+                start = time.perf_counter()
+                chat, roster = parser.parse_chat()
+                update_seconds.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            _, legacy_chat, legacy_roster = legacy_parse(log_path, 'utf-16')
+            legacy_seconds.append(time.perf_counter() - start)
+            consistent = consistent and chat == legacy_chat and roster == legacy_roster
+        results.append(report("Appended data is parsed incrementally", consistent,
+            f"{args.appends * 2} appends to a {log_path.stat().st_size / 1024 / 1024:.1f} MiB log",
+            f"Incremental update: {sum(update_seconds) / len(update_seconds) * 1000:.2f} ms, whole log parse: {sum(legacy_seconds) / len(legacy_seconds) * 1000:.1f} ms"))
+
+        # replaced by a new, smaller log
+        log_path.write_bytes(b'\xff\xfe' + encode(HEADER + match_lines(0, 100), 'utf-16-le'))
+        chat, roster = parser.parse_chat()
+        _, legacy_chat, legacy_roster = legacy_parse(log_path, 'utf-16')
+        results.append(report("Replaced log is read again", chat == legacy_chat and roster == legacy_roster,
+            f"{sum(len(messages) for messages in chat.values())} chat messages after the log was replaced"))
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the match log follower against generated match logs")
+    parser.add_argument("--lines", type=int, default=200000, help="Lines in the log before it's appended to")
+    parser.add_argument("--appends", type=int, default=50, help="Number of times 200 lines are appended")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, and the modules using it, need a home directory and the shared Misc instance
+        os.makedirs(Path(home) / "logs")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+        if not asyncio.run(main(args)):
+            sys.exit(1)
@@ -0,0 +1,79 @@
+"""
+Verification harness for the delta encoded MQTT game state (cogs/handlers/mqtt_delta.py).
+
+Replays the status packet stream from game_state_benchmark.py into a GameState, encodes the state after every packet as
+the game server would publish it, round trips each message through JSON, and reconstructs it with StatusDeltaDecoder.
+As on a game server, every packet is published to game_server/status, and some also to game_server/match and game_server/lag.
+Each topic has its own encoder, and a subscriber of its own with a decoder, which must see no gaps from the other topics' messages.
+The reconstructed state is checked against the full state after every message, and against every snapshot.
+A message is dropped every --drop-every messages, to check that the decoder waits for the next snapshot after a gap.
+Usage: python utilities/benchmarks/mqtt_delta_harness.py [--rounds 5] [--snapshot-every 25] [--drop-every 0]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import json
+from cogs.game.game_state import GameState
+from cogs.handlers.mqtt_delta import StatusDeltaEncoder, StatusDeltaDecoder
+from utilities.benchmarks.game_state_benchmark import LOCAL_CONFIG, build_stream, decode_stream
+
+def main():
+    parser = argparse.ArgumentParser(description="Check delta encoded game state reconstruction against full snapshots")
+    parser.add_argument("--rounds", type=int, default=5, help="Number of times to replay the stream")
+    parser.add_argument("--snapshot-every", type=int, default=25, help="Force a snapshot every N messages (stands in for the snapshot interval)")
+    parser.add_argument("--drop-every", type=int, default=0, help="Drop every Nth message before it reaches the decoder (0 to disable)")
+    args = parser.parse_args()
+
+    updates = decode_stream(build_stream())
+    state = GameState(1, LOCAL_CONFIG)
+    state.clear()
+    topics = {"game_server/status": 1, "game_server/match": 3, "game_server/lag": 5}
+    encoders = {topic: StatusDeltaEncoder(snapshot_interval=float('inf')) for topic in topics}
+    decoders = {topic: StatusDeltaDecoder() for topic in topics}
+
+    full_bytes = 0
+    encoded_bytes = 0
+    packets = 0
+    messages = 0
+    mismatches = 0
+    unknown = 0
+    for _ in range(args.rounds):
+        for i in range(0, len(updates), 3):
+            # one status packet is a header update, a player update and a lobby info update
+            for update in updates[i:i + 3]:
+                state.update(update)
+            packets += 1
+            expected = json.loads(json.dumps(state._state))
+            for topic, every in topics.items():
+                if packets % every:
+                    continue
+                messages += 1
+                full_bytes += len(json.dumps({"event_type": "heartbeat", **state._state}))
+                encoder = encoders[topic]
+                message = json.dumps({"event_type": "heartbeat", **encoder.encode(state._state, force_snapshot=encoder.seq % args.snapshot_every == 0)})
+                encoded_bytes += len(message)
+
+                if args.drop_every and messages % args.drop_every == 0:
+                    continue
+
+                message = json.loads(message)
+                reconstructed = decoders[topic].apply(message)
+                if reconstructed is None:
+                    unknown += 1
+                    continue
+                if reconstructed != expected:
+                    mismatches += 1
+                    print(f"Mismatch on {topic} at seq {message['seq']} ({message['encoding']})\n\tExpected: {expected}\n\tReconstructed: {reconstructed}")
+
+    gaps = sum(decoder.gaps for decoder in decoders.values())
+    print(f"{messages} messages on {len(topics)} topics, {args.rounds} rounds, snapshot every {args.snapshot_every} messages per topic")
+    print(f"\tFull state:    {full_bytes} bytes")
+    print(f"\tDelta encoded: {encoded_bytes} bytes ({encoded_bytes / full_bytes:.1%})")
+    print(f"\tGaps detected: {gaps}, messages waiting for a snapshot: {unknown}")
+    print(f"\tMismatches:    {mismatches}")
+    if mismatches or (not args.drop_every and (gaps or unknown)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
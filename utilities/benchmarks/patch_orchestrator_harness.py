@@ -0,0 +1,169 @@
+"""
+Test harness for the patch orchestrator (cogs/game/patch_orchestrator.py), against a local HTTP stand-in for the gitea version and launcher URLs.
+
+The stand-in serves a version.cfg and a launcher.zip containing a fake patcher script. When run, the script writes a fake
+hon-x86_64-server binary with the expected version string at the offset get_svr_version() reads. Each scenario runs in a
+temporary install directory with a fake manager that has no game servers. While the orchestrator runs, the event loop lag
+is sampled, to check that downloading and patching don't block the loop.
+Linux only, as the fake patcher is a shell script.
+Usage: python utilities/benchmarks/patch_orchestrator_harness.py [--patch-seconds 2]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import io
+import tempfile
+import zipfile
+from pathlib import Path
+from aiohttp import web
+from cogs.misc.logger import set_home, set_misc, get_misc
+
+LINUX_VERSION_OFFSET = 0x148b8
+VERSION = "4.10.9.0"
+LAG_SAMPLE_INTERVAL = 0.01
+
+def build_patcher_script(patch_seconds):
+    return f"""#!/bin/sh
+cd "$(dirname "$0")"
+sleep {patch_seconds}
+python3 - <<'EOF'
+with open('hon-x86_64-server', 'wb') as f:
+    f.write(b'\\x00' * {LINUX_VERSION_OFFSET} + b'{VERSION}'.ljust(36, b'\\x00'))
+EOF
+""".encode()
+
+def build_launcher_zip(script):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        info = zipfile.ZipInfo('launcher')
+        info.external_attr = 0o755 << 16
+        zip_file.writestr(info, script)
+    return buffer.getvalue()
+
+def build_empty_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w'):
+        pass
+    return buffer.getvalue()
+
+class FakeManager:
+    def __init__(self, install_directory):
+        self.game_servers = {}
+        self.patching = False
+        self.latest_available_game_version = VERSION
+        self.global_config = {'hon_data': {
+            'hon_install_directory': install_directory,
+            'hon_executable_name': 'hon-x86_64-server-harness-not-running',
+            'hon_executable_path': install_directory / 'hon-x86_64-server'
+        }}
+
+    async def cmd_message_servers(self, game_servers, message):
+        pass
+
+    async def cmd_shutdown_server(self, game_server):
+        pass
+
+    async def start_game_servers(self, game_servers):
+        pass
+
+async def sample_loop_lag(samples):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LAG_SAMPLE_INTERVAL
+        await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+        samples.append(max(loop.time() - expected, 0))
+
+async def run_scenario(name, orchestrator, expected_result, expected_phases, timeout=30):
+    lag_samples = []
+    lag_task = asyncio.create_task(sample_loop_lag(lag_samples))
+    result = await orchestrator.run(timeout=timeout, source='startup')
+    lag_task.cancel()
+
+    phases = [entry['phase'] for entry in orchestrator.progress.history]
+    passed = result == expected_result and phases == expected_phases
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    print(f"\tResult: {result}, phases: {' -> '.join(phases)}")
+    print(f"\tDownloaded: {orchestrator.progress.downloaded_bytes} bytes, max loop lag: {max(lag_samples, default=0) * 1000:.1f} ms")
+    if not passed:
+        print(f"\tExpected result {expected_result}, phases {' -> '.join(expected_phases)}")
+    return passed
+
+async def main(args):
+    from cogs.game.patch_orchestrator import PatchOrchestrator, PatchProgress
+    misc = get_misc()
+
+    script = build_patcher_script(args.patch_seconds)
+    launcher_zip = build_launcher_zip(script)
+    with tempfile.NamedTemporaryFile(delete=False) as script_file:
+        script_file.write(script)
+    launcher_crc = misc.calculate_crc32(script_file.name).upper()
+    os.unlink(script_file.name)
+
+    routes = web.RouteTableDef()
+    @routes.get('/version.cfg')
+    async def version_cfg(request):
+        return web.Response(text=f"{VERSION};{VERSION}.honpatch;B30B80D1;launcher.zip;{launcher_crc}")
+    @routes.get('/launcher.zip')
+    async def launcher(request):
+        return web.Response(body=launcher_zip)
+    @routes.get('/corrupt.zip')
+    async def corrupt_launcher(request):
+        return web.Response(body=launcher_zip[:len(launcher_zip) // 2])
+    @routes.get('/empty.zip')
+    async def empty_launcher(request):
+        return web.Response(body=build_empty_zip())
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    results = []
+    with tempfile.TemporaryDirectory() as install_directory:
+        manager = FakeManager(Path(install_directory))
+        orchestrator = PatchOrchestrator(manager, version_url=f"{base_url}/version.cfg", launcher_url=f"{base_url}/launcher.zip", progress=PatchProgress())
+        results.append(await run_scenario("Download, install and run the launcher", orchestrator, True,
+            ['shutting_down', 'checking_version', 'downloading', 'extracting', 'patching', 'verifying', 'complete']))
+        results.append(await run_scenario("Launcher CRC matches, so it isn't downloaded again", orchestrator, True,
+            ['shutting_down', 'checking_version', 'patching', 'verifying', 'complete']))
+        manager.latest_available_game_version = "4.10.10.0"
+        results.append(await run_scenario("Version after patching doesn't match", orchestrator, False,
+            ['shutting_down', 'checking_version', 'patching', 'verifying', 'failed']))
+        manager.latest_available_game_version = VERSION
+        results.append(await run_scenario("Patcher exceeds the timeout", orchestrator, False,
+            ['shutting_down', 'checking_version', 'patching', 'failed'], timeout=args.patch_seconds / 2))
+
+    with tempfile.TemporaryDirectory() as install_directory:
+        orchestrator = PatchOrchestrator(FakeManager(Path(install_directory)), version_url=f"{base_url}/missing.cfg", launcher_url=f"{base_url}/launcher.zip", progress=PatchProgress())
+        results.append(await run_scenario("Version file unavailable", orchestrator, False, ['shutting_down', 'checking_version', 'failed']))
+
+    with tempfile.TemporaryDirectory() as install_directory:
+        orchestrator = PatchOrchestrator(FakeManager(Path(install_directory)), version_url=f"{base_url}/version.cfg", launcher_url=f"{base_url}/missing.zip", progress=PatchProgress())
+        results.append(await run_scenario("Launcher download fails", orchestrator, False, ['shutting_down', 'checking_version', 'downloading', 'failed']))
+
+    for name in ("corrupt", "empty"):
+        with tempfile.TemporaryDirectory() as install_directory:
+            orchestrator = PatchOrchestrator(FakeManager(Path(install_directory)), version_url=f"{base_url}/version.cfg", launcher_url=f"{base_url}/{name}.zip", progress=PatchProgress())
+            results.append(await run_scenario(f"Launcher zip is {name}, so the patcher isn't run", orchestrator, False,
+                ['shutting_down', 'checking_version', 'downloading', 'extracting', 'failed']))
+
+    await runner.cleanup()
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the patch orchestrator against a local stand-in for the patch server")
+    parser.add_argument("--patch-seconds", type=float, default=2, help="How long the fake patcher runs for")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, and the modules using it, need a home directory and the shared Misc instance
+        os.makedirs(Path(home) / "logs")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+        if not asyncio.run(main(args)):
+            sys.exit(1)
@@ -0,0 +1,146 @@
+"""
+Test harness for the process exit watcher (cogs/handlers/process_supervisor.py), with real child processes.
+
+Each scenario runs once with pidfds, and once with the polling scheduler job used where pidfds aren't available:
+    - Children which exit by themselves with different codes, and children killed with SIGKILL and SIGTERM, are all detected,
+      with the return code when the Popen object was given and None otherwise. The time from the kill to the callback is measured.
+    - A process with several callbacks, one a coroutine function, calls each of them once.
+    - unwatch() of one callback keeps the others, unwatch() of the process calls none of them, and the pidfd or poll job is released.
+    - A process which already exited is reported straight away.
+Usage: python utilities/benchmarks/process_supervisor_harness.py [--children 50] [--poll-interval 0.1]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import signal
+import statistics
+import subprocess
+import time
+from cogs.handlers.events import stop_event
+from cogs.handlers.process_supervisor import ProcessSupervisor
+from cogs.handlers.scheduler import scheduler
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+async def wait_until(condition, timeout=10):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+def spawn(exit_code=0, sleep=60):
+    return subprocess.Popen([sys.executable, "-c", f"import sys, time; time.sleep({sleep}); sys.exit({exit_code})"])
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+
+async def run_scenarios(supervisor, args):
+    mode = "pidfd" if supervisor.use_pidfd else "polling"
+    results = []
+    fds_before = open_fds()
+
+    # exits and kills, with and without the Popen object
+    exits = {}
+    def on_exit(pid, returncode):
+        exits[pid] = (returncode, time.perf_counter())
+    children = []
+    for number in range(args.children):
+        kind = ("exit", "kill", "terminate", "adopted")[number % 4]
+        popen = spawn(exit_code=number % 7, sleep=0.3) if kind == "exit" else spawn()
+        supervisor.watch(popen.pid, on_exit, popen=None if kind == "adopted" else popen)
+        children.append((kind, popen))
+    await asyncio.sleep(0.5)
+    kill_times = {}
+    for kind, popen in children:
+        if kind in ("kill", "adopted"):
+            kill_times[popen.pid] = time.perf_counter()
+            popen.send_signal(signal.SIGKILL)
+        elif kind == "terminate":
+            kill_times[popen.pid] = time.perf_counter()
+            popen.send_signal(signal.SIGTERM)
+    detected = await wait_until(lambda: len(exits) == len(children))
+    expected = {"exit": lambda number: number % 7, "kill": lambda _: -signal.SIGKILL, "terminate": lambda _: -signal.SIGTERM, "adopted": lambda _: None}
+    codes_right = all(exits.get(popen.pid, (object(),))[0] == expected[kind](number) for number, (kind, popen) in enumerate(children))
+    for kind, popen in children:
+        if kind == "adopted":
+            popen.wait()
+    delays = sorted(exits[pid][1] - killed for pid, killed in kill_times.items() if pid in exits)
+    results.append(report(f"{mode}: exits detected with their return codes", detected and codes_right and not supervisor._watches,
+        f"{len(exits)} of {len(children)} exits detected, return codes right: {codes_right}",
+        f"Kill to callback: median {statistics.median(delays) * 1000:.1f} ms, max {delays[-1] * 1000:.1f} ms" if delays else "No kills detected"))
+
+    # several callbacks for one process, one of them a coroutine function
+    calls = []
+    async def on_exit_async(pid, returncode):
+        await asyncio.sleep(0)
+        calls.append(("async", returncode))
+    popen = spawn()
+    supervisor.watch(popen.pid, lambda pid, returncode: calls.append(("first", returncode)), popen=popen)
+    supervisor.watch(popen.pid, on_exit_async)
+    popen.kill()
+    all_called = await wait_until(lambda: len(calls) == 2)
+    await asyncio.sleep(0.2)
+    results.append(report(f"{mode}: every callback called once", all_called and sorted(calls) == [("async", -signal.SIGKILL), ("first", -signal.SIGKILL)],
+        f"Calls: {sorted(calls)}"))
+
+    # unwatch one callback, then a whole process
+    calls = []
+    kept, removed, unwatched = spawn(), spawn(), spawn()
+    keep_callback = lambda pid, returncode: calls.append(("kept", pid))
+    remove_callback = lambda pid, returncode: calls.append(("removed", pid))
+    supervisor.watch(kept.pid, keep_callback, popen=kept)
+    supervisor.watch(kept.pid, remove_callback)
+    supervisor.unwatch(kept.pid, remove_callback)
+    supervisor.watch(unwatched.pid, remove_callback, popen=unwatched)
+    supervisor.unwatch(unwatched.pid)
+    released = not supervisor.is_watched(unwatched.pid) and (supervisor.use_pidfd or supervisor.poll_job_name in scheduler.jobs)
+    for popen in (kept, removed, unwatched):
+        popen.kill()
+    await wait_until(lambda: calls)
+    await asyncio.sleep(max(supervisor.poll_interval * 3, 0.3))
+    removed.wait()
+    unwatched.wait()
+    job_removed = supervisor.poll_job_name not in scheduler.jobs
+    results.append(report(f"{mode}: unwatched callbacks aren't called", released and calls == [("kept", kept.pid)] and job_removed and not supervisor._watches,
+        f"Calls: {len(calls)}, only the kept callback: {calls == [('kept', kept.pid)]}, poll job removed once nothing is polled: {job_removed}"))
+
+    # a process which had already exited and been reaped
+    calls = []
+    popen = spawn(sleep=0)
+    popen.wait()
+    supervisor.watch(popen.pid, lambda pid, returncode: calls.append(returncode))
+    reported = await wait_until(lambda: calls, timeout=2)
+    fds_after = open_fds()
+    results.append(report(f"{mode}: already exited processes reported", reported and calls == [None] and fds_before == fds_after,
+        f"Calls: {calls}, open file descriptors before {fds_before} and after {fds_after}"))
+    return results
+
+async def main(args):
+    scheduler_task = asyncio.create_task(scheduler.run())
+    results = []
+    for use_pidfd in (True, False):
+        supervisor = ProcessSupervisor(poll_interval=args.poll_interval, name=f"harness_{'pidfd' if use_pidfd else 'polling'}", use_pidfd=use_pidfd)
+        if use_pidfd and not supervisor.use_pidfd:
+            print("SKIP pidfd: os.pidfd_open isn't available here")
+            continue
+        results += await run_scenarios(supervisor, args)
+        results.append(report(f"{'pidfd' if use_pidfd else 'polling'}: watch counters", True, f"{supervisor.stats}"))
+    stop_event.set()
+    await scheduler_task
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch real child processes exit through the process supervisor")
+    parser.add_argument("--children", type=int, default=50, help="Children spawned for the exit and kill scenario")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Seconds between polls when pidfds aren't used")
+    args = parser.parse_args()
+    if not asyncio.run(main(args)):
+        sys.exit(1)
@@ -0,0 +1,149 @@
+"""
+Test harness for replay uploads (cogs/handlers/replay_uploader.py and MasterServerHandler.upload_replay_file), against a local
+aiohttp stand-in for the master server upload request and the upload target.
+
+Several accounts request the replays of a few matches at once. The harness checks that each replay is uploaded exactly once, that
+every account receives the final UPLOAD_COMPLETE status, and that no more than --max-concurrent uploads run at the same time.
+Peak memory allocated by Python during the uploads is measured with tracemalloc, and compared with the previous implementation,
+which read each replay into memory before uploading it.
+Usage: python utilities/benchmarks/replay_upload_harness.py [--replay-mb 20] [--matches 4] [--requests-per-match 3] [--max-concurrent 2]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import tempfile
+import tracemalloc
+from pathlib import Path
+import aiohttp
+import aiofiles
+import phpserialize
+from aiohttp import web
+from cogs.misc.logger import set_home, set_misc
+
+class UploadReceiver:
+    """ Stand-in for the master server's sm_upload_request, and the upload target it hands out. """
+    def __init__(self, chunk_delay):
+        self.chunk_delay = chunk_delay
+        self.received = {}
+        self.active = 0
+        self.max_active = 0
+        self.port = None
+
+    async def upload_request(self, request):
+        data = await request.post()
+        return web.Response(text=phpserialize.dumps({'TargetURL': f"127.0.0.1:{self.port}/upload/{data['match_id']}"}).decode('utf-8'))
+
+    async def upload(self, request):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            reader = await request.multipart()
+            field = await reader.next()
+            size = 0
+            while chunk := await field.read_chunk(2**16):
+                size += len(chunk)
+                await asyncio.sleep(self.chunk_delay)
+            self.received.setdefault(field.filename, []).append(size)
+            return web.Response(status=204)
+        finally:
+            self.active -= 1
+
+    async def start(self):
+        app = web.Application(client_max_size=0)
+        app.add_routes([web.post('/server_requester.php', self.upload_request), web.post('/upload/{match_id}', self.upload)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+async def legacy_upload_replay_file(file_path, file_name, url):
+    """ The previous implementation of MasterServerHandler.upload_replay_file, which read the whole replay into memory. """
+    async with aiohttp.ClientSession() as session:
+        async with aiofiles.open(file_path, 'rb') as replay_file:
+            file_data = await replay_file.read()
+        data = aiohttp.FormData(quote_fields=False)
+        data.add_field('file', file_data, filename=file_name, content_type='application/octet-stream')
+        async with session.post(f"http://{url}", data=data) as response:
+            return await response.text(), response.status
+
+async def run(args, replays_directory, legacy):
+    from cogs.handlers.events import EventBus, ReplayStatus
+    from cogs.connectors.masterserver_connector import MasterServerHandler
+    from cogs.handlers.replay_uploader import ReplayUploader
+
+    receiver = UploadReceiver(args.chunk_delay)
+    await receiver.start()
+    master_server_handler = MasterServerHandler(master_server=f"127.0.0.1:{receiver.port}", event_bus=EventBus())
+    if legacy:
+        master_server_handler.upload_replay_file = legacy_upload_replay_file
+
+    async def find_replay_file(replay_file_name):
+        path = replays_directory / replay_file_name
+        return (True, path) if path.exists() else (False, None)
+
+    statuses = {}
+    async def send_status_update(match_id, account_id, status):
+        statuses.setdefault((match_id, account_id), []).append(status)
+
+    uploader = ReplayUploader({'hon_data': {'svr_login': 'harness'}}, master_server_handler, find_replay_file, send_status_update, max_concurrent_uploads=args.max_concurrent)
+
+    tracemalloc.start()
+    requests = []
+    for request_number in range(args.requests_per_match):
+        for match_id in range(1, args.matches + 1):
+            requests.append(asyncio.create_task(uploader.handle_replay_request(match_id, 'honreplay', match_id * 1000 + request_number)))
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*requests)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    await master_server_handler.close_session()
+    await receiver.runner.cleanup()
+
+    uploads_per_match = {name: len(sizes) for name, sizes in receiver.received.items()}
+    complete = sum(1 for updates in statuses.values() if updates[-1] == ReplayStatus.UPLOAD_COMPLETE)
+    passed = (
+        len(uploads_per_match) == args.matches and all(count == 1 for count in uploads_per_match.values())
+        and all(size == args.replay_mb * 1024 * 1024 for sizes in receiver.received.values() for size in sizes)
+        and complete == args.matches * args.requests_per_match
+        and receiver.max_active <= args.max_concurrent
+    )
+    print(f"{'PASS' if passed else 'FAIL'} {'legacy' if legacy else 'streaming'}: {args.matches} matches, {args.requests_per_match} requests each, {args.replay_mb} MiB replays")
+    print(f"\tUploads per replay: {uploads_per_match}")
+    print(f"\tAccounts notified of completion: {complete}/{args.matches * args.requests_per_match}, coalesced requests: {uploader.stats['coalesced']}")
+    print(f"\tMost concurrent uploads: {receiver.max_active} (limit {args.max_concurrent})")
+    print(f"\tPeak Python memory during uploads: {peak / 1024 / 1024:.1f} MiB")
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload replays to a local stand-in receiver, checking coalescing, concurrency and memory use")
+    parser.add_argument("--replay-mb", type=int, default=20, help="Size of each replay in MiB")
+    parser.add_argument("--matches", type=int, default=4, help="Number of different replays requested")
+    parser.add_argument("--requests-per-match", type=int, default=3, help="Number of accounts requesting each replay")
+    parser.add_argument("--max-concurrent", type=int, default=2, help="Concurrent upload limit")
+    parser.add_argument("--chunk-delay", type=float, default=0.001, help="Seconds the receiver waits per 64 KiB chunk, to simulate a slow link")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, and the modules using it, need a home directory and the shared Misc instance
+        os.makedirs(Path(home) / "logs")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+
+        replays_directory = Path(home) / "replays"
+        os.makedirs(replays_directory)
+        for match_id in range(1, args.matches + 1):
+            with open(replays_directory / f"M{match_id}.honreplay", 'wb') as replay:
+                replay.write(os.urandom(args.replay_mb * 1024 * 1024))
+
+        results = [asyncio.run(run(args, replays_directory, legacy=True)), asyncio.run(run(args, replays_directory, legacy=False))]
+        # the legacy upload is only run to compare memory use
+        if not results[1]:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
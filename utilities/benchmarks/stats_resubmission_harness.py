@@ -0,0 +1,244 @@
+"""
+Test harness for the match stats resubmission pipeline (cogs/handlers/stats_resubmitter.py).
+
+Each scenario runs the pipeline on a temporary logs directory, with a stand-in for the manager's resubmit_match_stats_to_masterserver
+which takes --latency seconds per submission, and fails or rejects the files it's told to.
+Scenarios:
+    - A backlog of stats files present at startup drains concurrently, compared with submitting them one after another as before.
+    - A stats file written while running is found through file notifications.
+    - Failed files are retried with backoff, rejected files and files exceeding max_attempts are moved to the dead letter folder,
+      and unreachable master server errors aren't counted as attempts.
+    - Pending files and their attempt counts survive a restart.
+    - The stats payload sent by MasterServerHandler.send_stats_file, against a local aiohttp stand-in master server.
+    - Through MasterServerHandler.send_stats_file, a file which can't be decoded is moved to the dead letter folder on its first attempt,
+      resubmitting before the server is authenticated counts as a failed attempt, and a refused connection isn't counted.
+Usage: python utilities/benchmarks/stats_resubmission_harness.py [--backlog 100] [--latency 0.05]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import socket
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qs
+from aiohttp import web
+from cogs.misc.logger import set_home, set_misc
+
+STATS_CONTENT = "match_stats[player][0][hero]=Hero_Pyromancer&match_stats[player][0][kills]=5"
+
+class StandInResubmit:
+    """ Stands in for GameServerManager.resubmit_match_stats_to_masterserver. """
+    def __init__(self, latency):
+        self.latency = latency
+        self.submitted = []
+        self.failures = {}      # match id: list of outcomes for the next attempts, 'fail', 'reject' or 'unreachable'
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, match_id, file_path):
+        from cogs.misc.exceptions import HoNServerConnectionError, HoNStatsRejectedError
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+            outcomes = self.failures.get(match_id)
+            outcome = outcomes.pop(0) if outcomes else None
+            if outcome == 'fail':
+                return False
+            elif outcome == 'reject':
+                raise HoNStatsRejectedError("[400] One or more validation errors occurred.")
+            elif outcome == 'unreachable':
+                raise HoNServerConnectionError("No response from the master server")
+            self.submitted.append(match_id)
+            return True
+        finally:
+            self.active -= 1
+
+def write_stats(logs_directory, match_id):
+    with open(logs_directory / f"M{match_id}.stats", 'w') as stats_file:
+        stats_file.write(STATS_CONTENT)
+
+def create_resubmitter(logs_directory, resubmit, **kwargs):
+    from cogs.handlers.stats_resubmitter import StatsResubmitter
+    options = {'max_concurrent': 4, 'min_interval': 0.005, 'max_attempts': 3, 'base_backoff': 0.1, 'max_backoff': 1, 'settle_delay': 0.1} | kwargs
+    return StatsResubmitter(logs_directory, resubmit, logs_directory.parent / "stats_resubmission.json", **options)
+
+async def wait_until(condition, timeout):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+def new_logs_directory(root, name):
+    logs_directory = Path(root) / name / "logs"
+    os.makedirs(logs_directory)
+    return logs_directory
+
+async def backlog_scenario(root, args):
+    logs_directory = new_logs_directory(root, "backlog")
+    for match_id in range(args.backlog):
+        write_stats(logs_directory, match_id)
+
+    resubmit = StandInResubmit(args.latency)
+    start = time.perf_counter()
+    for match_id in range(args.backlog):
+        await resubmit(str(match_id), logs_directory / f"M{match_id}.stats")
+    serial_seconds = time.perf_counter() - start
+
+    resubmit = StandInResubmit(args.latency)
+    resubmitter = create_resubmitter(logs_directory, resubmit)
+    start = time.perf_counter()
+    task = asyncio.create_task(resubmitter.run())
+    drained = await wait_until(lambda: len(resubmit.submitted) == args.backlog, 60)
+    pipeline_seconds = time.perf_counter() - start
+    remaining = [name for name in os.listdir(logs_directory) if name.endswith('.stats')]
+
+    write_stats(logs_directory, args.backlog)
+    discovered = await wait_until(lambda: len(resubmit.submitted) == args.backlog + 1, 5)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return [
+        report("Backlog drains concurrently", drained and not remaining and resubmit.max_active <= 4,
+            f"{args.backlog} files, one after another: {serial_seconds:.2f}s, pipeline: {pipeline_seconds:.2f}s (includes {resubmitter.settle_delay}s settle delay)",
+            f"Most concurrent submissions: {resubmit.max_active}, stats files left: {len(remaining)}"),
+        report("File written while running is found by notification", discovered and resubmit.submitted[-1] == str(args.backlog),
+            f"Submitted: {resubmit.submitted[-1]}")
+    ]
+
+async def failure_scenario(root, args):
+    logs_directory = new_logs_directory(root, "failures")
+    resubmit = StandInResubmit(0)
+    resubmit.failures = {'1': ['fail', 'fail'], '2': ['reject'], '3': ['fail', 'fail', 'fail'], '4': ['unreachable'] * 4}
+    for match_id in range(1, 5):
+        write_stats(logs_directory, match_id)
+    resubmitter = create_resubmitter(logs_directory, resubmit)
+    task = asyncio.create_task(resubmitter.run())
+    settled = await wait_until(lambda: resubmitter.stats['submitted'] + resubmitter.stats['dead_lettered'] == 4, 10)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    dead_letters = sorted(os.listdir(logs_directory / "failed_stats")) if os.path.exists(logs_directory / "failed_stats") else []
+    return [report("Retries, backoff and dead letters", settled and sorted(resubmit.submitted) == ['1', '4'] and dead_letters == ['M2.stats', 'M3.stats'],
+        f"Submitted: {sorted(resubmit.submitted)}, dead lettered: {dead_letters}, pipeline stats: {resubmitter.stats}")]
+
+async def restart_scenario(root, args):
+    logs_directory = new_logs_directory(root, "restart")
+    resubmit = StandInResubmit(0)
+    resubmit.failures = {'7': ['fail']}
+    write_stats(logs_directory, 7)
+    resubmitter = create_resubmitter(logs_directory, resubmit, base_backoff=30, max_backoff=30)
+    task = asyncio.create_task(resubmitter.run())
+    await wait_until(lambda: resubmitter.pending.get('M7.stats', {}).get('attempts') == 1, 5)
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    # the restarted pipeline keeps the attempt count, and submits the file once its backoff has passed
+    resubmitter = create_resubmitter(logs_directory, resubmit)
+    resubmitter.load_state()
+    restored = resubmitter.pending.get('M7.stats', {}).get('attempts')
+    resubmitter.state_path.write_text(resubmitter.state_path.read_text().replace(str(int(resubmitter.pending['M7.stats']['next_attempt'])), str(int(time.time()))))
+    task = asyncio.create_task(resubmitter.run())
+    submitted = await wait_until(lambda: resubmit.submitted == ['7'], 5)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return [report("Pending files survive a restart", restored == 1 and submitted, f"Attempts after restart: {restored}, submitted after restart: {submitted}")]
+
+async def payload_scenario(root, args):
+    from cogs.handlers.events import EventBus
+    from cogs.connectors.masterserver_connector import MasterServerHandler
+    received = {}
+    async def stats_requester(request):
+        received['body'] = await request.read()
+        received['content_length'] = request.headers.get('Content-Length')
+        return web.Response(text='a:1:{s:5:"match";s:2:"42";}')
+    app = web.Application()
+    app.add_routes([web.post('/stats_requester.php', stats_requester)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+
+    logs_directory = new_logs_directory(root, "payload")
+    write_stats(logs_directory, 42)
+    handler = MasterServerHandler(master_server=f"127.0.0.1:{site._server.sockets[0].getsockname()[1]}", event_bus=EventBus())
+    handler.set_server_id(5)
+    handler.set_cookie("cookie")
+    response = await handler.send_stats_file("harness:", "hash", "42", logs_directory / "M42.stats")
+    await handler.close_session()
+    await runner.cleanup()
+
+    fields = parse_qs(received.get('body', b'').decode())
+    passed = (response[1] == 200 and fields.get('f') == ['resubmit_stats'] and fields.get('resubmission_key') == ['42_honfigurator']
+        and fields.get('match_stats[player][0][kills]') == ['5'] and received['content_length'] == str(len(received['body'])))
+    return [report("Stats payload sent to the master server", passed, f"Received: {received.get('body')}")]
+
+async def local_errors_scenario(root, args):
+    from cogs.handlers.events import EventBus
+    from cogs.connectors.masterserver_connector import MasterServerHandler
+    logs_directory = new_logs_directory(root, "local_errors")
+    write_stats(logs_directory, 50)
+    with open(logs_directory / "M51.stats", 'w', encoding='utf-8') as stats_file:
+        stats_file.write(STATS_CONTENT.replace("Pyromancer", "Pyromancér"))
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        closed_port = sock.getsockname()[1]
+    authenticated = MasterServerHandler(master_server=f"127.0.0.1:{closed_port}", event_bus=EventBus())
+    authenticated.set_server_id(5)
+    authenticated.set_cookie("cookie")
+    unauthenticated = MasterServerHandler(master_server=f"127.0.0.1:{closed_port}", event_bus=EventBus())
+    refused = []
+
+    async def resubmit(match_id, file_path):
+        # M52 is sent to a master server which refuses connections, M50 before authenticating
+        handler = unauthenticated if match_id == '50' else authenticated
+        if match_id == '52':
+            refused.append(match_id)
+        return (await handler.send_stats_file("harness:", "hash", match_id, file_path))[1] == 200
+
+    write_stats(logs_directory, 52)
+    resubmitter = create_resubmitter(logs_directory, resubmit, base_backoff=0.05, max_backoff=0.05)
+    task = asyncio.create_task(resubmitter.run())
+    settled = await wait_until(lambda: resubmitter.stats['dead_lettered'] == 2 and len(refused) >= 3, 10)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await authenticated.close_session()
+    await unauthenticated.close_session()
+    dead_letters = sorted(os.listdir(logs_directory / "failed_stats")) if os.path.exists(logs_directory / "failed_stats") else []
+    refused_attempts = resubmitter.pending.get('M52.stats', {}).get('attempts')
+    return [report("Local errors are counted, undecodable files dead lettered", settled and dead_letters == ['M50.stats', 'M51.stats'] and refused_attempts == 0,
+        f"Dead lettered: {dead_letters}, refused connections: {len(refused)} with {refused_attempts} attempts counted, pipeline stats: {resubmitter.stats}")]
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as root:
+        results = await backlog_scenario(root, args)
+        results += await failure_scenario(root, args)
+        results += await restart_scenario(root, args)
+        results += await payload_scenario(root, args)
+        results += await local_errors_scenario(root, args)
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the stats resubmission pipeline against temporary logs directories")
+    parser.add_argument("--backlog", type=int, default=100, help="Number of stats files waiting at startup")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds each submission takes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, and the modules using it, need a home directory and the shared Misc instance
+        os.makedirs(Path(home) / "logs")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+        if not asyncio.run(main(args)):
+            sys.exit(1)
@@ -0,0 +1,261 @@
+"""
+Throughput test for the instance status feed (/api/stream_instances_status, cogs/handlers/status_feed.py), with --servers game servers
+whose state changes as status packets would change it, and --subscribers clients following the feed.
+
+Most subscribers are simulated in process, reading from the feed directly. --http-clients of them stream it from the API server on a
+local port instead. Every client applies the snapshot and diffs it receives. Clients, and /api/get_instances_status, must end up with
+what get_pretty_status_for_webui() renders from scratch, including uptime written by the status packet fast path and the match duration
+written by the match timer, which change the state in place.
+
+Reported:
+    - Statuses rendered, against the renders of every client polling /api/get_instances_status every --poll-interval seconds.
+    - Messages and bytes sent, and the event loop lag (how late a 10 ms timer fires) while the feed runs.
+    - A slow client which lets its buffer fill is sent a new snapshot, and still ends up with the right statuses.
+The Discord token lookup is replaced with a fixed user, who is given the default roles, so no Discord account is needed.
+Usage: python utilities/benchmarks/status_feed_harness.py [--servers 40] [--subscribers 500] [--http-clients 100] [--duration 10] [--rate 1]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import asyncio
+import json
+import random
+import socket
+import statistics
+import tempfile
+import time
+from pathlib import Path
+import aiohttp
+import uvicorn
+from cogs.misc.logger import set_home, set_misc, set_setup
+from cogs.TCP.packet_parser import STATUS_FIXED_LEN, STATUS_HEADER
+
+def report(name, passed, *details):
+    print(f"{'PASS' if passed else 'FAIL'} {name}")
+    for detail in details:
+        print(f"\t{detail}")
+    return passed
+
+async def wait_until(condition, timeout=10):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+DECODED = {}
+
+def decode(message):
+    """ The event type and data of a message, decoded once per message, as the clients would each do on their own machines. """
+    if message not in DECODED:
+        event_type, data = None, None
+        for line in message.split('\n'):
+            if line.startswith('event: '):
+                event_type = line[len('event: '):]
+            elif line.startswith('data: '):
+                data = json.loads(line[len('data: '):])
+        DECODED[message] = (event_type, data)
+    return DECODED[message]
+
+class Client:
+    """ Keeps the statuses a client would show, from the snapshots and diffs it's sent. """
+    def __init__(self):
+        self.statuses = {}
+        self.messages = 0
+        self.snapshots = 0
+        self.bytes = 0
+
+    def apply(self, message):
+        self.messages += 1
+        self.bytes += len(message)
+        event_type, data = decode(message)
+        if event_type == 'snapshot':
+            self.snapshots += 1
+            self.statuses = {name: dict(status) for name, status in data.items()}
+        elif event_type == 'diff':
+            for name, changes in data.items():
+                if changes is None:
+                    self.statuses.pop(name, None)
+                else:
+                    self.statuses.setdefault(name, {}).update(changes)
+
+async def follow_in_process(feed, client, subscriber):
+    client.apply(feed.snapshot_message())
+    while True:
+        client.apply(await feed.next_message(subscriber))
+
+async def follow_over_http(session, url, client):
+    async with session.get(url, headers={"Authorization": "Bearer harness"}) as response:
+        message = []
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').rstrip('\n')
+            if line:
+                message.append(line)
+            elif message:
+                if not message[0].startswith(':'):
+                    client.apply('\n'.join(message))
+                message = []
+
+async def sample_lag(samples, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - start - 0.01)
+
+def status_packet(uptime, num_clients, server_load, in_match):
+    """ A 0x42 status packet without players. """
+    packet = bytearray(STATUS_FIXED_LEN)
+    STATUS_HEADER.pack_into(packet, 0, 0x42, 2 if in_match else 1, uptime, server_load, num_clients, 1 if in_match else 0)
+    packet[40] = 6 if in_match else 1
+    return bytes(packet)
+
+async def drive_servers(servers, duration, rate):
+    """
+    Status packets through the packet parser: uptime changes every packet, clients and CPU use every few packets, so most packets
+    take the parser's uptime only fast path. Every third server is in a match, whose duration the match timer keeps.
+    """
+    rng = random.Random(1)
+    started = time.perf_counter()
+    packets = 0
+    while time.perf_counter() - started < duration:
+        for game_server in servers:
+            uptime = int((time.perf_counter() - started) * 1000) + game_server.id * 1000
+            if packets % 4 == 0:
+                game_server.harness_load = (rng.randint(0, 10), rng.randint(0, 10000))
+            num_clients, server_load = getattr(game_server, 'harness_load', (0, 0))
+            await game_server.game_manager_parser.server_status(status_packet(uptime, num_clients, server_load, game_server.id % 3 == 0), game_server=game_server)
+            packets += 1
+        # a shutdown scheduled and cancelled, which isn't part of the game state
+        servers[0].schedule_shutdown() if int(time.perf_counter() - started) % 2 == 0 else servers[0].unschedule_shutdown()
+        await asyncio.sleep(1 / rate)
+    return packets
+
+def rendered_statuses(servers):
+    """ The statuses rendered from scratch, as a client receives them in JSON. """
+    return json.loads(json.dumps({game_server.config.get_local_by_key('svr_name'): game_server.get_pretty_status_for_webui() for game_server in servers}))
+
+async def main(args):
+    from cogs.misc.logger import get_setup
+    from cogs.game.game_server import GameServer
+    from cogs.handlers.events import EventBus
+    from cogs.handlers.status_feed import instance_status_feed as feed
+    import cogs.connectors.api_server as api_server
+
+    global_config = get_setup().get_default_hon_configuration()
+    global_config['hon_data'].update({'hon_executable_name': 'hon_x64', 'svr_ip': '127.0.0.1', 'architecture': 'x86_64',
+        'hon_logs_directory': Path(api_server.HOME_PATH) / "logs", 'svr_name': 'harness', 'svr_location': 'EU'})
+    servers = [GameServer(server_id, 10000 + server_id, global_config, lambda *_: None, EventBus()) for server_id in range(1, args.servers + 1)]
+    for game_server in servers:
+        feed.add_server(game_server)
+    api_server.game_servers = {game_server.port: game_server for game_server in servers}
+
+    # the cost of one render of every server, as each poll of /api/get_instances_status used to do
+    start = time.perf_counter()
+    for _ in range(20):
+        for game_server in servers:
+            game_server.get_pretty_status_for_webui()
+    render_all_seconds = (time.perf_counter() - start) / 20
+
+    api_server.roles_database.add_default_data(discord_id="1")
+    api_server.app.dependency_overrides[api_server.verify_token] = lambda: {"token": "harness", "user_info": {"id": "1"}}
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api_server.app, host="127.0.0.1", port=port, log_level="warning", limit_concurrency=args.http_clients + 50))
+    server_task = asyncio.create_task(server.serve())
+    await wait_until(lambda: server.started)
+
+    results = []
+    feed.max_subscribers = args.subscribers + 10
+    in_process = [Client() for _ in range(args.subscribers - args.http_clients)]
+    http_clients = [Client() for _ in range(args.http_clients)]
+    tasks = [asyncio.create_task(follow_in_process(feed, client, feed.subscribe())) for client in in_process]
+    connector = aiohttp.TCPConnector(limit=0)
+    session = aiohttp.ClientSession(connector=connector)
+    tasks += [asyncio.create_task(follow_over_http(session, f"http://127.0.0.1:{port}/api/stream_instances_status", client)) for client in http_clients]
+    connected = await wait_until(lambda: all(client.snapshots for client in in_process + http_clients))
+
+    # the match timer changes the match duration in place, as it does for a real match
+    match_timers = []
+    for game_server in servers:
+        if game_server.id % 3 == 0:
+            game_server.game_state['match_info']['start_time'] = time.time() - game_server.id * 60
+            match_timers.append(asyncio.create_task(game_server.match_timer()))
+
+    renders_before = feed.stats['renders']
+    lag_samples, stop = [], asyncio.Event()
+    lag_task = asyncio.create_task(sample_lag(lag_samples, stop))
+    process_start = time.process_time()
+    packets = await drive_servers(servers, args.duration, args.rate)
+    cpu_seconds = time.process_time() - process_start
+    stop.set()
+    await lag_task
+    renders = feed.stats['renders'] - renders_before
+    for task in match_timers:
+        task.cancel()
+    await asyncio.gather(*match_timers, return_exceptions=True)
+
+    # after the last flush, every client, and /api/get_instances_status, shows the statuses rendered from scratch
+    await asyncio.sleep(feed.flush_interval * 2)
+    expected = rendered_statuses(servers)
+    async with session.get(f"http://127.0.0.1:{port}/api/get_instances_status", headers={"Authorization": "Bearer harness"}) as response:
+        polled = await response.json()
+    settled = await wait_until(lambda: all(client.statuses == expected for client in in_process + http_clients), timeout=5)
+    stale = sorted(name for name, status in expected.items() if polled.get(name) != status or any(client.statuses.get(name) != status for client in in_process + http_clients))
+    polling_renders = args.subscribers * args.servers * args.duration / args.poll_interval
+    messages = sum(client.messages for client in in_process + http_clients)
+    sent_bytes = sum(client.bytes for client in in_process + http_clients)
+    results.append(report("Every client follows the statuses", connected and settled and polled == expected and len(polled) == args.servers,
+        f"Servers whose status differs from a fresh render: {len(stale)}{' (' + ', '.join(stale[:5]) + ')' if stale else ''}",
+        f"{args.servers} servers, {packets} status updates over {args.duration}s, {args.subscribers} subscribers ({args.http_clients} over HTTP)",
+        f"Statuses rendered: {renders}, against {polling_renders:.0f} polling every {args.poll_interval}s ({render_all_seconds * 1000:.2f} ms for every server, {render_all_seconds * polling_renders / args.servers:.1f}s of CPU)",
+        f"Messages sent: {messages} ({sent_bytes / 1024 / 1024:.1f} MiB), CPU used while running: {cpu_seconds:.2f}s",
+        f"Event loop lag: median {statistics.median(lag_samples) * 1000:.2f} ms, max {max(lag_samples) * 1000:.1f} ms"))
+
+    # a client which stops reading, then reads again
+    slow = Client()
+    slow_subscriber = feed.subscribe(max_buffer=5)
+    slow.apply(feed.snapshot_message())
+    await drive_servers(servers, 4 * feed.flush_interval * 5, 1 / feed.flush_interval)
+    await asyncio.sleep(feed.flush_interval * 2)
+    while not slow_subscriber.queue.empty():
+        slow.apply(await feed.next_message(slow_subscriber))
+    resynced = slow_subscriber.resyncs > 0 and slow.snapshots == 2
+    feed.unsubscribe(slow_subscriber)
+    results.append(report("Slow clients are sent a new snapshot", resynced and slow.statuses == rendered_statuses(servers),
+        f"Buffer overflows: {slow_subscriber.resyncs}, snapshots received: {slow.snapshots}"))
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await session.close()
+    server.should_exit = True
+    await server_task
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow the instance status feed with many clients while game server state changes")
+    parser.add_argument("--servers", type=int, default=40, help="Number of game servers")
+    parser.add_argument("--subscribers", type=int, default=500, help="Number of clients following the feed")
+    parser.add_argument("--http-clients", type=int, default=100, help="How many of the clients stream over HTTP")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of state changes")
+    parser.add_argument("--rate", type=float, default=1, help="Status updates per server per second")
+    parser.add_argument("--poll-interval", type=float, default=1, help="Seconds between polls, for the polling comparison")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Misc, the setup and the modules using them need a home directory and the shared instances
+        os.makedirs(Path(home) / "logs")
+        os.makedirs(Path(home) / "cogs" / "db")
+        set_home(Path(home))
+        from cogs.misc.utilities import Misc
+        set_misc(Misc())
+        from cogs.misc.setup import SetupEnvironment
+        set_setup(SetupEnvironment(Path(home) / "config" / "config.json"))
+        if not asyncio.run(main(args)):
+            sys.exit(1)
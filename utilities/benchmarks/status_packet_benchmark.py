@@ -0,0 +1,93 @@
+"""
+Microbenchmark for decoding the player section of 0x42 server status packets.
+
+Compares the original regex / slice based parser with the struct based decoder in cogs/TCP/packet_parser.py.
+Usage: python utilities/benchmarks/status_packet_benchmark.py [--players 10] [--iterations 20000]
+"""
+import sys, os
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+import argparse
+import re
+import struct
+import timeit
+from cogs.TCP.packet_parser import decode_status_players, STATUS_FIXED_LEN
+
+def build_status_packet(num_players):
+    """
+    Build a 0x42 packet shaped like the ones captured from a live server. 54 fixed bytes, followed by the player records.
+    """
+    header = bytearray(STATUS_FIXED_LEN)
+    header[0] = 0x42
+    header[1] = 3                                       # occupied
+    header[2:6] = (123456789).to_bytes(4, 'little')     # uptime
+    header[6:10] = (2500).to_bytes(4, 'little')         # server load
+    header[10] = num_players
+    header[11] = 1
+    header[40] = 6
+    header[53] = num_players
+    players = bytearray()
+    for i in range(num_players):
+        players += struct.pack('<I', 100000 + i)
+        players += f"203.0.113.{i + 10}".encode() + b'\x00'
+        players += f"[CLAN]Player{i}".encode() + b'\x00'
+        players += b'USE\x00'
+        players += struct.pack('<HHH', 20 + i, 40 + i, 90 + i)
+    return bytes(header + players)
+
+def legacy_parse_players(packet):
+    """ The previous implementation of the player section parser, kept here for comparison. """
+    data = packet[53:]
+    ip_pattern = re.compile(rb'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+    clients = []
+    for idx, ip_match in enumerate(ip_pattern.finditer(data)):
+        cursor, ip_end = ip_match.span()
+        account_id = int.from_bytes(data[cursor-4:cursor], byteorder='little')
+        ip_end = data[cursor:].find(b'\x00') + cursor
+        ip = data[cursor:ip_end].decode('utf-8')
+        cursor = ip_end + 1
+        name_end = data[cursor:].find(b'\x00') + cursor
+        name = data[cursor:name_end].decode('utf-8')
+        cursor = name_end + 1
+        location_end = data[cursor:].find(b'\x00') + cursor
+        location = data[cursor:location_end].decode('utf-8')
+        cursor = location_end + 1
+        minping = int.from_bytes(data[cursor:cursor+2], byteorder='little')
+        avgping = int.from_bytes(data[cursor+2:cursor+4], byteorder='little')
+        maxping = int.from_bytes(data[cursor+4:cursor+6], byteorder='little')
+        clients.append({
+            'account_id': account_id,
+            'name': name,
+            'location': location,
+            'ip': ip,
+            'minping': minping,
+            'avgping': avgping,
+            'maxping': maxping
+        })
+    return clients
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark 0x42 server status player decoding")
+    parser.add_argument("--players", type=int, default=10, help="Number of players in each status packet")
+    parser.add_argument("--iterations", type=int, default=20000, help="Number of packets to decode per implementation")
+    args = parser.parse_args()
+
+    packet = build_status_packet(args.players)
+
+    legacy = legacy_parse_players(packet)
+    decoded = [player._asdict() for player in decode_status_players(packet)]
+    if legacy != decoded:
+        print("Decoders disagree on the sample packet!")
+        print(f"\tLegacy: {legacy}\n\tStruct: {decoded}")
+        sys.exit(1)
+
+    legacy_time = timeit.timeit(lambda: legacy_parse_players(packet), number=args.iterations)
+    struct_time = timeit.timeit(lambda: decode_status_players(packet), number=args.iterations)
+
+    print(f"Packet size: {len(packet)} bytes, {args.players} players, {args.iterations} iterations")
+    print(f"\tLegacy (regex + slices): {legacy_time * 1e6 / args.iterations:.2f} usec/packet")
+    print(f"\tStruct cursor decoder:   {struct_time * 1e6 / args.iterations:.2f} usec/packet")
+    print(f"\tSpeedup: {legacy_time / struct_time:.2f}x")
+
+if __name__ == "__main__":
+    main()